@@ -0,0 +1,155 @@
+"""Защита от флуда: отсев обновлений до того, как они дойдут до обработчиков.
+
+Обработчик регистрируется в группе -1 и проверяет каждое обновление в
+памяти, без обращений к хранилищу: ведро токенов пользователя, общее ведро
+бота, повтор того же сообщения подряд и паузу после подачи заявки.
+Отброшенное обновление останавливает обработку (``ApplicationHandlerStop``),
+ответ пользователю не отправляется — он тоже стоил бы запроса к Bot API.
+Число отброшенных обновлений по причинам видно в метрике
+``bot_updates_dropped_total`` и в :meth:`AdmissionControl.stats`.
+"""
+
+import logging
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Iterable, Optional
+
+from telegram import Update
+from telegram.ext import ApplicationHandlerStop
+
+import metrics
+from notifications import TokenBucket
+
+logger = logging.getLogger(__name__)
+
+# причины отказа в порядке проверки
+DROP_REASONS = ("cooldown", "duplicate", "user", "global")
+
+
+class _UserState:
+    __slots__ = ("bucket", "fingerprint", "seen_at", "submitted_at")
+
+    def __init__(self, bucket: Optional[TokenBucket]) -> None:
+        self.bucket = bucket
+        self.fingerprint: Optional[str] = None
+        self.seen_at = float("-inf")
+        self.submitted_at = float("-inf")
+
+
+def fingerprint(update: Update) -> Optional[str]:
+    """Содержимое обновления для поиска повторов: текст сообщения или данные кнопки."""
+    if update.callback_query is not None:
+        return f"callback:{update.callback_query.data}"
+    message = update.effective_message
+    if message is not None and (message.text or message.caption):
+        return f"text:{message.text or message.caption}"
+    return None
+
+
+def is_start(update: Update) -> bool:
+    message = update.effective_message
+    text = message.text if message is not None else None
+    return bool(text) and text.split()[0].split("@")[0] == "/start"
+
+
+class AdmissionControl:
+    """Лимиты на пользователя и на бота с отсевом повторов.
+
+    ``user_rate``/``global_rate`` — обновлений в секунду, ``*_burst`` —
+    допустимый всплеск; нулевой rate отключает соответствующий лимит.
+    Одинаковые сообщения подряд чаще, чем раз в ``duplicate_window``
+    секунд, отбрасываются; ``/start`` в течение ``submit_cooldown`` секунд
+    после подачи заявки — тоже. Состояние хранится для ``max_users``
+    последних активных пользователей. ``exempt`` (администраторы) не
+    ограничиваются.
+    """
+
+    def __init__(
+        self,
+        *,
+        user_rate: float = 1.0,
+        user_burst: float = 5.0,
+        global_rate: float = 100.0,
+        global_burst: float = 200.0,
+        duplicate_window: float = 5.0,
+        submit_cooldown: float = 60.0,
+        max_users: int = 100000,
+        exempt: Iterable[int] = (),
+        clock: Callable[[], float] = time.monotonic,
+    ) -> None:
+        self.user_rate = user_rate
+        self.user_burst = user_burst
+        self.duplicate_window = duplicate_window
+        self.submit_cooldown = submit_cooldown
+        self.max_users = max(1, max_users)
+        self.exempt = frozenset(exempt)
+        self._clock = clock
+        self._global = TokenBucket(global_rate, global_burst, clock) if global_rate > 0 else None
+        self._users: "OrderedDict[int, _UserState]" = OrderedDict()
+        self.admitted = 0
+        self.dropped: Dict[str, int] = {reason: 0 for reason in DROP_REASONS}
+
+    def _state(self, user_id: int) -> _UserState:
+        state = self._users.get(user_id)
+        if state is None:
+            bucket = (
+                TokenBucket(self.user_rate, self.user_burst, self._clock)
+                if self.user_rate > 0
+                else None
+            )
+            state = self._users[user_id] = _UserState(bucket)
+            if len(self._users) > self.max_users:
+                self._users.popitem(last=False)
+        else:
+            self._users.move_to_end(user_id)
+        return state
+
+    def admit(
+        self, user_id: Optional[int], content: Optional[str] = None, start: bool = False
+    ) -> Optional[str]:
+        """Решение по одному обновлению: None — пропустить, иначе причина отказа."""
+        if user_id in self.exempt:
+            self.admitted += 1
+            return None
+        reason = None
+        if user_id is not None:
+            now = self._clock()
+            state = self._state(user_id)
+            if start and now - state.submitted_at < self.submit_cooldown:
+                reason = "cooldown"
+            elif (
+                content is not None
+                and content == state.fingerprint
+                and now - state.seen_at < self.duplicate_window
+            ):
+                # повтор продлевает окно: пока поток одинаковых сообщений идёт, он отсекается
+                state.seen_at = now
+                reason = "duplicate"
+            elif state.bucket is not None and not state.bucket.try_acquire():
+                reason = "user"
+        if reason is None and self._global is not None and not self._global.try_acquire():
+            reason = "global"
+        if reason is not None:
+            self.dropped[reason] += 1
+            metrics.update_dropped(reason)
+            return reason
+        if user_id is not None:
+            state.fingerprint = content
+            state.seen_at = now
+        self.admitted += 1
+        return None
+
+    def mark_submitted(self, user_id: int) -> None:
+        """Начинает паузу после подачи заявки: повторный /start пока отсекается."""
+        self._state(user_id).submitted_at = self._clock()
+
+    async def check_update(self, update: Update, context: Any) -> None:
+        """Колбэк TypeHandler для группы -1: отброшенное обновление дальше не идёт."""
+        user = update.effective_user
+        reason = self.admit(user.id if user else None, fingerprint(update), is_start(update))
+        if reason is not None:
+            logger.debug("Обновление %s отброшено: %s", update.update_id, reason)
+            raise ApplicationHandlerStop
+
+    def stats(self) -> Dict[str, Any]:
+        return {"admitted": self.admitted, "dropped": dict(self.dropped), "users": len(self._users)}
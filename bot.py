@@ -1,8 +1,12 @@
-import json
+import asyncio
 import logging
-from typing import Dict
+import tempfile
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+from typing import Any, Dict, Optional, Tuple
 
 from telegram import InlineKeyboardButton, InlineKeyboardMarkup, ReplyKeyboardMarkup, Update
+from telegram.constants import MessageLimit
 from telegram.ext import (
     Application,
     CallbackQueryHandler,
@@ -10,12 +14,26 @@ from telegram.ext import (
     ContextTypes,
     ConversationHandler,
     MessageHandler,
+    TypeHandler,
     filters,
 )
-
-from config import settings
-from db import ApplicationRepository
-from yonote_client import create_document
+from telegram.request import BaseRequest
+
+from admission import AdmissionControl
+import config
+from export import (
+    FORMATS as EXPORT_FORMATS,
+    ExportError,
+    export_applications_async,
+    normalize_filters as normalize_export_filters,
+)
+import metrics
+from notifications import NotificationDispatcher
+from outbox import OutboxDigest, OutboxWorker
+from persistence import RepositoryPersistence
+from storage import Cursor, Repository, open_repository, search_terms
+from update_processor import PerUserUpdateProcessor
+from yonote_client import YonoteClient
 
 
 logging.basicConfig(
@@ -26,6 +44,11 @@ logger = logging.getLogger(__name__)
 
 ASKING = 1
 JOB_SELECTION = 2
+HISTORY_LIMIT = 5
+# сколько последних сообщений /admin одного администратора помнят свои фильтры и страницу
+ADMIN_VIEWS_KEPT = 20
+# Бот обрабатывает только сообщения и нажатия inline-кнопок
+ALLOWED_UPDATES = [Update.MESSAGE, Update.CALLBACK_QUERY]
 
 SURVEY = [
     ("full_name", " Как к Вам обращаться? [пример: Star123] (ник, имя, прозвищe)"),
@@ -61,16 +84,24 @@ MAIN_KEYBOARD = ReplyKeyboardMarkup(
     resize_keyboard=True,
 )
 
-repo = ApplicationRepository(settings.database_path)
+# Импорт модуля не трогает ни диск, ни сеть. Хранилище открывает
+# build_application (persistence читает его ещё до post_init), клиент Yonote,
+# outbox-воркер и рассылку создаёт post_init, закрывает всё post_shutdown —
+# и то, что успело создаться, если запуск оборвался на полпути.
+repo: Optional[Repository] = None
+admission: Optional[AdmissionControl] = None
+yonote: Optional[YonoteClient] = None
+outbox_worker: Optional[OutboxWorker] = None
+notifier: Optional[NotificationDispatcher] = None
 
 
 def is_admin(user_id: int) -> bool:
-    return user_id in settings.admin_ids
+    return user_id in config.settings.admin_ids
 
 
 async def start(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
     user = update.effective_user
-    last_application = repo.get_last_for_user(user.id)
+    last_application = await repo.get_last_for_user(user.id)
     if last_application:
         status = last_application["status"]
         if status == "approved":
@@ -89,10 +120,27 @@ async def start(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
     context.user_data["answers"] = {}
     await update.message.reply_text(WELCOME_TEXT, reply_markup=MAIN_KEYBOARD)
     await update.message.reply_text(SURVEY[0][1])
+    metrics.survey_event("started")
     logger.info("Начат опрос пользователем %s", user.id)
     return ASKING
 
 
+async def submit_application(user, chat, answers: Dict[str, str]) -> int:
+    """Сохраняет заявку; документ в Yonote создаст outbox-воркер в фоне."""
+    application_id = await repo.save_application(
+        user_id=user.id,
+        chat_id=chat.id,
+        username=user.username,
+        full_name=answers.get("full_name") or user.full_name,
+        answers=answers,
+    )
+    admission.mark_submitted(user.id)
+    outbox_worker.wake()
+    notifier.mark_deliverable(chat.id)
+    metrics.survey_event("completed")
+    return application_id
+
+
 async def handle_answer(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
     text = update.message.text.strip()
     if text.lower() in ("/cancel", "cancel", "отмена"):
@@ -102,29 +150,13 @@ async def handle_answer(update: Update, context: ContextTypes.DEFAULT_TYPE) -> i
     field, _ = SURVEY[idx]
     answers[field] = text
     context.user_data["answers"] = answers
+    metrics.survey_event("step", field)
     idx += 1
     if idx >= len(SURVEY):
         user = update.effective_user
         chat = update.effective_chat
-        application_id = repo.save_application(
-            user_id=user.id,
-            chat_id=chat.id,
-            username=user.username,
-            full_name=answers.get("full_name") or user.full_name,
-            answers=answers,
-        )
-        # Create document in Yonote upon submission
-        full_name_doc = answers.get("full_name") or user.full_name
-        username = user.username or ""
-        age = answers.get("age", "")
-        job = answers.get("job", "")
-        experience = answers.get("experience", "")
-        portfolio = answers.get("portfolio", "")
-        goals = answers.get("goals", "")
-        title = f"Заявка от {job}а"
-        doc = create_document(full_name_doc, age, job, experience, portfolio, goals, username, title)
-        if doc is not None:
-            repo.mark_synced(application_id)
+        application_id = await submit_application(user, chat, answers)
+        context.user_data.clear()
         await update.message.reply_text(SUCCESS_TEXT)
         logger.info("Сохранена заявка %s от пользователя %s", application_id, user.id)
         return ConversationHandler.END
@@ -150,29 +182,13 @@ async def handle_job_selection(update: Update, context: ContextTypes.DEFAULT_TYP
     field, _ = SURVEY[idx]
     answers[field] = choice
     context.user_data["answers"] = answers
+    metrics.survey_event("step", field)
     idx += 1
     if idx >= len(SURVEY):
         user = query.from_user
         chat = query.message.chat
-        application_id = repo.save_application(
-            user_id=user.id,
-            chat_id=chat.id,
-            username=user.username,
-            full_name=answers.get("full_name") or user.full_name,
-            answers=answers,
-        )
-        # Create document in Yonote upon submission
-        full_name_doc = answers.get("full_name") or user.full_name
-        username = user.username or ""
-        age = answers.get("age", "")
-        job = answers.get("job", "")
-        experience = answers.get("experience", "")
-        portfolio = answers.get("portfolio", "")
-        goals = answers.get("goals", "")
-        title = f"Заявка от {job}а"
-        doc = create_document(full_name_doc, age, job, experience, portfolio, goals, username, title)
-        if doc is not None:
-            repo.mark_synced(application_id)
+        application_id = await submit_application(user, chat, answers)
+        context.user_data.clear()
         await query.edit_message_text(SUCCESS_TEXT)
         logger.info("Сохранена заявка %s от пользователя %s", application_id, user.id)
         return ConversationHandler.END
@@ -186,13 +202,26 @@ async def cancel(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
         "Опрос остановлен. Вы можете начать заново с командой /start.",
         reply_markup=MAIN_KEYBOARD,
     )
+    if "survey_step" in context.user_data:
+        # анкета ещё не отправлена: после отправки user_data очищается
+        metrics.survey_event("cancelled")
     context.user_data.clear()
     return ConversationHandler.END
 
 
+async def survey_timeout(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    """Опрос брошен дольше PERSISTENCE_TTL_HOURS: забываем ответы.
+
+    Тот же срок, что у очистки хранилища, так что в памяти бота брошенный
+    опрос не переживает свою запись в базе.
+    """
+    metrics.survey_event("timeout")
+    context.application.drop_user_data(update.effective_user.id)
+
+
 def format_application(row) -> str:
-    answers = json.loads(row["answers_json"])
-    details = "\n".join(f"{key}: {value}" for key, value in answers.items())
+    # ответы анкеты — отдельные колонки строки, JSON разбирать не нужно
+    details = "\n".join(f"{field}: {row[field]}" for field, _ in SURVEY if row[field] is not None)
     return (
         f"Заявка #{row['id']}\n"
         f"User ID: {row['user_id']}\n"
@@ -202,25 +231,176 @@ def format_application(row) -> str:
     )
 
 
-def format_history(user_id: int, limit: int = 5) -> str:
-    history = repo.list_by_user(user_id)[:limit]
+def format_history(history, statuses: Optional[Dict[int, str]] = None) -> str:
+    """Форматирует историю заявок; ``statuses`` подменяет статусы только что изменённых заявок."""
     if not history:
         return "История отсутствует."
+    statuses = statuses or {}
     parts = []
     for item in history:
-        parts.append(f"#{item['id']} — {item['status']} ({item['created_at']})")
+        item_status = statuses.get(item["id"], item["status"])
+        parts.append(f"#{item['id']} — {item_status} ({item['created_at']})")
     return "\n".join(parts)
 
 
-def build_admin_keyboard(app_id: int) -> InlineKeyboardMarkup:
-    return InlineKeyboardMarkup(
+def parse_admin_filters(args) -> Dict[str, Any]:
+    """Разбирает аргументы /admin вида ``job=Переводчик age=18-25``."""
+    filters_: Dict[str, Any] = {}
+    for arg in args:
+        key, sep, value = arg.partition("=")
+        if not sep or not value:
+            raise ValueError(arg)
+        if key == "job":
+            filters_["job"] = value
+        elif key == "age":
+            low, dash, high = value.partition("-")
+            if not dash:
+                high = low
+            if low:
+                filters_["min_age"] = int(low)
+            if high:
+                filters_["max_age"] = int(high)
+        else:
+            raise ValueError(arg)
+    return filters_
+
+
+def parse_bulk_selection(args) -> Dict[str, Any]:
+    """Разбирает аргументы /approve_all и /decline_all.
+
+    Фильтры — как у /admin (``job=…``, ``age=…``), остальное — номера
+    заявок через пробел или запятую. Без аргументов выбор пуст: массово
+    менять всю очередь разом слишком легко по ошибке.
+    """
+    ids = []
+    filter_args = []
+    for arg in args:
+        if "=" in arg:
+            filter_args.append(arg)
+        else:
+            ids.extend(int(part.lstrip("#")) for part in arg.split(",") if part)
+    selection = parse_admin_filters(filter_args)
+    if ids:
+        selection["ids"] = ids
+    if not selection:
+        raise ValueError("пустой выбор")
+    return selection
+
+
+def describe_admin_filters(filters_: Dict[str, Any]) -> str:
+    parts = []
+    if filters_.get("job"):
+        parts.append(f"должность: {filters_['job']}")
+    if "min_age" in filters_ or "max_age" in filters_:
+        parts.append(f"возраст: {filters_.get('min_age', '')}–{filters_.get('max_age', '')}")
+    return ", ".join(parts)
+
+
+def encode_cursor(row) -> str:
+    return f"{row['id']}|{row['created_at']}"
+
+
+def decode_cursor(raw: str) -> Cursor:
+    raw_id, created_at = raw.split("|", 1)
+    return created_at, int(raw_id)
+
+
+def build_admin_page_keyboard(rows, prev_cursor: Optional[str], next_cursor: Optional[str]):
+    keyboard = [
         [
-            [
-                InlineKeyboardButton("Принять ✅", callback_data=f"approve:{app_id}"),
-                InlineKeyboardButton("Отклонить ❌", callback_data=f"decline:{app_id}"),
-            ]
+            InlineKeyboardButton(f"✅ #{row['id']}", callback_data=f"approve:{row['id']}"),
+            InlineKeyboardButton(f"❌ #{row['id']}", callback_data=f"decline:{row['id']}"),
         ]
+        for row in rows
+    ]
+    navigation = []
+    if prev_cursor:
+        navigation.append(InlineKeyboardButton("◀️ Назад", callback_data=f"adminpage:prev:{prev_cursor}"))
+    if next_cursor:
+        navigation.append(InlineKeyboardButton("Вперёд ▶️", callback_data=f"adminpage:next:{next_cursor}"))
+    if navigation:
+        keyboard.append(navigation)
+    return InlineKeyboardMarkup(keyboard) if keyboard else None
+
+
+async def render_admin_page(view: Dict[str, Any]) -> Tuple[str, Optional[InlineKeyboardMarkup]]:
+    """Готовит одну страницу очереди на рассмотрение.
+
+    ``view`` хранит фильтры и курсор текущей страницы: ``after`` для перехода
+    вперёд, ``before`` — назад. Лишняя заявка в выборке показывает, есть ли
+    следующая (или предыдущая) страница.
+    """
+    page_size = config.settings.admin_page_size
+    filters_ = view.get("filters", {})
+    after, before = view.get("after"), view.get("before")
+    entries = await repo.list_pending_with_history(
+        limit=page_size + 1,
+        history_limit=HISTORY_LIMIT,
+        after=after,
+        before=before,
+        include_archive=True,
+        **filters_,
+    )
+    if before is not None:
+        has_prev, has_next = len(entries) > page_size, True
+        entries = entries[-page_size:]
+    else:
+        has_prev, has_next = after is not None, len(entries) > page_size
+        entries = entries[:page_size]
+    if not entries:
+        if after is not None or before is not None:
+            # страница опустела (например, после решений по заявкам) — возвращаемся в начало
+            view.pop("after", None)
+            view.pop("before", None)
+            return await render_admin_page(view)
+        return "Нет заявок на рассмотрение.", None
+
+    header = "Заявки на рассмотрение"
+    description = describe_admin_filters(filters_)
+    if description:
+        header += f" ({description})"
+    blocks = [header]
+    for row, history in entries:
+        blocks.append(f"{format_application(row)}\n\nИстория заявок:\n{format_history(history)}")
+    rows = [row for row, _ in entries]
+    keyboard = build_admin_page_keyboard(
+        rows,
+        encode_cursor(rows[0]) if has_prev else None,
+        encode_cursor(rows[-1]) if has_next else None,
     )
+    return "\n\n———\n\n".join(blocks), keyboard
+
+
+def clip_message(text: str) -> str:
+    limit = MessageLimit.MAX_TEXT_LENGTH
+    return text if len(text) <= limit else text[: limit - 1] + "…"
+
+
+def admin_views(context: ContextTypes.DEFAULT_TYPE) -> Dict[str, Dict[str, Any]]:
+    """Фильтры и страница каждого сообщения /admin по его message_id.
+
+    Ключи — строки: user_data хранится в JSON. Так два открытых сообщения
+    /admin с разными фильтрами листаются независимо.
+    """
+    return context.user_data.setdefault("admin_views", {})
+
+
+def remember_admin_view(
+    context: ContextTypes.DEFAULT_TYPE, message_id: int, view: Dict[str, Any]
+) -> None:
+    views = admin_views(context)
+    views[str(message_id)] = view
+    while len(views) > ADMIN_VIEWS_KEPT:
+        views.pop(next(iter(views)))
+
+
+async def show_admin_page(query, context: ContextTypes.DEFAULT_TYPE, notice: str = "") -> None:
+    """Перерисовывает страницу очереди в сообщении, к которому привязана кнопка."""
+    view = admin_views(context).get(str(query.message.message_id), {"filters": {}})
+    text, keyboard = await render_admin_page(view)
+    if notice:
+        text = f"{notice}\n\n———\n\n{text}"
+    await query.edit_message_text(clip_message(text), reply_markup=keyboard)
 
 
 async def admin_panel(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
@@ -228,21 +408,177 @@ async def admin_panel(update: Update, context: ContextTypes.DEFAULT_TYPE) -> Non
     if not is_admin(user.id):
         await update.message.reply_text("У вас нет доступа.")
         return
-    pending = repo.list_pending(limit=10)
-    if not pending:
-        await update.message.reply_text("Нет заявок на рассмотрение.")
-        return
-    for row in pending:
-        history_text = format_history(row["user_id"])
+    try:
+        filters_ = parse_admin_filters(context.args or [])
+    except ValueError:
         await update.message.reply_text(
-            f"{format_application(row)}\n\nИстория заявок:\n{history_text}",
-            reply_markup=build_admin_keyboard(row["id"]),
+            "Использование: /admin [job=Должность] [age=18-25]"
+        )
+        return
+    view = {"filters": filters_}
+    text, keyboard = await render_admin_page(view)
+    message = await update.message.reply_text(clip_message(text), reply_markup=keyboard)
+    remember_admin_view(context, message.message_id, view)
+
+
+async def handle_admin_page(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    query = update.callback_query
+    await query.answer()
+    if not is_admin(query.from_user.id):
+        await query.edit_message_text("Нет доступа.")
+        return
+    try:
+        _, direction, raw_cursor = query.data.split(":", 2)
+        cursor = decode_cursor(raw_cursor)
+    except ValueError:
+        await query.edit_message_text("Некорректные данные.")
+        return
+    view = admin_views(context).get(str(query.message.message_id), {"filters": {}})
+    view["after"] = cursor if direction == "next" else None
+    view["before"] = cursor if direction == "prev" else None
+    remember_admin_view(context, query.message.message_id, view)
+    await show_admin_page(query, context)
+
+
+def format_search_hit(row) -> str:
+    return (
+        f"#{row['id']} — {row['status']} ({row['created_at']})\n"
+        f"User ID: {row['user_id']}, @{row['username'] or '—'}, {row['full_name'] or '—'}\n"
+        f"{row['snippet']}"
+    )
+
+
+async def render_search_page(view: Dict[str, Any]) -> Tuple[str, Optional[InlineKeyboardMarkup]]:
+    """Готовит страницу результатов /search; ``view`` хранит запрос и смещение."""
+    page_size = config.settings.admin_page_size
+    offset = view.get("offset", 0)
+    rows = await repo.search(view["text"], limit=page_size + 1, offset=offset)
+    if not rows:
+        return f"По запросу «{view['text']}» ничего не найдено.", None
+    has_next = len(rows) > page_size
+    rows = rows[:page_size]
+    header = f"Поиск «{view['text']}»: {offset + 1}–{offset + len(rows)}"
+    navigation = []
+    if offset > 0:
+        navigation.append(
+            InlineKeyboardButton("◀️ Назад", callback_data=f"searchpage:{max(0, offset - page_size)}")
+        )
+    if has_next:
+        navigation.append(
+            InlineKeyboardButton("Вперёд ▶️", callback_data=f"searchpage:{offset + page_size}")
+        )
+    keyboard = InlineKeyboardMarkup([navigation]) if navigation else None
+    return "\n\n".join([header, *(format_search_hit(row) for row in rows)]), keyboard
+
+
+async def search_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    """/search: полнотекстовый поиск по именам, никам и ответам анкеты."""
+    user = update.effective_user
+    if not is_admin(user.id):
+        await update.message.reply_text("У вас нет доступа.")
+        return
+    text = " ".join(context.args or [])
+    if not search_terms(text):
+        await update.message.reply_text("Использование: /search ник, ссылка или слова из ответов")
+        return
+    view = {"text": text, "offset": 0}
+    context.user_data["search_view"] = view
+    text, keyboard = await render_search_page(view)
+    await update.message.reply_text(clip_message(text), reply_markup=keyboard)
+
+
+async def handle_search_page(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    query = update.callback_query
+    await query.answer()
+    if not is_admin(query.from_user.id):
+        await query.edit_message_text("Нет доступа.")
+        return
+    view = context.user_data.get("search_view")
+    if view is None:
+        await query.edit_message_text("Поиск устарел, повторите /search.")
+        return
+    try:
+        view["offset"] = max(0, int(query.data.split(":", 1)[1]))
+    except ValueError:
+        await query.edit_message_text("Некорректные данные.")
+        return
+    text, keyboard = await render_search_page(view)
+    await query.edit_message_text(clip_message(text), reply_markup=keyboard)
+
+
+STATS_DAYS = 7
+
+
+def approval_rate(counts: Dict[str, int]) -> str:
+    decided = counts.get("approved", 0) + counts.get("declined", 0)
+    return f"{counts.get('approved', 0) / decided:.0%}" if decided else "—"
+
+
+def format_stats(stats: Dict[str, Any]) -> str:
+    by_status = stats["by_status"]
+    if not by_status:
+        return "Заявок пока нет."
+    lines = [
+        f"Всего заявок: {sum(by_status.values())}",
+        f"⏳ На рассмотрении: {by_status.get('pending', 0)}",
+        f"✅ Одобрено: {by_status.get('approved', 0)}",
+        f"❌ Отклонено: {by_status.get('declined', 0)}",
+        f"Доля одобренных среди рассмотренных: {approval_rate(by_status)}",
+        "",
+        "По должностям:",
+    ]
+    jobs = sorted(stats["by_job"].items(), key=lambda item: -sum(item[1].values()))
+    for job, counts in jobs:
+        lines.append(
+            f"{job or 'не указана'}: {sum(counts.values())} "
+            f"(⏳ {counts.get('pending', 0)}, ✅ {counts.get('approved', 0)}, "
+            f"❌ {counts.get('declined', 0)}; одобрено {approval_rate(counts)})"
         )
+    lines += ["", f"Подано за {STATS_DAYS} дн.:"]
+    lines += [f"{day}: {count}" for day, count in stats["daily"]] or ["—"]
+    return "\n".join(lines)
+
+
+DROP_LABELS = {
+    "cooldown": "/start после заявки",
+    "duplicate": "повторы",
+    "user": "лимит пользователя",
+    "global": "общий лимит",
+}
+
+
+def format_dropped(dropped: Dict[str, int]) -> str:
+    details = ", ".join(f"{DROP_LABELS[reason]}: {count}" for reason, count in dropped.items() if count)
+    return f"Отсечено флуда с запуска: {sum(dropped.values())} ({details})"
+
+
+def format_cache(stats: Dict[str, Any]) -> str:
+    return (
+        f"Кэш /status с запуска: попаданий {stats['hits']}, промахов {stats['misses']} "
+        f"({stats['hit_ratio']:.0%}), записей {stats['size']}"
+    )
+
+
+async def stats_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    """/stats: сводка по статусам, должностям и дням из счётчиков в базе."""
+    user = update.effective_user
+    if not is_admin(user.id):
+        await update.message.reply_text("У вас нет доступа.")
+        return
+    stats = await repo.get_stats(days=STATS_DAYS)
+    text = format_stats(stats)
+    dropped = admission.stats()["dropped"]
+    if any(dropped.values()):
+        text += "\n\n" + format_dropped(dropped)
+    cache = repo.cache_stats()
+    if cache and cache["hits"] + cache["misses"]:
+        text += "\n\n" + format_cache(cache)
+    await update.message.reply_text(clip_message(text))
 
 
 async def status(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     user = update.effective_user
-    row = repo.get_last_for_user(user.id)
+    row = await repo.get_last_for_user(user.id)
     if not row:
         await update.message.reply_text("Заявок не найдено. Используйте /start, чтобы подать её.")
         return
@@ -261,52 +597,271 @@ async def handle_admin_action(update: Update, context: ContextTypes.DEFAULT_TYPE
     except ValueError:
         await query.edit_message_text("Некорректные данные.")
         return
-    row = repo.get_by_id(app_id)
-    if not row:
-        await query.edit_message_text("Заявка не найдена.")
+    handlers = {"approve": ("approved", process_approval), "decline": ("declined", process_decline)}
+    if action not in handlers:
+        await query.edit_message_text("Неизвестное действие.")
         return
-    if row["status"] != "pending":
-        await query.edit_message_text("Заявка уже обработана.")
+    new_status, process = handlers[action]
+    # историю читаем одним запросом до решения, а не повторным после него:
+    # статус решённой заявки подставляет format_history
+    loaded = await repo.get_with_history(app_id, HISTORY_LIMIT, include_archive=True)
+    if loaded is None:
+        await query.edit_message_text("Заявка не найдена или уже обработана.")
         return
-    if action == "approve":
-        await process_approval(row, query, context)
-    elif action == "decline":
-        await process_decline(row, query, context)
-    else:
-        await query.edit_message_text("Неизвестное действие.")
+    _, history = loaded
+    # проверка «ещё на рассмотрении» и запись — один UPDATE: при двойном
+    # нажатии двумя админами решение примет только один
+    row = await repo.transition_status(app_id, new_status)
+    if row is None:
+        await query.edit_message_text("Заявка не найдена или уже обработана.")
+        return
+    await process(row, history, query, context)
 
 
-async def process_approval(row, query, context: ContextTypes.DEFAULT_TYPE) -> None:
-    repo.update_status(row["id"], "approved")
+async def process_approval(row, history, query, context: ContextTypes.DEFAULT_TYPE) -> None:
     text = APPROVE_TEMPLATE.format(name=row["full_name"] or "друг")
-    await notify_user(row["chat_id"], text, context)
+    await notify_user(row["chat_id"], text)
 
-    history_text = format_history(row["user_id"])
-    await query.edit_message_text(
-        f"{format_application(row)}\n\n✅ Одобрено.\n\nИстория заявок:\n{history_text}"
+    history_text = format_history(history, {row["id"]: row["status"]})
+    await show_admin_page(
+        query,
+        context,
+        notice=f"✅ Заявка #{row['id']} одобрена.\n\nИстория заявок:\n{history_text}",
     )
 
 
-async def process_decline(row, query, context: ContextTypes.DEFAULT_TYPE) -> None:
-    repo.update_status(row["id"], "declined")
+async def process_decline(row, history, query, context: ContextTypes.DEFAULT_TYPE) -> None:
     text = DECLINE_TEMPLATE.format(name=row["full_name"] or "друг")
-    await notify_user(row["chat_id"], text, context)
-    history_text = format_history(row["user_id"])
-    await query.edit_message_text(
-        f"{format_application(row)}\n\n❌ Отклонено.\n\nИстория заявок:\n{history_text}"
+    await notify_user(row["chat_id"], text)
+    history_text = format_history(history, {row["id"]: row["status"]})
+    await show_admin_page(
+        query,
+        context,
+        notice=f"❌ Заявка #{row['id']} отклонена.\n\nИстория заявок:\n{history_text}",
     )
 
 
-async def notify_user(chat_id: int, text: str, context: ContextTypes.DEFAULT_TYPE) -> None:
+async def notify_user(chat_id: int, text: str) -> None:
+    """Ставит уведомление в очередь рассылки, не дожидаясь отправки."""
+    await notifier.send(chat_id, text)
+
+
+def parse_export_args(args) -> Tuple[str, Dict[str, Any]]:
+    """Разбирает аргументы /export: ``[csv|jsonl|parquet] [status=…] [job=…] [since=…] [until=…]``."""
+    fmt = "csv"
+    options: Dict[str, str] = {}
+    for arg in args:
+        key, sep, value = arg.partition("=")
+        if not sep:
+            if arg.lower() not in EXPORT_FORMATS:
+                raise ValueError(arg)
+            fmt = arg.lower()
+        elif key in ("status", "job", "since", "until") and value:
+            options[key] = value
+        else:
+            raise ValueError(arg)
+    return fmt, normalize_export_filters(**options)
+
+
+async def export_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    """/export: выгрузка заявок файлом; файл пишется в отдельном потоке."""
+    user = update.effective_user
+    if not is_admin(user.id):
+        await update.message.reply_text("У вас нет доступа.")
+        return
+    try:
+        fmt, filters_ = parse_export_args(context.args or [])
+    except ValueError:
+        await update.message.reply_text(
+            "Использование: /export [csv|jsonl|parquet] [status=approved] [job=Должность] "
+            "[since=ГГГГ-ММ-ДД] [until=ГГГГ-ММ-ДД]"
+        )
+        return
+    await update.message.reply_text("Готовлю выгрузку…")
+    with tempfile.TemporaryDirectory() as tmpdir:
+        path = Path(tmpdir) / f"applications.{fmt}"
+        try:
+            count = await export_applications_async(repo, path, fmt, **filters_)
+        except ExportError as exc:
+            await update.message.reply_text(str(exc))
+            return
+        with open(path, "rb") as fp:
+            await update.message.reply_document(
+                fp, filename=path.name, caption=f"Заявок в выгрузке: {count}"
+            )
+    logger.info("Администратор %s выгрузил %s заявок (%s)", user.id, count, fmt)
+
+
+BULK_ACTIONS = {
+    "approve_all": ("approved", APPROVE_TEMPLATE, "✅ Одобрено"),
+    "decline_all": ("declined", DECLINE_TEMPLATE, "❌ Отклонено"),
+}
+
+
+async def bulk_moderate(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    """/approve_all и /decline_all: массовое решение по фильтру или списку номеров."""
+    user = update.effective_user
+    if not is_admin(user.id):
+        await update.message.reply_text("У вас нет доступа.")
+        return
+    command = update.message.text.split()[0].lstrip("/").split("@")[0].lower()
+    new_status, template, verb = BULK_ACTIONS[command]
     try:
-        await context.bot.send_message(chat_id=chat_id, text=text)
-    except Exception as exc:  # pragma: no cover - сетевые ошибки
-        logger.error("Не удалось отправить сообщение пользователю %s: %s", chat_id, exc)
+        selection = parse_bulk_selection(context.args or [])
+    except ValueError:
+        await update.message.reply_text(
+            f"Использование: /{command} [job=Должность] [age=18-25] [номера заявок]"
+        )
+        return
+    rows = await repo.bulk_update_status(new_status, **selection)
+    if not rows:
+        await update.message.reply_text("Подходящих заявок на рассмотрении нет.")
+        return
+    await notifier.send_many(
+        (row["chat_id"], template.format(name=row["full_name"] or "друг")) for row in rows
+    )
+    logger.info("Администратор %s: %s заявок -> %s", user.id, len(rows), new_status)
+    ids = ", ".join(f"#{row['id']}" for row in rows)
+    await update.message.reply_text(clip_message(f"{verb} заявок: {len(rows)}\n{ids}"))
+
+
+async def archive_job(context: ContextTypes.DEFAULT_TYPE) -> None:
+    """Переносит старые рассмотренные заявки в архив и возвращает место в файле базы."""
+    settings = config.settings
+    cutoff = datetime.now(timezone.utc) - timedelta(days=settings.archive_after_days)
+    moved = await repo.archive_decided(
+        cutoff.strftime("%Y-%m-%d %H:%M:%S"), batch_size=settings.archive_batch_size
+    )
+    if moved:
+        freed = await repo.vacuum()
+        logger.info("В архив перенесено заявок: %s, освобождено страниц: %s", moved, freed)
+
+
+async def digest_job(context: ContextTypes.DEFAULT_TYPE) -> None:
+    """Публикует накопившиеся заявки сводками в Yonote."""
+    published = await outbox_worker.drain()
+    if published:
+        logger.info("В сводки Yonote попало заявок: %s", published)
+
 
+metrics_runner = None
 
-def build_application() -> Application:
+
+async def post_init(application: Application) -> None:
+    global yonote, outbox_worker, notifier, metrics_runner
+    settings = config.settings
+    yonote = YonoteClient.from_settings(settings)
+    if settings.yonote_digest_minutes > 0:
+        outbox_worker = OutboxDigest(
+            repo,
+            yonote.create_digest_document,
+            group_by=settings.yonote_digest_group,
+            max_attempts=settings.outbox_max_attempts,
+        )
+    else:
+        outbox_worker = OutboxWorker(
+            repo,
+            yonote.create_application_document,
+            concurrency=settings.outbox_concurrency,
+            max_attempts=settings.outbox_max_attempts,
+            poll_interval=settings.outbox_poll_interval,
+        )
+    notifier = NotificationDispatcher(
+        repo,
+        global_rate=settings.notify_global_rate,
+        chat_rate=settings.notify_chat_rate,
+        queue_size=settings.notify_queue_size,
+        concurrency=settings.notify_concurrency,
+        max_attempts=settings.notify_max_attempts,
+    )
+    await outbox_worker.start()
+    await notifier.start(application.bot)
+    metrics.track_queue("updates", application.update_queue.qsize)
+    metrics.track_queue("updates_waiting", application.update_processor.waiting)
+    metrics.track_queue("notifications", notifier.qsize)
+    metrics_runner = await metrics.start_metrics_server(settings.metrics_listen, settings.metrics_port)
+    if settings.archive_after_days > 0 and application.job_queue is not None:
+        application.job_queue.run_repeating(
+            archive_job,
+            interval=settings.archive_interval_hours * 3600,
+            first=60,
+            name="archive",
+        )
+    if settings.yonote_digest_minutes > 0 and application.job_queue is not None:
+        application.job_queue.run_repeating(
+            digest_job,
+            interval=settings.yonote_digest_minutes * 60,
+            first=settings.yonote_digest_minutes * 60,
+            name="yonote_digest",
+        )
+
+
+async def post_shutdown(application: Application) -> None:
+    global repo, yonote, outbox_worker, notifier, metrics_runner
+    try:
+        if metrics_runner is not None:
+            await metrics_runner.cleanup()
+        if notifier is not None:
+            await notifier.stop()
+        if outbox_worker is not None:
+            await outbox_worker.stop()
+        if yonote is not None:
+            await yonote.aclose()
+    finally:
+        if repo is not None:
+            await repo.close()
+        repo = yonote = outbox_worker = notifier = metrics_runner = None
+
+
+def build_application(
+    request: Optional[BaseRequest] = None,
+    get_updates_request: Optional[BaseRequest] = None,
+    concurrent_updates: Optional[int] = None,
+) -> Application:
+    """Собирает приложение бота.
+
+    ``request`` и ``get_updates_request`` позволяют подменить HTTP-транспорт
+    Bot API — так нагрузочный прогон (loadtest.py) работает без сети.
+    ``concurrent_updates`` заменяет ``CONCURRENT_UPDATES`` из настроек.
+    Здесь же открывается хранилище: PTB читает из него состояние диалогов
+    в ``Application.initialize()``, до вызова ``post_init``.
+    """
+    global repo, admission
+    settings = config.settings
     settings.validate()
-    application = Application.builder().token(settings.bot_token).build()
+    repo = open_repository(settings)
+    admission = AdmissionControl(
+        user_rate=settings.antiflood_user_rate,
+        user_burst=settings.antiflood_user_burst,
+        global_rate=settings.antiflood_global_rate,
+        global_burst=settings.antiflood_global_burst,
+        duplicate_window=settings.antiflood_duplicate_window,
+        submit_cooldown=settings.submit_cooldown,
+        exempt=settings.admin_ids,
+    )
+    builder = Application.builder().token(settings.bot_token)
+    if request is not None:
+        builder = builder.request(request)
+    if get_updates_request is not None:
+        builder = builder.get_updates_request(get_updates_request)
+    application = (
+        builder
+        .persistence(
+            RepositoryPersistence(
+                repo,
+                update_interval=settings.persistence_update_interval,
+                ttl=settings.persistence_ttl_hours * 3600,
+            )
+        )
+        # обновления разных пользователей обрабатываются параллельно,
+        # одного пользователя — по очереди (см. update_processor.py)
+        .concurrent_updates(
+            PerUserUpdateProcessor(concurrent_updates or settings.concurrent_updates)
+        )
+        .post_init(post_init)
+        .post_shutdown(post_shutdown)
+        .build()
+    )
     conv = ConversationHandler(
         entry_points=[CommandHandler("start", start)],
         states={
@@ -317,22 +872,43 @@ def build_application() -> Application:
             JOB_SELECTION: [
                 CallbackQueryHandler(handle_job_selection, pattern=r"^job:"),
             ],
+            ConversationHandler.TIMEOUT: [TypeHandler(Update, survey_timeout)],
         },
         fallbacks=[CommandHandler("cancel", cancel)],
+        conversation_timeout=settings.persistence_ttl_hours * 3600,
         allow_reentry=True,
+        name="survey",
+        persistent=True,
     )
+    # группа -1 проверяется раньше всех: лишнее отсекается до обращений к хранилищу
+    application.add_handler(TypeHandler(Update, admission.check_update), group=-1)
     application.add_handler(conv)
     application.add_handler(CommandHandler("status", status))
     application.add_handler(CommandHandler("admin", admin_panel))
+    application.add_handler(CommandHandler(list(BULK_ACTIONS), bulk_moderate))
+    # выгрузка может занять время — не задерживаем остальные обновления
+    application.add_handler(CommandHandler("export", export_command, block=False))
+    application.add_handler(CommandHandler("search", search_command))
+    application.add_handler(CommandHandler("stats", stats_command))
     application.add_handler(CommandHandler("cancel", cancel))
     application.add_handler(CallbackQueryHandler(handle_admin_action, pattern=r"^(approve|decline):"))
+    application.add_handler(CallbackQueryHandler(handle_admin_page, pattern=r"^adminpage:"))
+    application.add_handler(CallbackQueryHandler(handle_search_page, pattern=r"^searchpage:"))
+    metrics.instrument_handlers(application)
     return application
 
 
 def main() -> None:
+    settings = config.settings
     app = build_application()
-    logger.info("Бот запущен.")
-    app.run_polling(allowed_updates=Update.ALL_TYPES)
+    logger.info("Бот запущен в режиме %s.", settings.bot_mode)
+    if settings.bot_mode == "webhook":
+        # aiohttp нужен только в режиме webhook и заметно замедляет импорт
+        from webhook import run_webhook
+
+        asyncio.run(run_webhook(app, settings, ALLOWED_UPDATES))
+    else:
+        app.run_polling(allowed_updates=ALLOWED_UPDATES)
 
 
 if __name__ == "__main__":
@@ -0,0 +1,78 @@
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Hashable, Tuple
+
+MISSING = object()
+
+
+class TTLCache:
+    """Ограниченный по размеру LRU-кэш с временем жизни записей.
+
+    Хранит и ``None`` — отрицательный результат тоже экономит запрос.
+    ``epoch`` растёт при каждой инвалидации: значение, прочитанное из базы
+    до инвалидации, не попадёт в кэш (см. :meth:`set_if_epoch`).
+    """
+
+    def __init__(
+        self, maxsize: int = 10000, ttl: float = 60.0, clock: Callable[[], float] = time.monotonic
+    ) -> None:
+        self.maxsize = max(1, maxsize)
+        self.ttl = ttl
+        self._clock = clock
+        self._data: "OrderedDict[Hashable, Tuple[float, Any]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.epoch = 0
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def get(self, key: Hashable) -> Any:
+        with self._lock:
+            item = self._data.get(key)
+            if item is not None:
+                expires_at, value = item
+                if expires_at > self._clock():
+                    self._data.move_to_end(key)
+                    self.hits += 1
+                    return value
+                del self._data[key]
+            self.misses += 1
+            return MISSING
+
+    def set(self, key: Hashable, value: Any) -> None:
+        with self._lock:
+            self._store(key, value)
+
+    def set_if_epoch(self, key: Hashable, value: Any, epoch: int) -> None:
+        """Сохраняет значение, только если с момента ``epoch`` не было инвалидаций."""
+        with self._lock:
+            if epoch == self.epoch:
+                self._store(key, value)
+
+    def _store(self, key: Hashable, value: Any) -> None:
+        self._data[key] = (self._clock() + self.ttl, value)
+        self._data.move_to_end(key)
+        while len(self._data) > self.maxsize:
+            self._data.popitem(last=False)
+
+    def invalidate(self, key: Hashable) -> None:
+        with self._lock:
+            self.epoch += 1
+            self._data.pop(key, None)
+
+    def clear(self) -> None:
+        with self._lock:
+            self.epoch += 1
+            self._data.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        total = self.hits + self.misses
+        return {
+            "size": len(self._data),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_ratio": self.hits / total if total else 0.0,
+        }
@@ -0,0 +1,257 @@
+"""Замер холодного старта бота: время импорта и время до первого обновления.
+
+Каждый замер — отдельный свежий процесс Python:
+
+* импорт ``bot`` под ``-X importtime``: общее время и самые тяжёлые модули;
+* путь от запуска интерпретатора до обработанного ``/start``: импорт,
+  сборка приложения, ``initialize`` с ``post_init`` и первое обновление
+  (Bot API подменён, сеть не нужна, база — новый временный файл).
+
+Пороги ``--max-import-ms`` и ``--max-first-update-ms`` превращают замер в
+проверку: при превышении медианы скрипт завершается с кодом 1.
+
+Пример::
+
+    python coldstart.py --runs 5 --max-import-ms 600 --max-first-update-ms 1500
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from typing import Any, Dict, List, Optional, Tuple
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+ADMIN_ID = 10 ** 9
+USER_ID = 1
+# фазы дочернего процесса в порядке выполнения
+PHASES = ("import_ms", "build_ms", "init_ms", "first_update_ms")
+
+
+def parse_importtime(stderr: str) -> List[Tuple[str, int, int]]:
+    """Строки ``-X importtime``: (модуль, собственное время, суммарное время) в мкс.
+
+    Имя модуля сохраняет отступ, по которому видна вложенность импортов.
+    """
+    entries = []
+    for line in stderr.splitlines():
+        if not line.startswith("import time:"):
+            continue
+        own, cumulative, name = line[len("import time:"):].split("|")
+        if not own.strip().isdigit():
+            continue  # заголовок таблицы
+        # после «|» идёт один пробел-разделитель, дальше — отступ вложенности
+        entries.append((name.rstrip()[1:], int(own), int(cumulative)))
+    return entries
+
+
+def child_env(workdir: str, storage: str) -> Dict[str, str]:
+    env = dict(os.environ)
+    env.update(
+        {
+            "TELEGRAM_BOT_TOKEN": "123456:coldstart",
+            "DATABASE_PATH": os.path.join(workdir, "applications.db"),
+            "STORAGE_BACKEND": storage,
+            "ADMIN_IDS": str(ADMIN_ID),
+            "YONOTE_BASE_URL": "http://127.0.0.1:9/api",
+            "YONOTE_API_KEY": "coldstart",
+            "YONOTE_COLLECTION_ID": "coldstart",
+            "BOT_MODE": "polling",
+            "METRICS_PORT": "0",
+            "ARCHIVE_AFTER_DAYS": "0",
+        }
+    )
+    return env
+
+
+def measure_import(storage: str, top: int = 10) -> Dict[str, Any]:
+    """Импортирует ``bot`` в новом процессе и разбирает вывод ``-X importtime``."""
+    with tempfile.TemporaryDirectory() as workdir:
+        result = subprocess.run(
+            [sys.executable, "-X", "importtime", "-c", "import bot"],
+            cwd=ROOT,
+            env=child_env(workdir, storage),
+            capture_output=True,
+            text=True,
+            check=True,
+        )
+        created = sorted(os.listdir(workdir))
+    entries = parse_importtime(result.stderr)
+    # importtime печатает модуль после всех его зависимостей, так что
+    # поддерево bot — строки между предыдущим модулем верхнего уровня и bot
+    children: List[Tuple[str, int]] = []
+    for name, _, cumulative in entries:
+        if name == "bot":
+            total = cumulative
+            break
+        if not name.startswith(" "):
+            children = []
+        elif not name.startswith("   "):
+            children.append((name.strip(), cumulative))
+    else:
+        raise RuntimeError("В выводе -X importtime нет модуля bot")
+    children.sort(key=lambda item: item[1], reverse=True)
+    return {
+        "import_ms": round(total / 1000, 2),
+        "modules": [name.strip() for name, _, _ in entries],
+        "heaviest": [(name, round(cumulative / 1000, 2)) for name, cumulative in children[:top]],
+        "files_created": created,
+    }
+
+
+def measure_first_update(storage: str) -> Dict[str, float]:
+    """Запускает бота в новом процессе и ждёт ответа на первый ``/start``."""
+    with tempfile.TemporaryDirectory() as workdir:
+        started = time.time()
+        result = subprocess.run(
+            [sys.executable, os.path.join(ROOT, "coldstart.py"), "--child", str(started)],
+            cwd=ROOT,
+            env=child_env(workdir, storage),
+            capture_output=True,
+            text=True,
+            check=True,
+        )
+    return json.loads(result.stdout.splitlines()[-1])
+
+
+async def _first_update(started: float) -> Dict[str, float]:
+    """Тело дочернего процесса: фазы старта от запуска интерпретатора, в мс."""
+    marks = {"start": started}
+    import bot
+
+    marks["import_ms"] = time.time()
+    from telegram import Update
+    from telegram.ext import TypeHandler
+
+    from loadtest import OfflineRequest
+
+    application = bot.build_application(
+        request=OfflineRequest(), get_updates_request=OfflineRequest()
+    )
+    handled = asyncio.get_running_loop().create_future()
+
+    async def done(update: Update, context: Any) -> None:
+        if not handled.done():
+            handled.set_result(None)
+
+    application.add_handler(TypeHandler(Update, done), group=sys.maxsize)
+    marks["build_ms"] = time.time()
+    await application.initialize()
+    try:
+        await application.post_init(application)
+        await application.start()
+        marks["init_ms"] = time.time()
+        update = Update.de_json(
+            {
+                "update_id": 1,
+                "message": {
+                    "message_id": 1,
+                    "date": int(time.time()),
+                    "chat": {"id": USER_ID, "type": "private"},
+                    "from": {"id": USER_ID, "is_bot": False, "first_name": "User"},
+                    "text": "/start",
+                    "entities": [{"type": "bot_command", "offset": 0, "length": 6}],
+                },
+            },
+            application.bot,
+        )
+        await application.update_queue.put(update)
+        await asyncio.wait_for(handled, 30)
+        marks["first_update_ms"] = time.time()
+    finally:
+        if application.running:
+            await application.stop()
+        await application.shutdown()
+        await application.post_shutdown(application)
+    # длительность каждой фазы и итог от запуска процесса
+    report = {}
+    previous = started
+    for phase in PHASES:
+        report[phase] = round((marks[phase] - previous) * 1000, 2)
+        previous = marks[phase]
+    report["total_ms"] = round((marks["first_update_ms"] - started) * 1000, 2)
+    return report
+
+
+def run_benchmark(runs: int, storage: str) -> Dict[str, Any]:
+    imports = [measure_import(storage) for _ in range(runs)]
+    starts = [measure_first_update(storage) for _ in range(runs)]
+    last = imports[-1]
+    return {
+        "runs": runs,
+        "storage": storage,
+        "import_ms": round(statistics.median(item["import_ms"] for item in imports), 2),
+        "heaviest_imports": last["heaviest"],
+        "files_created_on_import": last["files_created"],
+        "aiohttp_on_import": "aiohttp" in last["modules"],
+        "first_update": {
+            key: round(statistics.median(item[key] for item in starts), 2)
+            for key in (*PHASES, "total_ms")
+        },
+    }
+
+
+def check_thresholds(
+    report: Dict[str, Any], max_import_ms: Optional[float], max_first_update_ms: Optional[float]
+) -> List[str]:
+    """Список нарушенных порогов (пустой, если всё в норме)."""
+    failures = []
+    if max_import_ms is not None and report["import_ms"] > max_import_ms:
+        failures.append(f"импорт {report['import_ms']} мс > {max_import_ms} мс")
+    total = report["first_update"]["total_ms"]
+    if max_first_update_ms is not None and total > max_first_update_ms:
+        failures.append(f"первое обновление {total} мс > {max_first_update_ms} мс")
+    if report["files_created_on_import"]:
+        failures.append(f"импорт создал файлы: {', '.join(report['files_created_on_import'])}")
+    return failures
+
+
+def print_report(report: Dict[str, Any]) -> None:
+    print(f"Прогонов: {report['runs']}, хранилище: {report['storage']} (медианы)")
+    print(f"Импорт bot: {report['import_ms']} мс")
+    for name, ms in report["heaviest_imports"]:
+        print(f"  {name:<30}{ms:>10} мс")
+    first = report["first_update"]
+    print(
+        f"До первого обновления: {first['total_ms']} мс "
+        f"(импорт {first['import_ms']}, сборка {first['build_ms']}, "
+        f"инициализация {first['init_ms']}, /start {first['first_update_ms']})"
+    )
+
+
+def parse_args(argv: Optional[List[str]] = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Замер холодного старта бота")
+    parser.add_argument("--runs", type=int, default=3, help="число прогонов, в отчёте медиана")
+    parser.add_argument(
+        "--storage", choices=("sqlite", "memory"), default="sqlite", help="движок хранилища"
+    )
+    parser.add_argument("--max-import-ms", type=float, help="порог времени импорта bot")
+    parser.add_argument("--max-first-update-ms", type=float, help="порог времени до первого обновления")
+    parser.add_argument("--json", action="store_true", help="вывести отчёт в JSON")
+    parser.add_argument("--child", type=float, help=argparse.SUPPRESS)
+    return parser.parse_args(argv)
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    args = parse_args(argv)
+    if args.child is not None:
+        print(json.dumps(asyncio.run(_first_update(args.child))))
+        return 0
+    report = run_benchmark(args.runs, args.storage)
+    if args.json:
+        print(json.dumps(report, ensure_ascii=False))
+    else:
+        print_report(report)
+    failures = check_thresholds(report, args.max_import_ms, args.max_first_update_ms)
+    for failure in failures:
+        print(f"Регрессия: {failure}", file=sys.stderr)
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
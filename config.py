@@ -1,14 +1,18 @@
 from __future__ import annotations
 
 import os
+import re
 from dataclasses import dataclass, field
+from functools import lru_cache
 from pathlib import Path
-from typing import List
+from typing import Any, List
 
-from dotenv import load_dotenv
+from storage import STORAGE_BACKENDS
 
-
-load_dotenv()
+BOT_MODES = ("polling", "webhook")
+YONOTE_DIGEST_GROUPS = ("all", "job")
+# Telegram допускает в secret_token только эти символы
+_WEBHOOK_SECRET_RE = re.compile(r"^[A-Za-z0-9_-]{1,256}$")
 
 def _split_env_list(value: str | None) -> List[int]:
     if not value:
@@ -17,6 +21,19 @@ def _split_env_list(value: str | None) -> List[int]:
     return [int(item) for item in raw_values if item.isdigit()]
 
 
+def _env_int(name: str, default: int) -> int:
+    value = os.environ.get(name)
+    return int(value) if value and value.strip().lstrip("-").isdigit() else default
+
+
+def _env_float(name: str, default: float) -> float:
+    value = os.environ.get(name)
+    try:
+        return float(value) if value else default
+    except ValueError:
+        return default
+
+
 @dataclass
 class Settings:
     bot_token: str = field(default_factory=lambda: os.environ.get("TELEGRAM_BOT_TOKEN", ""))
@@ -27,13 +44,115 @@ class Settings:
     yonote_api_key: str | None = field(default_factory=lambda: os.environ.get("YONOTE_API_KEY"))
     yonote_collection_id: str | None = field(default_factory=lambda: os.environ.get("YONOTE_COLLECTION_ID"))
     yonote_base_url: str | None = field(default_factory=lambda: os.environ.get("YONOTE_BASE_URL"))
+    yonote_connect_timeout: float = field(default_factory=lambda: _env_float("YONOTE_CONNECT_TIMEOUT", 5.0))
+    yonote_read_timeout: float = field(default_factory=lambda: _env_float("YONOTE_READ_TIMEOUT", 15.0))
+    yonote_max_retries: int = field(default_factory=lambda: _env_int("YONOTE_MAX_RETRIES", 3))
+    yonote_breaker_threshold: int = field(default_factory=lambda: _env_int("YONOTE_BREAKER_THRESHOLD", 5))
+    yonote_breaker_reset_timeout: float = field(
+        default_factory=lambda: _env_float("YONOTE_BREAKER_RESET_TIMEOUT", 30.0)
+    )
+    storage_backend: str = field(
+        default_factory=lambda: os.environ.get("STORAGE_BACKEND", "sqlite").lower()
+    )
+    database_url: str | None = field(default_factory=lambda: os.environ.get("DATABASE_URL"))
+    database_pool_size: int = field(default_factory=lambda: _env_int("DATABASE_POOL_SIZE", 10))
+    database_read_pool_size: int = field(default_factory=lambda: _env_int("DATABASE_READ_POOL_SIZE", 4))
+    database_busy_timeout_ms: int = field(default_factory=lambda: _env_int("DATABASE_BUSY_TIMEOUT_MS", 5000))
+    database_synchronous: str = field(
+        default_factory=lambda: os.environ.get("DATABASE_SYNCHRONOUS", "NORMAL").upper()
+    )
+    admin_page_size: int = field(default_factory=lambda: _env_int("ADMIN_PAGE_SIZE", 5))
+    status_cache_size: int = field(default_factory=lambda: _env_int("STATUS_CACHE_SIZE", 10000))
+    status_cache_ttl: float = field(default_factory=lambda: _env_float("STATUS_CACHE_TTL", 60.0))
+    outbox_concurrency: int = field(default_factory=lambda: _env_int("OUTBOX_CONCURRENCY", 4))
+    outbox_max_attempts: int = field(default_factory=lambda: _env_int("OUTBOX_MAX_ATTEMPTS", 8))
+    outbox_poll_interval: float = field(default_factory=lambda: _env_float("OUTBOX_POLL_INTERVAL", 5.0))
+    yonote_digest_minutes: float = field(default_factory=lambda: _env_float("YONOTE_DIGEST_MINUTES", 0.0))
+    yonote_digest_group: str = field(
+        default_factory=lambda: os.environ.get("YONOTE_DIGEST_GROUP", "all").lower()
+    )
+    notify_global_rate: float = field(default_factory=lambda: _env_float("NOTIFY_GLOBAL_RATE", 30.0))
+    notify_chat_rate: float = field(default_factory=lambda: _env_float("NOTIFY_CHAT_RATE", 1.0))
+    notify_queue_size: int = field(default_factory=lambda: _env_int("NOTIFY_QUEUE_SIZE", 1000))
+    notify_concurrency: int = field(default_factory=lambda: _env_int("NOTIFY_CONCURRENCY", 8))
+    notify_max_attempts: int = field(default_factory=lambda: _env_int("NOTIFY_MAX_ATTEMPTS", 5))
+    antiflood_user_rate: float = field(default_factory=lambda: _env_float("ANTIFLOOD_USER_RATE", 1.0))
+    antiflood_user_burst: float = field(default_factory=lambda: _env_float("ANTIFLOOD_USER_BURST", 5.0))
+    antiflood_global_rate: float = field(
+        default_factory=lambda: _env_float("ANTIFLOOD_GLOBAL_RATE", 100.0)
+    )
+    antiflood_global_burst: float = field(
+        default_factory=lambda: _env_float("ANTIFLOOD_GLOBAL_BURST", 200.0)
+    )
+    antiflood_duplicate_window: float = field(
+        default_factory=lambda: _env_float("ANTIFLOOD_DUPLICATE_WINDOW", 5.0)
+    )
+    submit_cooldown: float = field(default_factory=lambda: _env_float("SUBMIT_COOLDOWN", 60.0))
+    concurrent_updates: int = field(default_factory=lambda: _env_int("CONCURRENT_UPDATES", 32))
+    metrics_listen: str = field(default_factory=lambda: os.environ.get("METRICS_LISTEN", "127.0.0.1"))
+    metrics_port: int = field(default_factory=lambda: _env_int("METRICS_PORT", 9090))
+    archive_after_days: float = field(default_factory=lambda: _env_float("ARCHIVE_AFTER_DAYS", 90.0))
+    archive_batch_size: int = field(default_factory=lambda: _env_int("ARCHIVE_BATCH_SIZE", 500))
+    archive_interval_hours: float = field(
+        default_factory=lambda: _env_float("ARCHIVE_INTERVAL_HOURS", 24.0)
+    )
+    persistence_update_interval: float = field(
+        default_factory=lambda: _env_float("PERSISTENCE_UPDATE_INTERVAL", 10.0)
+    )
+    persistence_ttl_hours: float = field(default_factory=lambda: _env_float("PERSISTENCE_TTL_HOURS", 72.0))
+    bot_mode: str = field(default_factory=lambda: os.environ.get("BOT_MODE", "polling").lower())
+    webhook_url: str | None = field(default_factory=lambda: os.environ.get("WEBHOOK_URL"))
+    webhook_path: str = field(default_factory=lambda: os.environ.get("WEBHOOK_PATH", "/telegram"))
+    webhook_secret: str | None = field(default_factory=lambda: os.environ.get("WEBHOOK_SECRET"))
+    webhook_listen: str = field(default_factory=lambda: os.environ.get("WEBHOOK_LISTEN", "0.0.0.0"))
+    webhook_port: int = field(default_factory=lambda: _env_int("WEBHOOK_PORT", 8080))
 
     def validate(self) -> None:
         if not self.bot_token:
             raise ValueError("Переменная окружения BOT_TOKEN не задана.")
         if not self.admin_ids:
             raise ValueError("Список администраторов ADMIN_IDS не задан или пуст.")
+        if self.storage_backend not in STORAGE_BACKENDS:
+            raise ValueError(f"STORAGE_BACKEND должен быть одним из: {', '.join(STORAGE_BACKENDS)}.")
+        if self.storage_backend == "postgres" and not self.database_url:
+            raise ValueError("Для STORAGE_BACKEND=postgres нужно задать DATABASE_URL.")
+        if self.yonote_digest_group not in YONOTE_DIGEST_GROUPS:
+            raise ValueError(
+                f"YONOTE_DIGEST_GROUP должен быть одним из: {', '.join(YONOTE_DIGEST_GROUPS)}."
+            )
+        if self.concurrent_updates < 1:
+            raise ValueError("CONCURRENT_UPDATES должен быть не меньше 1.")
+        if self.bot_mode not in BOT_MODES:
+            raise ValueError(f"BOT_MODE должен быть одним из: {', '.join(BOT_MODES)}.")
+        if self.bot_mode == "webhook":
+            if not self.webhook_url:
+                raise ValueError("Для режима webhook нужно задать WEBHOOK_URL.")
+            if not self.webhook_secret or not _WEBHOOK_SECRET_RE.match(self.webhook_secret):
+                raise ValueError(
+                    "WEBHOOK_SECRET обязателен в режиме webhook: 1–256 символов A-Z, a-z, 0-9, _ и -."
+                )
+
+
+@lru_cache(maxsize=None)
+def get_settings() -> Settings:
+    """Настройки процесса: ``.env`` читается при первом обращении, а не при импорте."""
+    from dotenv import load_dotenv
+
+    load_dotenv()
+    return Settings()
+
+
+def reset_settings() -> None:
+    """Забывает прочитанные настройки: следующее обращение перечитает окружение."""
+    get_settings.cache_clear()
+    globals().pop("settings", None)
 
 
-settings = Settings()
+def __getattr__(name: str) -> Any:
+    # ``config.settings`` и ``from config import settings`` создают настройки
+    # лениво; после первого обращения атрибут лежит в модуле и читается напрямую
+    if name == "settings":
+        value = globals()["settings"] = get_settings()
+        return value
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
 
@@ -1,54 +1,639 @@
+import asyncio
 import json
+import queue
 import sqlite3
 import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
 from pathlib import Path
-from typing import Any, Dict, List, Optional
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple, TypeVar
+
+from cache import MISSING, TTLCache
+from metrics import observe_db, status_cache_lookup
+from storage import (
+    ANSWER_FIELDS,
+    APPLICATION_FIELDS,
+    DECIDED_STATUSES,
+    ROW_FIELDS,
+    Cursor,
+    Repository,
+    search_terms,
+)
+
+T = TypeVar("T")
+
+SYNCHRONOUS_MODES = ("OFF", "NORMAL", "FULL", "EXTRA")
+
+
+def _migration_initial(conn: sqlite3.Connection) -> None:
+    conn.execute(
+        """
+        CREATE TABLE IF NOT EXISTS applications (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_id INTEGER NOT NULL,
+            chat_id INTEGER NOT NULL,
+            username TEXT,
+            full_name TEXT,
+            answers_json TEXT NOT NULL,
+            status TEXT NOT NULL,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            admin_comment TEXT,
+            synced_to_yonote INTEGER DEFAULT 0
+        )
+        """
+    )
+    # базы, созданные до появления синхронизации с Yonote, не имеют этой колонки
+    try:
+        conn.execute("ALTER TABLE applications ADD COLUMN synced_to_yonote INTEGER DEFAULT 0")
+    except sqlite3.OperationalError as exc:
+        if "duplicate column" not in str(exc):
+            raise
+
+
+def _migration_outbox(conn: sqlite3.Connection) -> None:
+    # очередь на выгрузку в Yonote: пишется в одной транзакции с заявкой
+    conn.execute(
+        """
+        CREATE TABLE IF NOT EXISTS yonote_outbox (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            application_id INTEGER NOT NULL UNIQUE REFERENCES applications(id),
+            status TEXT NOT NULL DEFAULT 'pending',
+            attempts INTEGER NOT NULL DEFAULT 0,
+            next_attempt_at REAL NOT NULL DEFAULT 0,
+            last_error TEXT,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+        """
+    )
+
+
+def _migration_hot_indexes(conn: sqlite3.Connection) -> None:
+    conn.execute(
+        "CREATE INDEX IF NOT EXISTS idx_applications_user_created "
+        "ON applications (user_id, created_at DESC)"
+    )
+    conn.execute(
+        "CREATE INDEX IF NOT EXISTS idx_applications_status_created "
+        "ON applications (status, created_at)"
+    )
+    conn.execute(
+        "CREATE INDEX IF NOT EXISTS idx_applications_unsynced "
+        "ON applications (id) WHERE synced_to_yonote = 0"
+    )
+    conn.execute(
+        "CREATE INDEX IF NOT EXISTS idx_outbox_due "
+        "ON yonote_outbox (status, next_attempt_at)"
+    )
+
+
+def _migration_bot_persistence(conn: sqlite3.Connection) -> None:
+    # состояние диалогов PTB, чтобы опрос переживал перезапуск бота
+    conn.execute(
+        """
+        CREATE TABLE IF NOT EXISTS bot_user_data (
+            user_id INTEGER PRIMARY KEY,
+            data TEXT NOT NULL,
+            updated_at REAL NOT NULL
+        )
+        """
+    )
+    conn.execute(
+        """
+        CREATE TABLE IF NOT EXISTS bot_conversations (
+            name TEXT NOT NULL,
+            key TEXT NOT NULL,
+            state TEXT NOT NULL,
+            updated_at REAL NOT NULL,
+            PRIMARY KEY (name, key)
+        )
+        """
+    )
+    conn.execute(
+        "CREATE INDEX IF NOT EXISTS idx_bot_user_data_updated ON bot_user_data (updated_at)"
+    )
+    conn.execute(
+        "CREATE INDEX IF NOT EXISTS idx_bot_conversations_updated ON bot_conversations (updated_at)"
+    )
+
+
+def _migration_undeliverable_chats(conn: sqlite3.Connection) -> None:
+    # чаты, в которые Telegram больше не даёт писать (бот заблокирован и т.п.)
+    conn.execute(
+        """
+        CREATE TABLE IF NOT EXISTS undeliverable_chats (
+            chat_id INTEGER PRIMARY KEY,
+            reason TEXT,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+        """
+    )
+
+
+# Архив повторяет колонки заявки, чтобы UNION ALL по двум таблицам
+# возвращал строки одного вида. APPLICATION_COLUMNS — хранимые колонки (для
+# переноса в архив), ROW_COLUMNS — вместе с генерируемыми (для чтения).
+APPLICATION_COLUMNS = ", ".join(APPLICATION_FIELDS)
+ROW_COLUMNS = ", ".join(ROW_FIELDS)
+
+
+def _migration_archive(conn: sqlite3.Connection) -> None:
+    # рассмотренные заявки старше ARCHIVE_AFTER_DAYS переезжают сюда,
+    # чтобы горячая таблица и её индексы оставались маленькими
+    conn.execute(
+        """
+        CREATE TABLE IF NOT EXISTS applications_archive (
+            id INTEGER PRIMARY KEY,
+            user_id INTEGER NOT NULL,
+            chat_id INTEGER NOT NULL,
+            username TEXT,
+            full_name TEXT,
+            answers_json TEXT NOT NULL,
+            status TEXT NOT NULL,
+            created_at TIMESTAMP,
+            updated_at TIMESTAMP,
+            admin_comment TEXT,
+            synced_to_yonote INTEGER DEFAULT 0,
+            archived_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+        """
+    )
+    conn.execute(
+        "CREATE INDEX IF NOT EXISTS idx_archive_user_created "
+        "ON applications_archive (user_id, created_at DESC)"
+    )
+    conn.execute(
+        "CREATE INDEX IF NOT EXISTS idx_applications_decided "
+        "ON applications (updated_at) WHERE status != 'pending'"
+    )
+
+
+# Текст ответов анкеты для полнотекстового индекса: значения без ключей JSON.
+_ANSWERS_TEXT = "(SELECT group_concat(value, ' ') FROM json_each({}))"
+
+
+def _migration_search(conn: sqlite3.Connection) -> None:
+    # полнотекстовый индекс по имени, нику и ответам; rowid совпадает с id
+    # заявки, запись живёт и после переноса заявки в архив
+    conn.execute(
+        """
+        CREATE VIRTUAL TABLE IF NOT EXISTS applications_fts USING fts5(
+            full_name, username, answers,
+            tokenize = "unicode61 remove_diacritics 2 tokenchars '_'"
+        )
+        """
+    )
+    conn.execute(
+        f"""
+        CREATE TRIGGER IF NOT EXISTS applications_fts_insert AFTER INSERT ON applications
+        BEGIN
+            INSERT INTO applications_fts (rowid, full_name, username, answers)
+            VALUES (new.id, new.full_name, new.username, {_ANSWERS_TEXT.format("new.answers_json")});
+        END
+        """
+    )
+    # смена статуса индекс не трогает: триггер только на поля, которые в нём есть
+    conn.execute(
+        f"""
+        CREATE TRIGGER IF NOT EXISTS applications_fts_update
+        AFTER UPDATE OF full_name, username, answers_json ON applications
+        BEGIN
+            DELETE FROM applications_fts WHERE rowid = old.id;
+            INSERT INTO applications_fts (rowid, full_name, username, answers)
+            VALUES (new.id, new.full_name, new.username, {_ANSWERS_TEXT.format("new.answers_json")});
+        END
+        """
+    )
+    # при архивации строка сначала копируется в архив, потом удаляется из
+    # горячей таблицы — такую запись в индексе оставляем
+    conn.execute(
+        """
+        CREATE TRIGGER IF NOT EXISTS applications_fts_delete AFTER DELETE ON applications
+        WHEN NOT EXISTS (SELECT 1 FROM applications_archive WHERE id = old.id)
+        BEGIN
+            DELETE FROM applications_fts WHERE rowid = old.id;
+        END
+        """
+    )
+    conn.execute(
+        """
+        CREATE TRIGGER IF NOT EXISTS applications_archive_fts_delete
+        AFTER DELETE ON applications_archive
+        BEGIN
+            DELETE FROM applications_fts WHERE rowid = old.id;
+        END
+        """
+    )
+    # разовое заполнение индекса существующими заявками
+    for table in ("applications", "applications_archive"):
+        conn.execute(
+            f"""
+            INSERT INTO applications_fts (rowid, full_name, username, answers)
+            SELECT id, full_name, username, {_ANSWERS_TEXT.format("answers_json")}
+            FROM {table}
+            WHERE id NOT IN (SELECT rowid FROM applications_fts)
+            """
+        )
+
+
+# Должность из анкеты; у заявок без неё — пустая строка, чтобы ключ счётчика не был NULL.
+# До миграции 10 счётчики брали её из JSON, после — из генерируемой колонки job.
+_JOB = "COALESCE(json_extract({}.answers_json, '$.job'), '')"
+_JOB_COLUMN = "COALESCE({}.job, '')"
+_STATS_TRIGGERS = (
+    "applications_stats_insert",
+    "applications_stats_update",
+    "applications_stats_delete",
+    "applications_archive_stats_delete",
+)
+
+
+def _stats_change(row: str, delta: int, job: str) -> str:
+    return f"""
+        INSERT INTO application_stats (day, job, status, count)
+        VALUES (COALESCE(date({row}.created_at), ''), {job.format(row)}, {row}.status, {delta})
+        ON CONFLICT (day, job, status) DO UPDATE SET count = count + excluded.count;
+    """
+
+
+def _create_stats_triggers(conn: sqlite3.Connection, job: str) -> None:
+    """Триггеры счётчиков; ``job`` — шаблон выражения должности для строки old/new."""
+    conn.execute(
+        f"""
+        CREATE TRIGGER IF NOT EXISTS applications_stats_insert AFTER INSERT ON applications
+        BEGIN
+            {_stats_change("new", 1, job)}
+        END
+        """
+    )
+    conn.execute(
+        f"""
+        CREATE TRIGGER IF NOT EXISTS applications_stats_update
+        AFTER UPDATE OF status, answers_json, created_at ON applications
+        WHEN old.status IS NOT new.status
+          OR date(old.created_at) IS NOT date(new.created_at)
+          OR {job.format("old")} IS NOT {job.format("new")}
+        BEGIN
+            {_stats_change("old", -1, job)}
+            {_stats_change("new", 1, job)}
+        END
+        """
+    )
+    # архивация копирует строку перед удалением — такая заявка остаётся в счётчиках
+    conn.execute(
+        f"""
+        CREATE TRIGGER IF NOT EXISTS applications_stats_delete AFTER DELETE ON applications
+        WHEN NOT EXISTS (SELECT 1 FROM applications_archive WHERE id = old.id)
+        BEGIN
+            {_stats_change("old", -1, job)}
+        END
+        """
+    )
+    conn.execute(
+        f"""
+        CREATE TRIGGER IF NOT EXISTS applications_archive_stats_delete
+        AFTER DELETE ON applications_archive
+        BEGIN
+            {_stats_change("old", -1, job)}
+        END
+        """
+    )
+
+
+def _migration_stats(conn: sqlite3.Connection) -> None:
+    # счётчики заявок по дню подачи, должности и статусу: /stats читает их,
+    # а не всю таблицу; архивные заявки продолжают учитываться
+    conn.execute(
+        """
+        CREATE TABLE IF NOT EXISTS application_stats (
+            day TEXT NOT NULL,
+            job TEXT NOT NULL,
+            status TEXT NOT NULL,
+            count INTEGER NOT NULL,
+            PRIMARY KEY (day, job, status)
+        ) WITHOUT ROWID
+        """
+    )
+    _create_stats_triggers(conn, _JOB)
+    conn.execute("DELETE FROM application_stats")
+    conn.execute(
+        f"""
+        INSERT INTO application_stats (day, job, status, count)
+        SELECT COALESCE(date(created_at), ''), {_JOB.format("merged")}, status, COUNT(*)
+        FROM (
+            SELECT created_at, answers_json, status FROM applications
+            UNION ALL
+            SELECT created_at, answers_json, status FROM applications_archive
+        ) AS merged
+        GROUP BY 1, 2, 3
+        """
+    )
+
+
+def _migration_user_order(conn: sqlite3.Connection) -> None:
+    # при равном created_at более новой считается заявка с большим id —
+    # так же упорядочивают все движки хранилища
+    conn.execute("DROP INDEX IF EXISTS idx_applications_user_created")
+    conn.execute(
+        "CREATE INDEX idx_applications_user_created "
+        "ON applications (user_id, created_at DESC, id DESC)"
+    )
+    conn.execute("DROP INDEX IF EXISTS idx_archive_user_created")
+    conn.execute(
+        "CREATE INDEX idx_archive_user_created "
+        "ON applications_archive (user_id, created_at DESC, id DESC)"
+    )
+
+
+# Генерируемые колонки ответов анкеты (storage.ANSWER_FIELDS и age_years).
+# VIRTUAL: значения вычисляются из answers_json при чтении и хранятся только
+# в индексах, так что вставка и архивация их не пишут.
+_ANSWER_COLUMNS = [
+    (field, "TEXT", f"json_extract(answers_json, '$.{field}')") for field in ANSWER_FIELDS
+] + [("age_years", "INTEGER", "CAST(json_extract(answers_json, '$.age') AS INTEGER)")]
+
+
+def _migration_answer_columns(conn: sqlite3.Connection) -> None:
+    # фильтры /admin и счётчики /stats работают по колонкам с индексами,
+    # а не разбирают JSON каждой строки
+    for table in ("applications", "applications_archive"):
+        for name, type_, expression in _ANSWER_COLUMNS:
+            conn.execute(
+                f"ALTER TABLE {table} ADD COLUMN {name} {type_} "
+                f"GENERATED ALWAYS AS ({expression}) VIRTUAL"
+            )
+    # построение индексов заполняет их значениями для всех существующих заявок
+    conn.execute("CREATE INDEX idx_applications_job ON applications (job)")
+    conn.execute(
+        "CREATE INDEX idx_applications_pending_job "
+        "ON applications (job, created_at, id) WHERE status = 'pending'"
+    )
+    conn.execute(
+        "CREATE INDEX idx_applications_pending_age "
+        "ON applications (age_years) WHERE status = 'pending'"
+    )
+    for trigger in _STATS_TRIGGERS:
+        conn.execute(f"DROP TRIGGER IF EXISTS {trigger}")
+    _create_stats_triggers(conn, _JOB_COLUMN)
+
+
+def _migration_decided_at(conn: sqlite3.Connection) -> None:
+    # архивация шла по updated_at, который сдвигает и выгрузка в Yonote;
+    # для уже рассмотренных заявок лучшая оценка времени решения — updated_at
+    for table in ("applications", "applications_archive"):
+        conn.execute(f"ALTER TABLE {table} ADD COLUMN decided_at TIMESTAMP")
+        conn.execute(f"UPDATE {table} SET decided_at = updated_at WHERE status != 'pending'")
+    conn.execute("DROP INDEX IF EXISTS idx_applications_decided")
+    conn.execute(
+        "CREATE INDEX idx_applications_decided "
+        "ON applications (decided_at) WHERE status != 'pending'"
+    )
+
+
+# Порядковый номер миграции совпадает со значением PRAGMA user_version после неё.
+# Новые миграции добавляются только в конец списка.
+MIGRATIONS: List[Callable[[sqlite3.Connection], None]] = [
+    _migration_initial,
+    _migration_outbox,
+    _migration_hot_indexes,
+    _migration_bot_persistence,
+    _migration_undeliverable_chats,
+    _migration_archive,
+    _migration_search,
+    _migration_stats,
+    _migration_user_order,
+    _migration_answer_columns,
+    _migration_decided_at,
+]
+
+SCHEMA_VERSION = len(MIGRATIONS)
+
+
+def apply_migrations(conn: sqlite3.Connection) -> int:
+    """Доводит схему до последней версии; каждая миграция — отдельная транзакция."""
+    version = conn.execute("PRAGMA user_version").fetchone()[0]
+    if version > SCHEMA_VERSION:
+        raise RuntimeError(
+            f"Версия схемы базы ({version}) новее, чем поддерживает приложение ({SCHEMA_VERSION})"
+        )
+    for number, migration in enumerate(MIGRATIONS[version:], start=version + 1):
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            migration(conn)
+            conn.execute(f"PRAGMA user_version = {number}")
+        except Exception:
+            conn.rollback()
+            raise
+        conn.commit()
+    return SCHEMA_VERSION
+
+
+def fts_query(text: str) -> Optional[str]:
+    """Превращает ввод администратора в запрос FTS5.
+
+    Каждое слово берётся в кавычки (синтаксис FTS5 в запросе не действует,
+    ``t.me/nick`` ищется как фраза) и ищется по префиксу; слова объединяются
+    через AND. Если слов нет, возвращает None.
+    """
+    terms = ['"{}"*'.format(term.replace('"', '""')) for term in search_terms(text)]
+    return " ".join(terms) or None
+
+
+def _pending_filter(
+    after: Optional[Cursor],
+    before: Optional[Cursor],
+    job: Optional[str],
+    min_age: Optional[int],
+    max_age: Optional[int],
+) -> Tuple[str, List[Any], str]:
+    """Собирает условие WHERE для очереди на рассмотрение и направление сортировки."""
+    conditions = ["status = 'pending'"]
+    params: List[Any] = []
+    if after is not None:
+        conditions.append("(created_at, id) > (?, ?)")
+        params.extend(after)
+    if before is not None:
+        conditions.append("(created_at, id) < (?, ?)")
+        params.extend(before)
+    if job:
+        conditions.append("job = ?")
+        params.append(job)
+    if min_age is not None:
+        conditions.append("age_years >= ?")
+        params.append(min_age)
+    if max_age is not None:
+        conditions.append("age_years <= ?")
+        params.append(max_age)
+    # страницу «назад» читаем с конца, а затем разворачиваем
+    order = "DESC" if before is not None and after is None else "ASC"
+    return " AND ".join(conditions), params, order
+
+
+def _history_source(include_archive: bool) -> str:
+    """Источник истории автора: горячая таблица или она вместе с архивом."""
+    if not include_archive:
+        return "applications"
+    return f"""(
+        SELECT {ROW_COLUMNS} FROM applications
+        UNION ALL
+        SELECT {ROW_COLUMNS} FROM applications_archive
+    )"""
+
+
+def _group_history(
+    rows: List[sqlite3.Row], key: str, history_limit: int
+) -> List[Tuple[sqlite3.Row, List[sqlite3.Row]]]:
+    """Раскладывает плоский результат JOIN на пары (заявка, история автора)."""
+    grouped: List[Tuple[sqlite3.Row, List[sqlite3.Row]]] = []
+    current_id = None
+    target: Optional[sqlite3.Row] = None
+    history: List[sqlite3.Row] = []
+    for row in rows:
+        if row[key] != current_id:
+            if target is not None:
+                grouped.append((target, history))
+            current_id, target, history = row[key], None, []
+        if row["id"] == row[key]:
+            target = row
+        if row["history_rank"] <= history_limit:
+            history.append(row)
+    if target is not None:
+        grouped.append((target, history))
+    return grouped
 
 
 class ApplicationRepository:
-    def __init__(self, db_path: Path) -> None:
+    """Хранилище заявок: одно соединение-писатель и пул соединений для чтения.
+
+    База работает в режиме WAL, поэтому чтения не ждут, пока писатель
+    закончит транзакцию. Для ``:memory:`` пул не создаётся и чтения идут
+    через соединение писателя.
+    """
+
+    def __init__(
+        self,
+        db_path: Path,
+        read_pool_size: int = 4,
+        busy_timeout_ms: int = 5000,
+        synchronous: str = "NORMAL",
+    ) -> None:
+        if synchronous.upper() not in SYNCHRONOUS_MODES:
+            raise ValueError(f"Недопустимый режим synchronous: {synchronous}")
         self.db_path = db_path
-        self.db_path.parent.mkdir(parents=True, exist_ok=True)
+        self.in_memory = str(db_path) == ":memory:"
+        if not self.in_memory:
+            self.db_path.parent.mkdir(parents=True, exist_ok=True)
+        self.busy_timeout_ms = busy_timeout_ms
+        self.synchronous = synchronous.upper()
         self._lock = threading.Lock()
-        self._conn = sqlite3.connect(self.db_path, check_same_thread=False)
-        self._conn.row_factory = sqlite3.Row
+        self._conn = self._connect()
+        # действует только для новой базы (до первой таблицы); старые
+        # переводятся в этот режим через vacuum.py
+        self._conn.execute("PRAGMA auto_vacuum=INCREMENTAL")
+        if not self.in_memory:
+            self._conn.execute("PRAGMA journal_mode=WAL")
         self._ensure_schema()
+        self.read_pool_size = 0 if self.in_memory else max(1, read_pool_size)
+        self._readers: "queue.Queue[sqlite3.Connection]" = queue.Queue()
+        for _ in range(self.read_pool_size):
+            reader = self._connect()
+            reader.execute("PRAGMA query_only=ON")
+            self._readers.put(reader)
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(self.db_path, check_same_thread=False)
+        conn.row_factory = sqlite3.Row
+        conn.execute(f"PRAGMA busy_timeout={int(self.busy_timeout_ms)}")
+        conn.execute(f"PRAGMA synchronous={self.synchronous}")
+        return conn
+
+    @contextmanager
+    def _reading(self) -> Iterator[sqlite3.Connection]:
+        if not self.read_pool_size:
+            with self._lock:
+                yield self._conn
+            return
+        conn = self._readers.get()
+        try:
+            yield conn
+        finally:
+            self._readers.put(conn)
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
+        for _ in range(self.read_pool_size):
+            self._readers.get().close()
 
     def _ensure_schema(self) -> None:
         with self._lock:
-            self._conn.execute(
-                """
-                CREATE TABLE IF NOT EXISTS applications (
-                    id INTEGER PRIMARY KEY AUTOINCREMENT,
-                    user_id INTEGER NOT NULL,
-                    chat_id INTEGER NOT NULL,
-                    username TEXT,
-                    full_name TEXT,
-                    answers_json TEXT NOT NULL,
-                    status TEXT NOT NULL,
-                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                    admin_comment TEXT,
-                    synced_to_yonote INTEGER DEFAULT 0
-                );
-                """
-            )
-            # добавляем колонку при обновлении схемы на существующей базе
-            columns = {
-                row["name"]
-                for row in self._conn.execute("PRAGMA table_info(applications)")
-            }
-            if "synced_to_yonote" not in columns:
-                self._conn.execute(
-                    "ALTER TABLE applications ADD COLUMN synced_to_yonote INTEGER DEFAULT 0"
-                )
-            self._conn.commit()
+            apply_migrations(self._conn)
+
     def list_all(self) -> List[sqlite3.Row]:
-        with self._lock:
-            cursor = self._conn.execute(
-                "SELECT * FROM applications ORDER BY created_at ASC"
+        with self._reading() as conn:
+            cursor = conn.execute(
+                "SELECT * FROM applications ORDER BY created_at ASC, id ASC"
             )
             return cursor.fetchall()
+
+    def list_applications(
+        self,
+        *,
+        after_id: int = 0,
+        limit: int = 1000,
+        status: Optional[str] = None,
+        job: Optional[str] = None,
+        since: Optional[str] = None,
+        until: Optional[str] = None,
+        include_archive: bool = False,
+    ) -> List[sqlite3.Row]:
+        """Очередной кусок заявок с ``id > after_id`` по возрастанию id.
+
+        ``since`` и ``until`` сравниваются с ``created_at`` как строки:
+        ``since`` включительно, ``until`` — строго меньше. С
+        ``include_archive`` кусок собирается из обеих таблиц.
+        """
+        conditions = ["id > ?"]
+        params: List[Any] = [after_id]
+        if status:
+            conditions.append("status = ?")
+            params.append(status)
+        if job:
+            conditions.append("job = ?")
+            params.append(job)
+        if since:
+            conditions.append("created_at >= ?")
+            params.append(since)
+        if until:
+            conditions.append("created_at < ?")
+            params.append(until)
+        where = " AND ".join(conditions)
+        if include_archive:
+            sql = f"""
+                SELECT {ROW_COLUMNS} FROM applications WHERE {where}
+                UNION ALL
+                SELECT {ROW_COLUMNS} FROM applications_archive WHERE {where}
+                ORDER BY id ASC
+                LIMIT ?
+            """
+            params = params * 2
+        else:
+            sql = f"SELECT * FROM applications WHERE {where} ORDER BY id ASC LIMIT ?"
+        params.append(limit)
+        with self._reading() as conn:
+            return conn.execute(sql, params).fetchall()
+
+    def iter_applications(self, *, chunk_size: int = 1000, **filters: Any) -> Iterator[sqlite3.Row]:
+        """Потоково отдаёт заявки кусками по ``chunk_size`` (фильтры — как у list_applications)."""
+        after_id = 0
+        while True:
+            rows = self.list_applications(after_id=after_id, limit=chunk_size, **filters)
+            yield from rows
+            if len(rows) < chunk_size:
+                return
+            after_id = rows[-1]["id"]
+
     def save_application(
         self,
         user_id: int,
@@ -58,70 +643,417 @@ class ApplicationRepository:
         answers: Dict[str, Any],
     ) -> int:
         with self._lock:
-            cursor = self._conn.execute(
-                """
-                INSERT INTO applications (user_id, chat_id, username, full_name, answers_json, status)
-                VALUES (?, ?, ?, ?, ?, 'pending')
-                """,
-                (user_id, chat_id, username, full_name, json.dumps(answers, ensure_ascii=False)),
-            )
-            self._conn.commit()
-            return int(cursor.lastrowid)
+            try:
+                cursor = self._conn.execute(
+                    """
+                    INSERT INTO applications (user_id, chat_id, username, full_name, answers_json, status)
+                    VALUES (?, ?, ?, ?, ?, 'pending')
+                    """,
+                    (user_id, chat_id, username, full_name, json.dumps(answers, ensure_ascii=False)),
+                )
+                app_id = int(cursor.lastrowid)
+                self._conn.execute(
+                    "INSERT INTO yonote_outbox (application_id) VALUES (?)",
+                    (app_id,),
+                )
+                # пользователь снова пишет боту — значит, чат опять доступен
+                self._conn.execute("DELETE FROM undeliverable_chats WHERE chat_id = ?", (chat_id,))
+                self._conn.commit()
+            except Exception:
+                self._conn.rollback()
+                raise
+            return app_id
 
-    def list_pending(self, limit: int = 10) -> List[sqlite3.Row]:
-        with self._lock:
-            cursor = self._conn.execute(
-                """
+    def list_pending(
+        self,
+        limit: int = 10,
+        *,
+        after: Optional[Cursor] = None,
+        before: Optional[Cursor] = None,
+        job: Optional[str] = None,
+        min_age: Optional[int] = None,
+        max_age: Optional[int] = None,
+    ) -> List[sqlite3.Row]:
+        """Страница заявок на рассмотрении в порядке подачи.
+
+        Пагинация keyset по паре ``(created_at, id)``: ``after`` — курсор
+        последней заявки предыдущей страницы, ``before`` — первой заявки
+        следующей. Результат всегда упорядочен от старых к новым.
+        """
+        where, params, order = _pending_filter(after, before, job, min_age, max_age)
+        with self._reading() as conn:
+            cursor = conn.execute(
+                f"""
                 SELECT * FROM applications
-                WHERE status = 'pending'
-                ORDER BY created_at ASC
+                WHERE {where}
+                ORDER BY created_at {order}, id {order}
                 LIMIT ?
                 """,
-                (limit,),
+                (*params, limit),
             )
-            return cursor.fetchall()
+            rows = cursor.fetchall()
+        return rows[::-1] if order == "DESC" else rows
+
+    def search(self, text: str, limit: int = 10, offset: int = 0) -> List[sqlite3.Row]:
+        """Полнотекстовый поиск по имени, нику и ответам, включая архив.
+
+        Результаты упорядочены по релевантности (совпадения в имени и нике
+        весят больше); у каждой строки есть колонка ``snippet`` с найденным
+        фрагментом. Запрос FTS5 строится из ``text`` функцией :func:`fts_query`.
+        """
+        query = fts_query(text)
+        if query is None:
+            return []
+        with self._reading() as conn:
+            return conn.execute(
+                f"""
+                WITH hits AS (
+                    SELECT rowid, snippet(applications_fts, -1, '[', ']', '…', 10) AS snippet,
+                           bm25(applications_fts, 5.0, 5.0, 1.0) AS score
+                    FROM applications_fts
+                    WHERE applications_fts MATCH ?
+                    ORDER BY score
+                    LIMIT ? OFFSET ?
+                )
+                SELECT a.*, hits.snippet
+                FROM hits
+                JOIN (
+                    SELECT {ROW_COLUMNS} FROM applications
+                    UNION ALL
+                    SELECT {ROW_COLUMNS} FROM applications_archive
+                ) AS a ON a.id = hits.rowid
+                ORDER BY hits.score
+                """,
+                (query, limit, offset),
+            ).fetchall()
+
+    def get_stats(self, days: int = 7) -> Dict[str, Any]:
+        """Сводка по заявкам из счётчиков ``application_stats``, включая архив.
+
+        ``by_status`` — {статус: число}, ``by_job`` — {должность: {статус:
+        число}}, ``daily`` — [(день, поданных заявок)] за последние ``days``
+        дней. Таблицу заявок не читает: счётчики ведут триггеры.
+        """
+        with self._reading() as conn:
+            totals = conn.execute(
+                "SELECT job, status, SUM(count) AS count FROM application_stats GROUP BY job, status"
+            ).fetchall()
+            daily = conn.execute(
+                """
+                SELECT day, SUM(count) AS count FROM application_stats
+                WHERE day >= date('now', ?)
+                GROUP BY day
+                HAVING SUM(count) > 0
+                ORDER BY day
+                """,
+                (f"-{max(0, days - 1)} days",),
+            ).fetchall()
+        by_status: Dict[str, int] = {}
+        by_job: Dict[str, Dict[str, int]] = {}
+        for row in totals:
+            if not row["count"]:
+                continue
+            by_status[row["status"]] = by_status.get(row["status"], 0) + row["count"]
+            by_job.setdefault(row["job"], {})[row["status"]] = row["count"]
+        return {
+            "by_status": by_status,
+            "by_job": by_job,
+            "daily": [(row["day"], row["count"]) for row in daily],
+        }
 
     def get_by_id(self, app_id: int) -> Optional[sqlite3.Row]:
-        with self._lock:
-            cursor = self._conn.execute("SELECT * FROM applications WHERE id = ?", (app_id,))
+        with self._reading() as conn:
+            cursor = conn.execute("SELECT * FROM applications WHERE id = ?", (app_id,))
             return cursor.fetchone()
 
     def get_last_for_user(self, user_id: int) -> Optional[sqlite3.Row]:
-        with self._lock:
-            cursor = self._conn.execute(
+        """Последняя заявка пользователя, в том числе уже ушедшая в архив."""
+        with self._reading() as conn:
+            row = conn.execute(
                 """
                 SELECT * FROM applications
                 WHERE user_id = ?
-                ORDER BY created_at DESC
+                ORDER BY created_at DESC, id DESC
                 LIMIT 1
                 """,
                 (user_id,),
-            )
-            return cursor.fetchone()
-    def list_by_user(self, user_id: int) -> List[sqlite3.Row]:
-        with self._lock:
-            cursor = self._conn.execute(
-                """
+            ).fetchone()
+            if row is not None:
+                return row
+            # в архив попадают только старые заявки, поэтому туда смотрим,
+            # лишь если в горячей таблице у пользователя ничего нет
+            return conn.execute(
+                f"""
+                SELECT {ROW_COLUMNS} FROM applications_archive
+                WHERE user_id = ?
+                ORDER BY created_at DESC, id DESC
+                LIMIT 1
+                """,
+                (user_id,),
+            ).fetchone()
+
+    def list_by_user(
+        self, user_id: int, limit: Optional[int] = None, include_archive: bool = False
+    ) -> List[sqlite3.Row]:
+        """Заявки пользователя от новых к старым; с ``include_archive`` — вместе с архивом."""
+        if include_archive:
+            sql = f"""
+                SELECT {ROW_COLUMNS} FROM applications WHERE user_id = ?
+                UNION ALL
+                SELECT {ROW_COLUMNS} FROM applications_archive WHERE user_id = ?
+                ORDER BY created_at DESC, id DESC
+                LIMIT ?
+            """
+            params: Tuple[Any, ...] = (user_id, user_id, -1 if limit is None else limit)
+        else:
+            sql = """
                 SELECT *
                 FROM applications
                 WHERE user_id = ?
-                ORDER BY created_at DESC
+                ORDER BY created_at DESC, id DESC
+                LIMIT ?
+            """
+            params = (user_id, -1 if limit is None else limit)
+        with self._reading() as conn:
+            return conn.execute(sql, params).fetchall()
+
+    def list_pending_with_history(
+        self,
+        limit: int = 10,
+        history_limit: int = 5,
+        *,
+        after: Optional[Cursor] = None,
+        before: Optional[Cursor] = None,
+        job: Optional[str] = None,
+        min_age: Optional[int] = None,
+        max_age: Optional[int] = None,
+        include_archive: bool = False,
+    ) -> List[Tuple[sqlite3.Row, List[sqlite3.Row]]]:
+        """Возвращает заявки на рассмотрении вместе с последними заявками их авторов.
+
+        Один запрос вместо ``1 + limit``: история ограничивается оконной
+        функцией прямо в SQL. Фильтры и курсоры — как у :meth:`list_pending`;
+        с ``include_archive`` в историю попадают и архивные заявки.
+        """
+        where, params, order = _pending_filter(after, before, job, min_age, max_age)
+        history_source = _history_source(include_archive)
+        with self._reading() as conn:
+            rows = conn.execute(
+                f"""
+                WITH pending AS (
+                    SELECT id, user_id, created_at
+                    FROM applications
+                    WHERE {where}
+                    ORDER BY created_at {order}, id {order}
+                    LIMIT ?
+                ),
+                history AS (
+                    SELECT h.*,
+                           ROW_NUMBER() OVER (
+                               PARTITION BY h.user_id ORDER BY h.created_at DESC, h.id DESC
+                           ) AS history_rank
+                    FROM {history_source} h
+                    WHERE h.user_id IN (SELECT user_id FROM pending)
+                )
+                SELECT p.id AS pending_id, history.*
+                FROM pending p
+                JOIN history ON history.user_id = p.user_id
+                WHERE history.history_rank <= ? OR history.id = p.id
+                ORDER BY p.created_at ASC, p.id ASC, history.history_rank ASC
                 """,
-                (user_id,),
-            )
-            return cursor.fetchall()
+                (*params, limit, history_limit),
+            ).fetchall()
+        return _group_history(rows, "pending_id", history_limit)
+
+    def get_with_history(
+        self, app_id: int, history_limit: int = 5, include_archive: bool = False
+    ) -> Optional[Tuple[sqlite3.Row, List[sqlite3.Row]]]:
+        """Возвращает заявку и последние заявки её автора одним запросом."""
+        history_source = _history_source(include_archive)
+        with self._reading() as conn:
+            rows = conn.execute(
+                f"""
+                WITH history AS (
+                    SELECT h.*,
+                           ROW_NUMBER() OVER (
+                               PARTITION BY h.user_id ORDER BY h.created_at DESC, h.id DESC
+                           ) AS history_rank
+                    FROM {history_source} h
+                    WHERE h.user_id = (SELECT user_id FROM applications WHERE id = ?)
+                )
+                SELECT ? AS target_id, history.*
+                FROM history
+                WHERE history.history_rank <= ? OR history.id = ?
+                ORDER BY history.history_rank ASC
+                """,
+                (app_id, app_id, history_limit, app_id),
+            ).fetchall()
+        grouped = _group_history(rows, "target_id", history_limit)
+        return grouped[0] if grouped else None
 
-    def update_status(self, app_id: int, status: str, admin_comment: Optional[str] = None) -> None:
+    def update_status(
+        self, app_id: int, status: str, admin_comment: Optional[str] = None
+    ) -> Optional[int]:
+        """Меняет статус заявки; возвращает ``user_id`` автора или None, если заявки нет."""
         with self._lock:
-            self._conn.execute(
+            row = self._conn.execute(
                 """
                 UPDATE applications
-                SET status = ?, admin_comment = ?, updated_at = CURRENT_TIMESTAMP
+                SET status = ?, admin_comment = ?, updated_at = CURRENT_TIMESTAMP,
+                    decided_at = CURRENT_TIMESTAMP
                 WHERE id = ?
+                RETURNING user_id
                 """,
                 (status, admin_comment, app_id),
-            )
+            ).fetchone()
+            self._conn.commit()
+            return row["user_id"] if row else None
+
+    def transition_status(
+        self,
+        app_id: int,
+        status: str,
+        admin_comment: Optional[str] = None,
+        expected: str = "pending",
+    ) -> Optional[sqlite3.Row]:
+        """Атомарно переводит заявку из ``expected`` в ``status``.
+
+        Проверка и запись — один UPDATE, поэтому из двух одновременных
+        решений по одной заявке выигрывает ровно одно. Возвращает
+        обновлённую строку или None, если заявки нет или её уже рассмотрели.
+        """
+        with self._lock:
+            row = self._conn.execute(
+                """
+                UPDATE applications
+                SET status = ?, admin_comment = ?, updated_at = CURRENT_TIMESTAMP,
+                    decided_at = CURRENT_TIMESTAMP
+                WHERE id = ? AND status = ?
+                RETURNING *
+                """,
+                (status, admin_comment, app_id, expected),
+            ).fetchone()
             self._conn.commit()
+            return row
+
+    def bulk_update_status(
+        self,
+        status: str,
+        *,
+        ids: Optional[List[int]] = None,
+        job: Optional[str] = None,
+        min_age: Optional[int] = None,
+        max_age: Optional[int] = None,
+    ) -> List[sqlite3.Row]:
+        """Переводит в ``status`` все подходящие заявки на рассмотрении одной транзакцией.
+
+        Выбор — по списку ``ids`` и/или по тем же фильтрам, что у очереди /admin.
+        Возвращает изменённые заявки (уже рассмотренные не трогаются).
+        """
+        where, params, _ = _pending_filter(None, None, job, min_age, max_age)
+        if ids is not None:
+            if not ids:
+                return []
+            where += f" AND id IN ({', '.join('?' * len(ids))})"
+            params.extend(ids)
+        with self._lock:
+            try:
+                self._conn.execute("BEGIN IMMEDIATE")
+                rows = self._conn.execute(
+                    f"SELECT * FROM applications WHERE {where} ORDER BY created_at ASC, id ASC",
+                    params,
+                ).fetchall()
+                self._conn.executemany(
+                    """
+                    UPDATE applications
+                    SET status = ?, updated_at = CURRENT_TIMESTAMP, decided_at = CURRENT_TIMESTAMP
+                    WHERE id = ? AND status = 'pending'
+                    """,
+                    [(status, row["id"]) for row in rows],
+                )
+                self._conn.commit()
+            except Exception:
+                self._conn.rollback()
+                raise
+        return rows
+
+    def archive_decided(self, older_than: str, batch_size: int = 500) -> int:
+        """Переносит в архив рассмотренные заявки, решение по которым старше ``older_than``.
+
+        Работает пачками по ``batch_size``, каждая — своя короткая транзакция,
+        так что бот между пачками продолжает писать. Заявки, ещё не
+        выгруженные в Yonote (с записью в outbox или без неё, как старые
+        строки до outbox), не трогаются: их должен найти ``resync.py``.
+        Возвращает число перенесённых заявок.
+        """
+        placeholders = ", ".join("?" * len(DECIDED_STATUSES))
+        select_ids = f"""
+            SELECT id FROM applications
+            WHERE status IN ({placeholders}) AND decided_at < ? AND synced_to_yonote = 1
+              AND NOT EXISTS (SELECT 1 FROM yonote_outbox o WHERE o.application_id = applications.id)
+            ORDER BY id
+            LIMIT ?
+        """
+        moved = 0
+        while True:
+            with self._lock:
+                try:
+                    self._conn.execute("BEGIN IMMEDIATE")
+                    ids = [
+                        row[0]
+                        for row in self._conn.execute(
+                            select_ids, (*DECIDED_STATUSES, older_than, batch_size)
+                        )
+                    ]
+                    if ids:
+                        id_list = ", ".join("?" * len(ids))
+                        self._conn.execute(
+                            f"""
+                            INSERT INTO applications_archive ({APPLICATION_COLUMNS})
+                            SELECT {APPLICATION_COLUMNS} FROM applications WHERE id IN ({id_list})
+                            """,
+                            ids,
+                        )
+                        self._conn.execute(f"DELETE FROM applications WHERE id IN ({id_list})", ids)
+                    self._conn.commit()
+                except Exception:
+                    self._conn.rollback()
+                    raise
+            moved += len(ids)
+            if len(ids) < batch_size:
+                return moved
+
+    def vacuum(self, pages: int = 0) -> int:
+        """Возвращает файлу свободные страницы через incremental vacuum.
+
+        ``pages == 0`` — все свободные страницы. Для базы, созданной до
+        включения auto_vacuum, ничего не делает: её один раз переводят
+        в режим INCREMENTAL через ``vacuum.py``. Возвращает число
+        освобождённых страниц.
+        """
+        with self._lock:
+            if self._conn.execute("PRAGMA auto_vacuum").fetchone()[0] != 2:
+                return 0
+            before = self._conn.execute("PRAGMA freelist_count").fetchone()[0]
+            # execute() делает один шаг прагмы и освобождает одну страницу,
+            # executescript() доводит её до конца
+            self._conn.executescript(f"PRAGMA incremental_vacuum({int(pages)})")
+            after = self._conn.execute("PRAGMA freelist_count").fetchone()[0]
+        return max(0, before - after)
+
+    def enable_incremental_vacuum(self) -> bool:
+        """Переводит старую базу в режим auto_vacuum=INCREMENTAL.
+
+        Смена режима требует полного VACUUM: он переписывает весь файл и всё
+        это время держит запись, поэтому вызывается только явно, при
+        остановленном боте. Возвращает False, если база уже в этом режиме.
+        """
+        with self._lock:
+            if self._conn.execute("PRAGMA auto_vacuum").fetchone()[0] == 2:
+                return False
+            self._conn.execute("PRAGMA auto_vacuum=INCREMENTAL")
+            self._conn.execute("VACUUM")
+        return True
 
     def mark_synced(self, app_id: int) -> None:
         with self._lock:
@@ -133,5 +1065,443 @@ class ApplicationRepository:
                 """,
                 (app_id,),
             )
+            self._conn.execute(
+                "DELETE FROM yonote_outbox WHERE application_id = ?",
+                (app_id,),
+            )
+            self._conn.commit()
+
+    def mark_synced_many(self, app_ids: List[int]) -> None:
+        """Помечает пачку заявок выгруженными одной транзакцией."""
+        if not app_ids:
+            return
+        params = [(app_id,) for app_id in app_ids]
+        with self._lock:
+            try:
+                self._conn.executemany(
+                    """
+                    UPDATE applications
+                    SET synced_to_yonote = 1, updated_at = CURRENT_TIMESTAMP
+                    WHERE id = ?
+                    """,
+                    params,
+                )
+                self._conn.executemany("DELETE FROM yonote_outbox WHERE application_id = ?", params)
+                self._conn.commit()
+            except Exception:
+                self._conn.rollback()
+                raise
+
+    def list_unsynced(
+        self,
+        *,
+        after_id: int = 0,
+        since: Optional[str] = None,
+        include_queued: bool = False,
+        limit: int = 500,
+    ) -> List[sqlite3.Row]:
+        """Очередной кусок невыгруженных заявок с ``id > after_id`` по возрастанию id.
+
+        Keyset-курсор по id идёт по частичному индексу idx_applications_unsynced.
+        Заявки, которые ещё ждут outbox-воркер, пропускаются, если не задан
+        ``include_queued``.
+        """
+        conditions = ["synced_to_yonote = 0", "id > ?"]
+        params: List[Any] = [after_id]
+        if since is not None:
+            conditions.append("created_at >= ?")
+            params.append(since)
+        if not include_queued:
+            conditions.append(
+                "NOT EXISTS (SELECT 1 FROM yonote_outbox o "
+                "WHERE o.application_id = applications.id AND o.status = 'pending')"
+            )
+        params.append(limit)
+        with self._reading() as conn:
+            return conn.execute(
+                f"SELECT * FROM applications WHERE {' AND '.join(conditions)} "
+                "ORDER BY id ASC LIMIT ?",
+                params,
+            ).fetchall()
+
+    def iter_unsynced(self, *, chunk_size: int = 500, **filters: Any) -> Iterator[sqlite3.Row]:
+        """Потоково отдаёт невыгруженные заявки кусками по ``chunk_size``.
+
+        Между кусками транзакция чтения не удерживается, вся выборка
+        в памяти не собирается.
+        """
+        after_id = filters.pop("after_id", 0)
+        while True:
+            rows = self.list_unsynced(after_id=after_id, limit=chunk_size, **filters)
+            yield from rows
+            if len(rows) < chunk_size:
+                return
+            after_id = rows[-1]["id"]
+
+    def claim_outbox(self, limit: int, lease: float = 300.0) -> List[sqlite3.Row]:
+        """Забирает готовые к отправке записи outbox и откладывает их на время аренды.
+
+        Если воркер упадёт посреди обработки, записи снова станут доступны
+        после истечения ``lease`` секунд.
+        """
+        now = time.time()
+        with self._lock:
+            rows = self._conn.execute(
+                """
+                SELECT o.id AS outbox_id, o.attempts, a.*
+                FROM yonote_outbox o
+                JOIN applications a ON a.id = o.application_id
+                WHERE o.status = 'pending' AND o.next_attempt_at <= ?
+                ORDER BY o.next_attempt_at ASC, o.id ASC
+                LIMIT ?
+                """,
+                (now, limit),
+            ).fetchall()
+            if rows:
+                self._conn.executemany(
+                    "UPDATE yonote_outbox SET next_attempt_at = ? WHERE id = ?",
+                    [(now + lease, row["outbox_id"]) for row in rows],
+                )
+                self._conn.commit()
+            return rows
+
+    def retry_outbox(self, outbox_id: int, delay: float, error: str) -> None:
+        with self._lock:
+            self._conn.execute(
+                """
+                UPDATE yonote_outbox
+                SET attempts = attempts + 1, next_attempt_at = ?, last_error = ?
+                WHERE id = ?
+                """,
+                (time.time() + delay, error, outbox_id),
+            )
+            self._conn.commit()
+
+    def defer_outbox(self, outbox_id: int, delay: float) -> None:
+        """Откладывает запись без увеличения счётчика попыток."""
+        with self._lock:
+            self._conn.execute(
+                "UPDATE yonote_outbox SET next_attempt_at = ? WHERE id = ?",
+                (time.time() + delay, outbox_id),
+            )
+            self._conn.commit()
+
+    def dead_letter_outbox(self, outbox_id: int, error: str) -> None:
+        with self._lock:
+            self._conn.execute(
+                """
+                UPDATE yonote_outbox
+                SET status = 'dead', attempts = attempts + 1, last_error = ?
+                WHERE id = ?
+                """,
+                (error, outbox_id),
+            )
+            self._conn.commit()
+
+    def list_outbox(self, status: Optional[str] = None) -> List[sqlite3.Row]:
+        with self._reading() as conn:
+            if status is None:
+                cursor = conn.execute("SELECT * FROM yonote_outbox ORDER BY id ASC")
+            else:
+                cursor = conn.execute(
+                    "SELECT * FROM yonote_outbox WHERE status = ? ORDER BY id ASC",
+                    (status,),
+                )
+            return cursor.fetchall()
+
+    def mark_undeliverable(self, chat_id: int, reason: str) -> None:
+        with self._lock:
+            self._conn.execute(
+                """
+                INSERT INTO undeliverable_chats (chat_id, reason) VALUES (?, ?)
+                ON CONFLICT(chat_id) DO UPDATE SET reason = excluded.reason
+                """,
+                (chat_id, reason),
+            )
+            self._conn.commit()
+
+    def list_undeliverable(self) -> List[int]:
+        with self._reading() as conn:
+            return [row[0] for row in conn.execute("SELECT chat_id FROM undeliverable_chats")]
+
+    def load_user_data(self) -> Dict[int, Dict[str, Any]]:
+        with self._reading() as conn:
+            rows = conn.execute("SELECT user_id, data FROM bot_user_data").fetchall()
+        return {row["user_id"]: json.loads(row["data"]) for row in rows}
+
+    def load_conversations(self, name: str) -> Dict[Tuple[Any, ...], Any]:
+        with self._reading() as conn:
+            rows = conn.execute(
+                "SELECT key, state FROM bot_conversations WHERE name = ?", (name,)
+            ).fetchall()
+        return {tuple(json.loads(row["key"])): json.loads(row["state"]) for row in rows}
+
+    def save_persistence(
+        self,
+        user_data: Dict[int, Optional[Dict[str, Any]]],
+        conversations: Dict[Tuple[str, Tuple[Any, ...]], Any],
+    ) -> None:
+        """Записывает накопленные изменения состояния бота одной транзакцией.
+
+        ``None`` в ``user_data`` и в ``conversations`` означает удаление записи.
+        """
+        now = time.time()
+        upsert_users = [
+            (user_id, json.dumps(data, ensure_ascii=False), now)
+            for user_id, data in user_data.items()
+            if data is not None
+        ]
+        drop_users = [(user_id,) for user_id, data in user_data.items() if data is None]
+        upsert_states = [
+            (name, json.dumps(list(key)), json.dumps(state), now)
+            for (name, key), state in conversations.items()
+            if state is not None
+        ]
+        drop_states = [
+            (name, json.dumps(list(key)))
+            for (name, key), state in conversations.items()
+            if state is None
+        ]
+        with self._lock:
+            try:
+                self._conn.executemany(
+                    """
+                    INSERT INTO bot_user_data (user_id, data, updated_at) VALUES (?, ?, ?)
+                    ON CONFLICT(user_id) DO UPDATE SET data = excluded.data, updated_at = excluded.updated_at
+                    """,
+                    upsert_users,
+                )
+                self._conn.executemany("DELETE FROM bot_user_data WHERE user_id = ?", drop_users)
+                self._conn.executemany(
+                    """
+                    INSERT INTO bot_conversations (name, key, state, updated_at) VALUES (?, ?, ?, ?)
+                    ON CONFLICT(name, key) DO UPDATE SET state = excluded.state, updated_at = excluded.updated_at
+                    """,
+                    upsert_states,
+                )
+                self._conn.executemany(
+                    "DELETE FROM bot_conversations WHERE name = ? AND key = ?", drop_states
+                )
+                self._conn.commit()
+            except Exception:
+                self._conn.rollback()
+                raise
+
+    def evict_persistence(self, older_than: float) -> int:
+        """Удаляет состояние пользователей, не обновлявшееся с ``older_than`` (unix time)."""
+        with self._lock:
+            users = self._conn.execute(
+                "DELETE FROM bot_user_data WHERE updated_at < ?", (older_than,)
+            ).rowcount
+            states = self._conn.execute(
+                "DELETE FROM bot_conversations WHERE updated_at < ?", (older_than,)
+            ).rowcount
             self._conn.commit()
+        return users + states
+
+
+def _timed(fn: Callable[..., T], *args: Any, **kwargs: Any) -> Callable[[], T]:
+    """Оборачивает вызов метода репозитория замером времени (без ожидания в очереди пула)."""
+
+    def call() -> T:
+        started = time.perf_counter()
+        try:
+            return fn(*args, **kwargs)
+        finally:
+            observe_db(fn.__name__, time.perf_counter() - started)
+
+    return call
+
+
+class AsyncApplicationRepository(Repository):
+    """Асинхронный доступ к :class:`ApplicationRepository` без блокировки event loop.
+
+    Записи выполняются в единственном потоке-писателе, чтения — в пуле
+    потоков по числу соединений для чтения, так что чтения не стоят в
+    очереди за записями.
+    """
+
+    def __init__(
+        self,
+        repo: ApplicationRepository,
+        status_cache_size: int = 10000,
+        status_cache_ttl: float = 60.0,
+    ) -> None:
+        self.sync = repo
+        # последняя заявка пользователя: её спрашивают /start и /status
+        self.status_cache = TTLCache(status_cache_size, status_cache_ttl)
+        self._writer = ThreadPoolExecutor(max_workers=1, thread_name_prefix="db-writer")
+        self._readers = ThreadPoolExecutor(
+            max_workers=max(1, repo.read_pool_size), thread_name_prefix="db-reader"
+        )
+
+    @classmethod
+    def open(
+        cls,
+        db_path: Path,
+        *,
+        status_cache_size: int = 10000,
+        status_cache_ttl: float = 60.0,
+        **kwargs: Any,
+    ) -> "AsyncApplicationRepository":
+        return cls(ApplicationRepository(db_path, **kwargs), status_cache_size, status_cache_ttl)
+
+    async def _read(self, fn: Callable[..., T], *args: Any, **kwargs: Any) -> T:
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._readers, _timed(fn, *args, **kwargs))
+
+    async def _write(self, fn: Callable[..., T], *args: Any, **kwargs: Any) -> T:
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._writer, _timed(fn, *args, **kwargs))
+
+    async def close(self) -> None:
+        self._readers.shutdown(wait=True)
+        self._writer.shutdown(wait=True)
+        self.sync.close()
+
+    async def list_all(self) -> List[sqlite3.Row]:
+        return await self._read(self.sync.list_all)
+
+    async def list_applications(self, **filters: Any) -> List[sqlite3.Row]:
+        return await self._read(self.sync.list_applications, **filters)
+
+    async def save_application(
+        self,
+        user_id: int,
+        chat_id: int,
+        username: Optional[str],
+        full_name: Optional[str],
+        answers: Dict[str, Any],
+    ) -> int:
+        try:
+            return await self._write(
+                self.sync.save_application, user_id, chat_id, username, full_name, answers
+            )
+        finally:
+            self.status_cache.invalidate(user_id)
+
+    async def list_pending(self, limit: int = 10, **filters: Any) -> List[sqlite3.Row]:
+        return await self._read(self.sync.list_pending, limit, **filters)
+
+    async def search(self, text: str, limit: int = 10, offset: int = 0) -> List[sqlite3.Row]:
+        return await self._read(self.sync.search, text, limit, offset)
+
+    async def get_stats(self, days: int = 7) -> Dict[str, Any]:
+        return await self._read(self.sync.get_stats, days)
+
+    def cache_stats(self) -> Optional[Dict[str, Any]]:
+        return self.status_cache.stats()
+
+    async def get_by_id(self, app_id: int) -> Optional[sqlite3.Row]:
+        return await self._read(self.sync.get_by_id, app_id)
+
+    async def get_last_for_user(self, user_id: int) -> Optional[sqlite3.Row]:
+        cached = self.status_cache.get(user_id)
+        status_cache_lookup(cached is not MISSING)
+        if cached is not MISSING:
+            return cached
+        epoch = self.status_cache.epoch
+        row = await self._read(self.sync.get_last_for_user, user_id)
+        self.status_cache.set_if_epoch(user_id, row, epoch)
+        return row
+
+    async def list_by_user(
+        self, user_id: int, limit: Optional[int] = None, include_archive: bool = False
+    ) -> List[sqlite3.Row]:
+        return await self._read(self.sync.list_by_user, user_id, limit, include_archive)
+
+    async def list_pending_with_history(
+        self, limit: int = 10, history_limit: int = 5, **filters: Any
+    ) -> List[Tuple[sqlite3.Row, List[sqlite3.Row]]]:
+        return await self._read(
+            self.sync.list_pending_with_history, limit, history_limit, **filters
+        )
+
+    async def get_with_history(
+        self, app_id: int, history_limit: int = 5, include_archive: bool = False
+    ) -> Optional[Tuple[sqlite3.Row, List[sqlite3.Row]]]:
+        return await self._read(self.sync.get_with_history, app_id, history_limit, include_archive)
+
+    async def update_status(
+        self, app_id: int, status: str, admin_comment: Optional[str] = None
+    ) -> Optional[int]:
+        user_id = await self._write(self.sync.update_status, app_id, status, admin_comment)
+        if user_id is not None:
+            self.status_cache.invalidate(user_id)
+        return user_id
+
+    async def transition_status(
+        self,
+        app_id: int,
+        status: str,
+        admin_comment: Optional[str] = None,
+        expected: str = "pending",
+    ) -> Optional[sqlite3.Row]:
+        row = await self._write(
+            self.sync.transition_status, app_id, status, admin_comment, expected
+        )
+        if row is not None:
+            self.status_cache.invalidate(row["user_id"])
+        return row
+
+    async def bulk_update_status(self, status: str, **selection: Any) -> List[sqlite3.Row]:
+        rows = await self._write(self.sync.bulk_update_status, status, **selection)
+        for row in rows:
+            self.status_cache.invalidate(row["user_id"])
+        return rows
+
+    async def archive_decided(self, older_than: str, batch_size: int = 500) -> int:
+        moved = await self._write(self.sync.archive_decided, older_than, batch_size)
+        if moved:
+            # строки остались теми же, но лежат уже в другой таблице
+            self.status_cache.clear()
+        return moved
+
+    async def vacuum(self, pages: int = 0) -> int:
+        return await self._write(self.sync.vacuum, pages)
+
+    async def mark_synced(self, app_id: int) -> None:
+        await self._write(self.sync.mark_synced, app_id)
+
+    async def list_unsynced(self, **filters: Any) -> List[sqlite3.Row]:
+        return await self._read(self.sync.list_unsynced, **filters)
+
+    async def mark_synced_many(self, app_ids: List[int]) -> None:
+        await self._write(self.sync.mark_synced_many, app_ids)
+
+    async def claim_outbox(self, limit: int, lease: float = 300.0) -> List[sqlite3.Row]:
+        return await self._write(self.sync.claim_outbox, limit, lease)
+
+    async def retry_outbox(self, outbox_id: int, delay: float, error: str) -> None:
+        await self._write(self.sync.retry_outbox, outbox_id, delay, error)
+
+    async def defer_outbox(self, outbox_id: int, delay: float) -> None:
+        await self._write(self.sync.defer_outbox, outbox_id, delay)
+
+    async def dead_letter_outbox(self, outbox_id: int, error: str) -> None:
+        await self._write(self.sync.dead_letter_outbox, outbox_id, error)
+
+    async def list_outbox(self, status: Optional[str] = None) -> List[sqlite3.Row]:
+        return await self._read(self.sync.list_outbox, status)
+
+    async def mark_undeliverable(self, chat_id: int, reason: str) -> None:
+        await self._write(self.sync.mark_undeliverable, chat_id, reason)
+
+    async def list_undeliverable(self) -> List[int]:
+        return await self._read(self.sync.list_undeliverable)
+
+    async def load_user_data(self) -> Dict[int, Dict[str, Any]]:
+        return await self._read(self.sync.load_user_data)
+
+    async def load_conversations(self, name: str) -> Dict[Tuple[Any, ...], Any]:
+        return await self._read(self.sync.load_conversations, name)
+
+    async def save_persistence(
+        self,
+        user_data: Dict[int, Optional[Dict[str, Any]]],
+        conversations: Dict[Tuple[str, Tuple[Any, ...]], Any],
+    ) -> None:
+        await self._write(self.sync.save_persistence, user_data, conversations)
 
+    async def evict_persistence(self, older_than: float) -> int:
+        return await self._write(self.sync.evict_persistence, older_than)
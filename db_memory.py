@@ -0,0 +1,584 @@
+"""Хранилище заявок в памяти процесса.
+
+Для тестов и нагрузочных прогонов: ни диска, ни потоков, все операции
+выполняются прямо в event loop. Выборки, которые SQLite делает по
+индексам, здесь тоже идут по индексам — словарям и отсортированным
+спискам ключей, а не перебором всех заявок. Данные живут, пока жив объект.
+"""
+
+import bisect
+import heapq
+import json
+import time
+from datetime import datetime, timedelta, timezone
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from storage import (
+    DECIDED_STATUSES,
+    Cursor,
+    Repository,
+    answer_columns,
+    search_snippet,
+    search_terms,
+    search_texts,
+    search_tokens,
+)
+
+Row = Dict[str, Any]
+Key = Tuple[str, int]
+
+# как у FTS5 в SQLite: совпадения в имени и нике весят больше, чем в ответах
+_FIELD_WEIGHTS = (5, 5, 1)
+
+
+def _now() -> str:
+    return datetime.now(timezone.utc).strftime("%Y-%m-%d %H:%M:%S")
+
+
+def _key(row: Row) -> Key:
+    return row["created_at"], row["id"]
+
+
+def _remove(keys: List[Any], key: Any) -> None:
+    index = bisect.bisect_left(keys, key)
+    if index < len(keys) and keys[index] == key:
+        del keys[index]
+
+
+class MemoryApplicationRepository(Repository):
+    """Реализация :class:`storage.Repository` на словарях.
+
+    Индексы: отсортированные ключи ``(created_at, id)`` очереди на
+    рассмотрение (всей и по должностям) и заявок каждого пользователя,
+    отсортированные id всех и
+    невыгруженных заявок, обратный индекс слов для поиска и счётчики для
+    /stats. Строки отдаются копиями, так что изменения вызывающего кода на
+    хранилище не влияют.
+    """
+
+    def __init__(self) -> None:
+        self._next_id = 1
+        self._next_outbox_id = 1
+        self._apps: Dict[int, Row] = {}
+        self._archive: Dict[int, Row] = {}
+        self._ids: List[int] = []
+        self._archive_ids: List[int] = []
+        self._unsynced: List[int] = []
+        self._pending: List[Key] = []
+        self._pending_by_job: Dict[str, List[Key]] = {}
+        self._by_user: Dict[int, List[Key]] = {}
+        self._archive_by_user: Dict[int, List[Key]] = {}
+        self._outbox: Dict[int, Row] = {}
+        self._outbox_by_app: Dict[int, int] = {}
+        self._undeliverable: Dict[int, str] = {}
+        self._postings: Dict[str, Dict[int, int]] = {}
+        self._vocabulary: List[str] = []
+        self._stats: Dict[Tuple[str, str, str], int] = {}
+        self._user_data: Dict[int, Tuple[str, float]] = {}
+        self._conversations: Dict[Tuple[str, str], Tuple[str, float]] = {}
+
+    async def close(self) -> None:
+        pass
+
+    # --- индексы ---
+
+    def _count(self, row: Row, delta: int) -> None:
+        key = (row["created_at"][:10], row["job"] or "", row["status"])
+        self._stats[key] = self._stats.get(key, 0) + delta
+
+    def _add_pending(self, row: Row) -> None:
+        bisect.insort(self._pending, _key(row))
+        bisect.insort(self._pending_by_job.setdefault(row["job"] or "", []), _key(row))
+
+    def _remove_pending(self, row: Row) -> None:
+        _remove(self._pending, _key(row))
+        _remove(self._pending_by_job[row["job"] or ""], _key(row))
+
+    def _index_text(self, row: Row) -> None:
+        for text, weight in zip(search_texts(row), _FIELD_WEIGHTS):
+            for token in search_tokens(text):
+                postings = self._postings.get(token)
+                if postings is None:
+                    postings = self._postings[token] = {}
+                    bisect.insort(self._vocabulary, token)
+                postings[row["id"]] = postings.get(row["id"], 0) + weight
+
+    def _retime(self, app_id: int, created_at: str, updated_at: Optional[str] = None) -> None:
+        """Переставляет время заявки вместе с индексами (для тестов)."""
+        row = self._apps.get(app_id) or self._archive[app_id]
+        by_user = self._by_user if app_id in self._apps else self._archive_by_user
+        self._count(row, -1)
+        _remove(by_user[row["user_id"]], _key(row))
+        pending = app_id in self._apps and row["status"] == "pending"
+        if pending:
+            self._remove_pending(row)
+        row.update(created_at=created_at, updated_at=updated_at or created_at)
+        if row["decided_at"] is not None:
+            row["decided_at"] = row["updated_at"]
+        if pending:
+            self._add_pending(row)
+        bisect.insort(by_user[row["user_id"]], _key(row))
+        self._count(row, 1)
+
+    # --- заявки ---
+
+    async def save_application(
+        self,
+        user_id: int,
+        chat_id: int,
+        username: Optional[str],
+        full_name: Optional[str],
+        answers: Dict[str, Any],
+    ) -> int:
+        app_id = self._next_id
+        self._next_id += 1
+        now = _now()
+        row = {
+            "id": app_id,
+            "user_id": user_id,
+            "chat_id": chat_id,
+            "username": username,
+            "full_name": full_name,
+            "answers_json": json.dumps(answers, ensure_ascii=False),
+            "status": "pending",
+            "created_at": now,
+            "updated_at": now,
+            "admin_comment": None,
+            "synced_to_yonote": 0,
+            "decided_at": None,
+            **answer_columns(answers),
+        }
+        self._apps[app_id] = row
+        self._ids.append(app_id)
+        self._unsynced.append(app_id)
+        self._add_pending(row)
+        bisect.insort(self._by_user.setdefault(user_id, []), _key(row))
+        self._index_text(row)
+        self._count(row, 1)
+        outbox_id = self._next_outbox_id
+        self._next_outbox_id += 1
+        self._outbox[outbox_id] = {
+            "id": outbox_id,
+            "application_id": app_id,
+            "status": "pending",
+            "attempts": 0,
+            "next_attempt_at": 0.0,
+            "last_error": None,
+            "created_at": now,
+        }
+        self._outbox_by_app[app_id] = outbox_id
+        # пользователь снова пишет боту — значит, чат опять доступен
+        self._undeliverable.pop(chat_id, None)
+        return app_id
+
+    async def list_all(self) -> List[Row]:
+        return [dict(row) for row in sorted(self._apps.values(), key=_key)]
+
+    async def list_applications(
+        self,
+        *,
+        after_id: int = 0,
+        limit: int = 1000,
+        status: Optional[str] = None,
+        job: Optional[str] = None,
+        since: Optional[str] = None,
+        until: Optional[str] = None,
+        include_archive: bool = False,
+    ) -> List[Row]:
+        ids: Iterable[int] = self._ids[bisect.bisect_right(self._ids, after_id):]
+        if include_archive:
+            archived = self._archive_ids[bisect.bisect_right(self._archive_ids, after_id):]
+            ids = heapq.merge(ids, archived)
+        rows = []
+        for app_id in ids:
+            row = self._apps.get(app_id) or self._archive[app_id]
+            if status and row["status"] != status:
+                continue
+            if job and row["job"] != job:
+                continue
+            if since and row["created_at"] < since:
+                continue
+            if until and row["created_at"] >= until:
+                continue
+            rows.append(dict(row))
+            if len(rows) >= limit:
+                break
+        return rows
+
+    async def get_by_id(self, app_id: int) -> Optional[Row]:
+        row = self._apps.get(app_id)
+        return dict(row) if row else None
+
+    async def get_last_for_user(self, user_id: int) -> Optional[Row]:
+        for index, table in ((self._by_user, self._apps), (self._archive_by_user, self._archive)):
+            keys = index.get(user_id)
+            if keys:
+                return dict(table[keys[-1][1]])
+        return None
+
+    def _user_rows(self, user_id: int, include_archive: bool) -> List[Row]:
+        keys = [(key, self._apps) for key in self._by_user.get(user_id, [])]
+        if include_archive:
+            keys += [(key, self._archive) for key in self._archive_by_user.get(user_id, [])]
+        keys.sort(key=lambda item: item[0], reverse=True)
+        return [table[key[1]] for key, table in keys]
+
+    async def list_by_user(
+        self, user_id: int, limit: Optional[int] = None, include_archive: bool = False
+    ) -> List[Row]:
+        return [dict(row) for row in self._user_rows(user_id, include_archive)[:limit]]
+
+    def _pending_matches(
+        self, row: Row, job: Optional[str], min_age: Optional[int], max_age: Optional[int]
+    ) -> bool:
+        if job and row["job"] != job:
+            return False
+        if min_age is not None or max_age is not None:
+            age = row["age_years"]
+            if age is None:
+                return False
+            if min_age is not None and age < min_age:
+                return False
+            if max_age is not None and age > max_age:
+                return False
+        return True
+
+    def _select_pending(
+        self,
+        limit: Optional[int],
+        after: Optional[Cursor] = None,
+        before: Optional[Cursor] = None,
+        job: Optional[str] = None,
+        min_age: Optional[int] = None,
+        max_age: Optional[int] = None,
+    ) -> List[Row]:
+        pending = self._pending_by_job.get(job, []) if job else self._pending
+        start = 0 if after is None else bisect.bisect_right(pending, tuple(after))
+        stop = len(pending) if before is None else bisect.bisect_left(pending, tuple(before))
+        keys: Iterable[Key] = pending[start:stop]
+        # страницу «назад» набираем с конца, как SQLite
+        backwards = before is not None and after is None
+        if backwards:
+            keys = reversed(list(keys))
+        rows = []
+        for _, app_id in keys:
+            row = self._apps[app_id]
+            if self._pending_matches(row, job, min_age, max_age):
+                rows.append(row)
+                if limit is not None and len(rows) >= limit:
+                    break
+        return rows[::-1] if backwards else rows
+
+    async def list_pending(
+        self,
+        limit: int = 10,
+        *,
+        after: Optional[Cursor] = None,
+        before: Optional[Cursor] = None,
+        job: Optional[str] = None,
+        min_age: Optional[int] = None,
+        max_age: Optional[int] = None,
+    ) -> List[Row]:
+        rows = self._select_pending(limit, after, before, job, min_age, max_age)
+        return [dict(row) for row in rows]
+
+    def _history(self, row: Row, history_limit: int, include_archive: bool) -> List[Row]:
+        rows = self._user_rows(row["user_id"], include_archive)[:history_limit]
+        return [dict(item) for item in rows]
+
+    async def list_pending_with_history(
+        self, limit: int = 10, history_limit: int = 5, include_archive: bool = False, **filters: Any
+    ) -> List[Tuple[Row, List[Row]]]:
+        rows = self._select_pending(limit, **filters)
+        return [(dict(row), self._history(row, history_limit, include_archive)) for row in rows]
+
+    async def get_with_history(
+        self, app_id: int, history_limit: int = 5, include_archive: bool = False
+    ) -> Optional[Tuple[Row, List[Row]]]:
+        row = self._apps.get(app_id)
+        if row is None:
+            return None
+        return dict(row), self._history(row, history_limit, include_archive)
+
+    def _change_status(self, row: Row, status: str, **changes: Any) -> None:
+        if row["status"] != status:
+            self._count(row, -1)
+            if row["status"] == "pending":
+                self._remove_pending(row)
+            elif status == "pending":
+                self._add_pending(row)
+            row["status"] = status
+            self._count(row, 1)
+        now = _now()
+        row.update(updated_at=now, decided_at=now, **changes)
+
+    async def update_status(
+        self, app_id: int, status: str, admin_comment: Optional[str] = None
+    ) -> Optional[int]:
+        row = self._apps.get(app_id)
+        if row is None:
+            return None
+        self._change_status(row, status, admin_comment=admin_comment)
+        return row["user_id"]
+
+    async def transition_status(
+        self,
+        app_id: int,
+        status: str,
+        admin_comment: Optional[str] = None,
+        expected: str = "pending",
+    ) -> Optional[Row]:
+        row = self._apps.get(app_id)
+        if row is None or row["status"] != expected:
+            return None
+        self._change_status(row, status, admin_comment=admin_comment)
+        return dict(row)
+
+    async def bulk_update_status(
+        self,
+        status: str,
+        *,
+        ids: Optional[List[int]] = None,
+        job: Optional[str] = None,
+        min_age: Optional[int] = None,
+        max_age: Optional[int] = None,
+    ) -> List[Row]:
+        if ids is not None:
+            selected = [
+                self._apps[app_id]
+                for app_id in set(ids)
+                if app_id in self._apps
+                and self._apps[app_id]["status"] == "pending"
+                and self._pending_matches(self._apps[app_id], job, min_age, max_age)
+            ]
+            selected.sort(key=_key)
+        else:
+            selected = self._select_pending(None, job=job, min_age=min_age, max_age=max_age)
+        result = [dict(row) for row in selected]
+        for row in selected:
+            self._change_status(row, status)
+        return result
+
+    def _matching_ids(self, term: str) -> Dict[int, int]:
+        """Заявки, где есть все слова ``term`` (последнее — по префиксу), с весом совпадений."""
+        tokens = search_tokens(term)
+        if not tokens:
+            return {}
+        *exact, prefix = tokens
+        scores: Dict[int, int] = {}
+        start = bisect.bisect_left(self._vocabulary, prefix)
+        for token in self._vocabulary[start:]:
+            if not token.startswith(prefix):
+                break
+            for app_id, weight in self._postings[token].items():
+                scores[app_id] = scores.get(app_id, 0) + weight
+        for token in exact:
+            postings = self._postings.get(token, {})
+            scores = {
+                app_id: score + postings[app_id]
+                for app_id, score in scores.items()
+                if app_id in postings
+            }
+        return scores
+
+    async def search(self, text: str, limit: int = 10, offset: int = 0) -> List[Row]:
+        terms = search_terms(text)
+        if not terms:
+            return []
+        scores: Optional[Dict[int, int]] = None
+        for term in terms:
+            matches = self._matching_ids(term)
+            if scores is None:
+                scores = matches
+            else:
+                scores = {
+                    app_id: score + matches[app_id]
+                    for app_id, score in scores.items()
+                    if app_id in matches
+                }
+        ranked = sorted((scores or {}).items(), key=lambda item: (-item[1], item[0]))
+        results = []
+        for app_id, _ in ranked[offset : offset + limit]:
+            row = self._apps.get(app_id) or self._archive[app_id]
+            results.append({**row, "snippet": search_snippet(row, text)})
+        return results
+
+    async def get_stats(self, days: int = 7) -> Dict[str, Any]:
+        first_day = (datetime.now(timezone.utc) - timedelta(days=max(0, days - 1))).strftime(
+            "%Y-%m-%d"
+        )
+        by_status: Dict[str, int] = {}
+        by_job: Dict[str, Dict[str, int]] = {}
+        daily: Dict[str, int] = {}
+        for (day, job, status), count in self._stats.items():
+            if not count:
+                continue
+            by_status[status] = by_status.get(status, 0) + count
+            by_job.setdefault(job, {})[status] = by_job.get(job, {}).get(status, 0) + count
+            if day >= first_day:
+                daily[day] = daily.get(day, 0) + count
+        return {"by_status": by_status, "by_job": by_job, "daily": sorted(daily.items())}
+
+    async def archive_decided(self, older_than: str, batch_size: int = 500) -> int:
+        moved = [
+            row
+            for row in self._apps.values()
+            if row["status"] in DECIDED_STATUSES
+            and row["decided_at"] < older_than
+            and row["synced_to_yonote"]
+            and row["id"] not in self._outbox_by_app
+        ]
+        for row in moved:
+            app_id = row["id"]
+            del self._apps[app_id]
+            _remove(self._ids, app_id)
+            _remove(self._unsynced, app_id)
+            _remove(self._by_user[row["user_id"]], _key(row))
+            self._archive[app_id] = row
+            bisect.insort(self._archive_ids, app_id)
+            bisect.insort(self._archive_by_user.setdefault(row["user_id"], []), _key(row))
+        return len(moved)
+
+    async def vacuum(self, pages: int = 0) -> int:
+        return 0
+
+    # --- выгрузка в Yonote ---
+
+    def _mark_synced(self, app_id: int) -> None:
+        row = self._apps.get(app_id)
+        if row is not None:
+            row.update(synced_to_yonote=1, updated_at=_now())
+            _remove(self._unsynced, app_id)
+        outbox_id = self._outbox_by_app.pop(app_id, None)
+        if outbox_id is not None:
+            del self._outbox[outbox_id]
+
+    async def mark_synced(self, app_id: int) -> None:
+        self._mark_synced(app_id)
+
+    async def mark_synced_many(self, app_ids: List[int]) -> None:
+        for app_id in app_ids:
+            self._mark_synced(app_id)
+
+    async def list_unsynced(
+        self,
+        *,
+        after_id: int = 0,
+        since: Optional[str] = None,
+        include_queued: bool = False,
+        limit: int = 500,
+    ) -> List[Row]:
+        rows = []
+        for index in range(bisect.bisect_right(self._unsynced, after_id), len(self._unsynced)):
+            app_id = self._unsynced[index]
+            row = self._apps[app_id]
+            if since is not None and row["created_at"] < since:
+                continue
+            if not include_queued:
+                outbox_id = self._outbox_by_app.get(app_id)
+                if outbox_id is not None and self._outbox[outbox_id]["status"] == "pending":
+                    continue
+            rows.append(dict(row))
+            if len(rows) >= limit:
+                break
+        return rows
+
+    async def claim_outbox(self, limit: int, lease: float = 300.0) -> List[Row]:
+        now = time.time()
+        due = sorted(
+            (
+                entry
+                for entry in self._outbox.values()
+                if entry["status"] == "pending" and entry["next_attempt_at"] <= now
+            ),
+            key=lambda entry: (entry["next_attempt_at"], entry["id"]),
+        )[:limit]
+        rows = []
+        for entry in due:
+            row = self._apps.get(entry["application_id"])
+            if row is None:
+                continue
+            entry["next_attempt_at"] = now + lease
+            rows.append({"outbox_id": entry["id"], "attempts": entry["attempts"], **row})
+        return rows
+
+    async def retry_outbox(self, outbox_id: int, delay: float, error: str) -> None:
+        entry = self._outbox.get(outbox_id)
+        if entry is not None:
+            entry["attempts"] += 1
+            entry.update(next_attempt_at=time.time() + delay, last_error=error)
+
+    async def defer_outbox(self, outbox_id: int, delay: float) -> None:
+        entry = self._outbox.get(outbox_id)
+        if entry is not None:
+            entry["next_attempt_at"] = time.time() + delay
+
+    async def dead_letter_outbox(self, outbox_id: int, error: str) -> None:
+        entry = self._outbox.get(outbox_id)
+        if entry is not None:
+            entry["attempts"] += 1
+            entry.update(status="dead", last_error=error)
+
+    async def list_outbox(self, status: Optional[str] = None) -> List[Row]:
+        return [
+            dict(entry)
+            for _, entry in sorted(self._outbox.items())
+            if status is None or entry["status"] == status
+        ]
+
+    # --- рассылка ---
+
+    async def mark_undeliverable(self, chat_id: int, reason: str) -> None:
+        self._undeliverable[chat_id] = reason
+
+    async def list_undeliverable(self) -> List[int]:
+        return list(self._undeliverable)
+
+    # --- состояние диалогов PTB ---
+
+    async def load_user_data(self) -> Dict[int, Dict[str, Any]]:
+        # через JSON, как в SQLite: ключи становятся строками, объекты — копиями
+        return {user_id: json.loads(data) for user_id, (data, _) in self._user_data.items()}
+
+    async def load_conversations(self, name: str) -> Dict[Tuple[Any, ...], Any]:
+        return {
+            tuple(json.loads(key)): json.loads(state)
+            for (state_name, key), (state, _) in self._conversations.items()
+            if state_name == name
+        }
+
+    async def save_persistence(
+        self,
+        user_data: Dict[int, Optional[Dict[str, Any]]],
+        conversations: Dict[Tuple[str, Tuple[Any, ...]], Any],
+    ) -> None:
+        now = time.time()
+        # сериализуем всё до первой записи, чтобы ошибка не оставила половину изменений
+        users = {
+            user_id: None if data is None else json.dumps(data, ensure_ascii=False)
+            for user_id, data in user_data.items()
+        }
+        states = {
+            (name, json.dumps(list(key))): None if state is None else json.dumps(state)
+            for (name, key), state in conversations.items()
+        }
+        for user_id, data in users.items():
+            if data is None:
+                self._user_data.pop(user_id, None)
+            else:
+                self._user_data[user_id] = (data, now)
+        for state_key, state in states.items():
+            if state is None:
+                self._conversations.pop(state_key, None)
+            else:
+                self._conversations[state_key] = (state, now)
+
+    async def evict_persistence(self, older_than: float) -> int:
+        users = [key for key, (_, updated) in self._user_data.items() if updated < older_than]
+        states = [key for key, (_, updated) in self._conversations.items() if updated < older_than]
+        for user_id in users:
+            del self._user_data[user_id]
+        for state_key in states:
+            del self._conversations[state_key]
+        return len(users) + len(states)
+
@@ -0,0 +1,819 @@
+"""Хранилище заявок в PostgreSQL (14+) через пул соединений asyncpg.
+
+Схема создаётся при первом подключении под advisory-блокировкой, так что
+одновременный старт нескольких реплик бота безопасен. Время хранится
+текстом ``ГГГГ-ММ-ДД ЧЧ:ММ:СС`` (UTC), как в SQLite: строки и курсоры
+пагинации у всех движков одинаковые. Архивные заявки остаются в той же
+таблице с заполненным ``archived_at`` и не попадают в частичные индексы
+горячих выборок. Записи outbox разбираются с ``FOR UPDATE SKIP LOCKED``,
+поэтому outbox-воркеры нескольких реплик не берут одну заявку дважды.
+
+Пакет asyncpg нужен только для этого движка (``STORAGE_BACKEND=postgres``).
+"""
+
+import asyncio
+import json
+import time
+from datetime import datetime, timedelta, timezone
+from typing import TYPE_CHECKING, Any, Dict, List, Optional, Tuple
+
+from storage import (
+    ANSWER_FIELDS,
+    DECIDED_STATUSES,
+    ROW_FIELDS,
+    Cursor,
+    Repository,
+    search_snippet,
+    search_terms,
+    search_texts,
+    search_tokens,
+)
+
+if TYPE_CHECKING:  # pragma: no cover
+    import asyncpg
+
+Row = Any
+
+COLUMNS = ", ".join(ROW_FIELDS)
+_NOW = "to_char(now() AT TIME ZONE 'UTC', 'YYYY-MM-DD HH24:MI:SS')"
+_ANSWERS = "answers_json::jsonb"
+# CAST(... AS INTEGER) из SQLite: ведущее целое (в пределах BIGINT), иначе 0; нет ключа — NULL
+_AGE = (
+    f"CASE WHEN {_ANSWERS} ->> 'age' IS NOT NULL THEN LEAST(GREATEST(COALESCE("
+    f"substring({_ANSWERS} ->> 'age' FROM '^\\s*([+-]?\\d+)')::numeric, 0), "
+    "-9223372036854775808), 9223372036854775807)::bigint END"
+)
+# ответы анкеты — генерируемые колонки; ADD COLUMN в уже существующей
+# таблице пересчитывает их для всех строк
+_ANSWER_COLUMNS = [
+    (field, "TEXT", f"{_ANSWERS} ->> '{field}'") for field in ANSWER_FIELDS
+] + [("age_years", "BIGINT", _AGE)]
+# веса полей в tsvector: имя и ник — A, ответы — D
+_FIELD_WEIGHTS = ("A", "A", "D")
+_MAX_POSITION = 16383
+# произвольная константа для pg_advisory_xact_lock на время создания схемы
+_SCHEMA_LOCK = 7_204_518_301
+
+SCHEMA = [
+    f"""
+    CREATE TABLE IF NOT EXISTS applications (
+        id BIGSERIAL PRIMARY KEY,
+        user_id BIGINT NOT NULL,
+        chat_id BIGINT NOT NULL,
+        username TEXT,
+        full_name TEXT,
+        answers_json TEXT NOT NULL,
+        status TEXT NOT NULL,
+        created_at TEXT NOT NULL DEFAULT {_NOW},
+        updated_at TEXT NOT NULL DEFAULT {_NOW},
+        admin_comment TEXT,
+        synced_to_yonote INTEGER NOT NULL DEFAULT 0,
+        decided_at TEXT,
+        archived_at TEXT,
+        search_vector TSVECTOR NOT NULL DEFAULT ''
+    )
+    """,
+    *(
+        f"ALTER TABLE applications ADD COLUMN IF NOT EXISTS {name} {type_} "
+        f"GENERATED ALWAYS AS ({expression}) STORED"
+        for name, type_, expression in _ANSWER_COLUMNS
+    ),
+    # таблицы, созданные до decided_at: время решения берётся из updated_at
+    """
+    DO $$
+    BEGIN
+        IF NOT EXISTS (
+            SELECT 1 FROM information_schema.columns
+            WHERE table_schema = current_schema()
+              AND table_name = 'applications' AND column_name = 'decided_at'
+        ) THEN
+            ALTER TABLE applications ADD COLUMN decided_at TEXT;
+            UPDATE applications SET decided_at = updated_at WHERE status <> 'pending';
+        END IF;
+    END
+    $$
+    """,
+    "CREATE INDEX IF NOT EXISTS idx_applications_job "
+    "ON applications (job) WHERE archived_at IS NULL",
+    "CREATE INDEX IF NOT EXISTS idx_applications_pending_job "
+    "ON applications (job, created_at, id) WHERE status = 'pending' AND archived_at IS NULL",
+    "CREATE INDEX IF NOT EXISTS idx_applications_pending_age "
+    "ON applications (age_years) WHERE status = 'pending' AND archived_at IS NULL",
+    "CREATE INDEX IF NOT EXISTS idx_applications_user_created "
+    "ON applications (user_id, created_at DESC, id DESC)",
+    "CREATE INDEX IF NOT EXISTS idx_applications_pending "
+    "ON applications (created_at, id) WHERE status = 'pending' AND archived_at IS NULL",
+    "CREATE INDEX IF NOT EXISTS idx_applications_unsynced "
+    "ON applications (id) WHERE synced_to_yonote = 0 AND archived_at IS NULL",
+    "DROP INDEX IF EXISTS idx_applications_decided",
+    "CREATE INDEX IF NOT EXISTS idx_applications_decided_at "
+    "ON applications (decided_at) WHERE status <> 'pending' AND archived_at IS NULL",
+    "CREATE INDEX IF NOT EXISTS idx_applications_search ON applications USING GIN (search_vector)",
+    f"""
+    CREATE TABLE IF NOT EXISTS yonote_outbox (
+        id BIGSERIAL PRIMARY KEY,
+        application_id BIGINT NOT NULL UNIQUE REFERENCES applications (id),
+        status TEXT NOT NULL DEFAULT 'pending',
+        attempts INTEGER NOT NULL DEFAULT 0,
+        next_attempt_at DOUBLE PRECISION NOT NULL DEFAULT 0,
+        last_error TEXT,
+        created_at TEXT NOT NULL DEFAULT {_NOW}
+    )
+    """,
+    "CREATE INDEX IF NOT EXISTS idx_outbox_due ON yonote_outbox (status, next_attempt_at)",
+    f"""
+    CREATE TABLE IF NOT EXISTS undeliverable_chats (
+        chat_id BIGINT PRIMARY KEY,
+        reason TEXT,
+        created_at TEXT NOT NULL DEFAULT {_NOW}
+    )
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS bot_user_data (
+        user_id BIGINT PRIMARY KEY,
+        data TEXT NOT NULL,
+        updated_at DOUBLE PRECISION NOT NULL
+    )
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS bot_conversations (
+        name TEXT NOT NULL,
+        key TEXT NOT NULL,
+        state TEXT NOT NULL,
+        updated_at DOUBLE PRECISION NOT NULL,
+        PRIMARY KEY (name, key)
+    )
+    """,
+    "CREATE INDEX IF NOT EXISTS idx_bot_user_data_updated ON bot_user_data (updated_at)",
+    "CREATE INDEX IF NOT EXISTS idx_bot_conversations_updated ON bot_conversations (updated_at)",
+    # счётчики для /stats ведёт триггер, как в SQLite
+    """
+    CREATE TABLE IF NOT EXISTS application_stats (
+        day TEXT NOT NULL,
+        job TEXT NOT NULL,
+        status TEXT NOT NULL,
+        count BIGINT NOT NULL,
+        PRIMARY KEY (day, job, status)
+    )
+    """,
+    """
+    CREATE OR REPLACE FUNCTION application_stats_change() RETURNS trigger
+    LANGUAGE plpgsql AS $$
+    BEGIN
+        IF TG_OP IN ('UPDATE', 'DELETE') THEN
+            INSERT INTO application_stats (day, job, status, count)
+            VALUES (left(OLD.created_at, 10), COALESCE(OLD.job, ''), OLD.status, -1)
+            ON CONFLICT (day, job, status)
+            DO UPDATE SET count = application_stats.count + excluded.count;
+        END IF;
+        IF TG_OP IN ('INSERT', 'UPDATE') THEN
+            INSERT INTO application_stats (day, job, status, count)
+            VALUES (left(NEW.created_at, 10), COALESCE(NEW.job, ''), NEW.status, 1)
+            ON CONFLICT (day, job, status)
+            DO UPDATE SET count = application_stats.count + excluded.count;
+        END IF;
+        RETURN NULL;
+    END
+    $$
+    """,
+    """
+    CREATE OR REPLACE TRIGGER applications_stats
+    AFTER INSERT OR DELETE OR UPDATE OF status, answers_json, created_at ON applications
+    FOR EACH ROW EXECUTE FUNCTION application_stats_change()
+    """,
+]
+
+
+def _now() -> str:
+    return datetime.now(timezone.utc).strftime("%Y-%m-%d %H:%M:%S")
+
+
+def _search_vector(row: Dict[str, Any]) -> str:
+    """Литерал tsvector из токенов :func:`storage.search_tokens` с весами полей.
+
+    Текст разбирается в Python, а не парсером PostgreSQL: тогда ``star_123``
+    и ссылки делятся на слова так же, как в SQLite и в памяти.
+    """
+    lexemes = []
+    position = 0
+    for text, weight in zip(search_texts(row), _FIELD_WEIGHTS):
+        for token in search_tokens(text):
+            position = min(position + 1, _MAX_POSITION)
+            lexemes.append(f"'{token}':{position}{weight}")
+    return " ".join(lexemes)
+
+
+def _search_query(text: str) -> Optional[str]:
+    """tsquery из слов запроса: слово — фраза его токенов, последний по префиксу."""
+    phrases = []
+    for term in search_terms(text):
+        tokens = search_tokens(term)
+        if tokens:
+            phrases.append(" <-> ".join(f"'{token}'" for token in tokens) + ":*")
+    return " & ".join(f"({phrase})" for phrase in phrases) or None
+
+
+class _Params:
+    """Собирает параметры запроса и выдаёт для них плейсхолдеры ``$n``."""
+
+    def __init__(self) -> None:
+        self.values: List[Any] = []
+
+    def __call__(self, value: Any) -> str:
+        self.values.append(value)
+        return f"${len(self.values)}"
+
+
+def _pending_filter(
+    params: _Params,
+    after: Optional[Cursor] = None,
+    before: Optional[Cursor] = None,
+    job: Optional[str] = None,
+    min_age: Optional[int] = None,
+    max_age: Optional[int] = None,
+) -> Tuple[str, str]:
+    conditions = ["status = 'pending'", "archived_at IS NULL"]
+    if after is not None:
+        conditions.append(f"(created_at, id) > ({params(after[0])}, {params(after[1])})")
+    if before is not None:
+        conditions.append(f"(created_at, id) < ({params(before[0])}, {params(before[1])})")
+    if job:
+        conditions.append(f"job = {params(job)}")
+    if min_age is not None:
+        conditions.append(f"age_years >= {params(min_age)}")
+    if max_age is not None:
+        conditions.append(f"age_years <= {params(max_age)}")
+    order = "DESC" if before is not None and after is None else "ASC"
+    return " AND ".join(conditions), order
+
+
+def _affected(status: str) -> int:
+    """Число строк из статуса команды asyncpg вида ``DELETE 3``."""
+    return int(status.rsplit(" ", 1)[-1])
+
+
+class PostgresApplicationRepository(Repository):
+    """Реализация :class:`storage.Repository` на PostgreSQL.
+
+    Пул создаётся при первом запросе. Кэша статусов, как у SQLite, здесь
+    нет: при нескольких репликах локальный кэш видел бы решения только
+    своей реплики.
+    """
+
+    def __init__(self, dsn: str, *, min_size: int = 1, max_size: int = 10) -> None:
+        self.dsn = dsn
+        self.min_size = min_size
+        self.max_size = max_size
+        self._pool: Optional["asyncpg.Pool"] = None
+        self._pool_lock = asyncio.Lock()
+
+    async def _get_pool(self) -> "asyncpg.Pool":
+        if self._pool is not None:
+            return self._pool
+        async with self._pool_lock:
+            if self._pool is None:
+                try:
+                    import asyncpg
+                except ImportError:
+                    raise RuntimeError("Для STORAGE_BACKEND=postgres установите пакет asyncpg")
+                pool = await asyncpg.create_pool(
+                    self.dsn, min_size=self.min_size, max_size=self.max_size
+                )
+                async with pool.acquire() as conn:
+                    async with conn.transaction():
+                        await conn.execute("SELECT pg_advisory_xact_lock($1)", _SCHEMA_LOCK)
+                        for statement in SCHEMA:
+                            await conn.execute(statement)
+                self._pool = pool
+        return self._pool
+
+    async def _fetch(self, sql: str, *args: Any) -> List[Row]:
+        return await (await self._get_pool()).fetch(sql, *args)
+
+    async def _fetchrow(self, sql: str, *args: Any) -> Optional[Row]:
+        return await (await self._get_pool()).fetchrow(sql, *args)
+
+    async def _execute(self, sql: str, *args: Any) -> str:
+        return await (await self._get_pool()).execute(sql, *args)
+
+    async def close(self) -> None:
+        if self._pool is not None:
+            await self._pool.close()
+            self._pool = None
+
+    # --- заявки ---
+
+    async def save_application(
+        self,
+        user_id: int,
+        chat_id: int,
+        username: Optional[str],
+        full_name: Optional[str],
+        answers: Dict[str, Any],
+    ) -> int:
+        answers_json = json.dumps(answers, ensure_ascii=False)
+        vector = _search_vector(
+            {"full_name": full_name, "username": username, "answers_json": answers_json}
+        )
+        pool = await self._get_pool()
+        async with pool.acquire() as conn:
+            async with conn.transaction():
+                app_id = await conn.fetchval(
+                    """
+                    INSERT INTO applications
+                        (user_id, chat_id, username, full_name, answers_json, status, search_vector)
+                    VALUES ($1, $2, $3, $4, $5, 'pending', $6::tsvector)
+                    RETURNING id
+                    """,
+                    user_id,
+                    chat_id,
+                    username,
+                    full_name,
+                    answers_json,
+                    vector,
+                )
+                await conn.execute(
+                    "INSERT INTO yonote_outbox (application_id) VALUES ($1)", app_id
+                )
+                # пользователь снова пишет боту — значит, чат опять доступен
+                await conn.execute("DELETE FROM undeliverable_chats WHERE chat_id = $1", chat_id)
+        return app_id
+
+    async def list_all(self) -> List[Row]:
+        return await self._fetch(
+            f"SELECT {COLUMNS} FROM applications WHERE archived_at IS NULL "
+            "ORDER BY created_at ASC, id ASC"
+        )
+
+    async def list_applications(
+        self,
+        *,
+        after_id: int = 0,
+        limit: int = 1000,
+        status: Optional[str] = None,
+        job: Optional[str] = None,
+        since: Optional[str] = None,
+        until: Optional[str] = None,
+        include_archive: bool = False,
+    ) -> List[Row]:
+        params = _Params()
+        conditions = [f"id > {params(after_id)}"]
+        if not include_archive:
+            conditions.append("archived_at IS NULL")
+        if status:
+            conditions.append(f"status = {params(status)}")
+        if job:
+            conditions.append(f"job = {params(job)}")
+        if since:
+            conditions.append(f"created_at >= {params(since)}")
+        if until:
+            conditions.append(f"created_at < {params(until)}")
+        return await self._fetch(
+            f"SELECT {COLUMNS} FROM applications WHERE {' AND '.join(conditions)} "
+            f"ORDER BY id ASC LIMIT {params(limit)}",
+            *params.values,
+        )
+
+    async def get_by_id(self, app_id: int) -> Optional[Row]:
+        return await self._fetchrow(
+            f"SELECT {COLUMNS} FROM applications WHERE id = $1 AND archived_at IS NULL", app_id
+        )
+
+    async def get_last_for_user(self, user_id: int) -> Optional[Row]:
+        # архивная заявка — только если горячих у пользователя нет, как в SQLite
+        return await self._fetchrow(
+            f"""
+            SELECT {COLUMNS} FROM applications
+            WHERE user_id = $1
+            ORDER BY archived_at IS NOT NULL, created_at DESC, id DESC
+            LIMIT 1
+            """,
+            user_id,
+        )
+
+    async def list_by_user(
+        self, user_id: int, limit: Optional[int] = None, include_archive: bool = False
+    ) -> List[Row]:
+        archive = "" if include_archive else "AND archived_at IS NULL"
+        return await self._fetch(
+            f"""
+            SELECT {COLUMNS} FROM applications
+            WHERE user_id = $1 {archive}
+            ORDER BY created_at DESC, id DESC
+            LIMIT $2
+            """,
+            user_id,
+            limit,
+        )
+
+    async def list_pending(
+        self,
+        limit: int = 10,
+        *,
+        after: Optional[Cursor] = None,
+        before: Optional[Cursor] = None,
+        job: Optional[str] = None,
+        min_age: Optional[int] = None,
+        max_age: Optional[int] = None,
+    ) -> List[Row]:
+        params = _Params()
+        where, order = _pending_filter(params, after, before, job, min_age, max_age)
+        rows = await self._fetch(
+            f"""
+            SELECT {COLUMNS} FROM applications
+            WHERE {where}
+            ORDER BY created_at {order}, id {order}
+            LIMIT {params(limit)}
+            """,
+            *params.values,
+        )
+        return rows[::-1] if order == "DESC" else rows
+
+    async def _histories(
+        self, rows: List[Row], history_limit: int, include_archive: bool = False
+    ) -> List[Tuple[Row, List[Row]]]:
+        """Последние заявки авторов ``rows`` одним запросом."""
+        if not rows:
+            return []
+        archive = "" if include_archive else "AND archived_at IS NULL"
+        history = await self._fetch(
+            f"""
+            SELECT {COLUMNS} FROM (
+                SELECT {COLUMNS},
+                       ROW_NUMBER() OVER (
+                           PARTITION BY user_id ORDER BY created_at DESC, id DESC
+                       ) AS history_rank
+                FROM applications
+                WHERE user_id = ANY($1::bigint[]) {archive}
+            ) AS h
+            WHERE history_rank <= $2
+            ORDER BY user_id, history_rank
+            """,
+            list({row["user_id"] for row in rows}),
+            history_limit,
+        )
+        by_user: Dict[int, List[Row]] = {}
+        for item in history:
+            by_user.setdefault(item["user_id"], []).append(item)
+        return [(row, by_user.get(row["user_id"], [])) for row in rows]
+
+    async def list_pending_with_history(
+        self, limit: int = 10, history_limit: int = 5, include_archive: bool = False, **filters: Any
+    ) -> List[Tuple[Row, List[Row]]]:
+        rows = await self.list_pending(limit, **filters)
+        return await self._histories(rows, history_limit, include_archive)
+
+    async def get_with_history(
+        self, app_id: int, history_limit: int = 5, include_archive: bool = False
+    ) -> Optional[Tuple[Row, List[Row]]]:
+        row = await self.get_by_id(app_id)
+        if row is None:
+            return None
+        return (await self._histories([row], history_limit, include_archive))[0]
+
+    async def update_status(
+        self, app_id: int, status: str, admin_comment: Optional[str] = None
+    ) -> Optional[int]:
+        return await (await self._get_pool()).fetchval(
+            f"""
+            UPDATE applications
+            SET status = $1, admin_comment = $2, updated_at = {_NOW}, decided_at = {_NOW}
+            WHERE id = $3 AND archived_at IS NULL
+            RETURNING user_id
+            """,
+            status,
+            admin_comment,
+            app_id,
+        )
+
+    async def transition_status(
+        self,
+        app_id: int,
+        status: str,
+        admin_comment: Optional[str] = None,
+        expected: str = "pending",
+    ) -> Optional[Row]:
+        return await self._fetchrow(
+            f"""
+            UPDATE applications
+            SET status = $1, admin_comment = $2, updated_at = {_NOW}, decided_at = {_NOW}
+            WHERE id = $3 AND status = $4 AND archived_at IS NULL
+            RETURNING {COLUMNS}
+            """,
+            status,
+            admin_comment,
+            app_id,
+            expected,
+        )
+
+    async def bulk_update_status(
+        self,
+        status: str,
+        *,
+        ids: Optional[List[int]] = None,
+        job: Optional[str] = None,
+        min_age: Optional[int] = None,
+        max_age: Optional[int] = None,
+    ) -> List[Row]:
+        params = _Params()
+        where, _ = _pending_filter(params, job=job, min_age=min_age, max_age=max_age)
+        if ids is not None:
+            if not ids:
+                return []
+            where += f" AND id = ANY({params(list(ids))}::bigint[])"
+        new_status = params(status)
+        # строки отдаются в прежнем виде, как их выбрал SELECT ... FOR UPDATE
+        rows = await self._fetch(
+            f"""
+            WITH selected AS (
+                SELECT {COLUMNS} FROM applications
+                WHERE {where}
+                FOR UPDATE
+            ), updated AS (
+                UPDATE applications AS a
+                SET status = {new_status}, updated_at = {_NOW}, decided_at = {_NOW}
+                FROM selected
+                WHERE a.id = selected.id
+                RETURNING a.id
+            )
+            SELECT selected.* FROM selected JOIN updated USING (id)
+            ORDER BY created_at ASC, id ASC
+            """,
+            *params.values,
+        )
+        return rows
+
+    async def search(self, text: str, limit: int = 10, offset: int = 0) -> List[Row]:
+        query = _search_query(text)
+        if query is None:
+            return []
+        rows = await self._fetch(
+            f"""
+            SELECT {COLUMNS} FROM applications
+            WHERE search_vector @@ $1::tsquery
+            ORDER BY ts_rank(search_vector, $1::tsquery) DESC, id ASC
+            LIMIT $2 OFFSET $3
+            """,
+            query,
+            limit,
+            offset,
+        )
+        return [{**dict(row), "snippet": search_snippet(row, text)} for row in rows]
+
+    async def get_stats(self, days: int = 7) -> Dict[str, Any]:
+        first_day = (datetime.now(timezone.utc) - timedelta(days=max(0, days - 1))).strftime(
+            "%Y-%m-%d"
+        )
+        pool = await self._get_pool()
+        async with pool.acquire() as conn:
+            totals = await conn.fetch(
+                "SELECT job, status, SUM(count)::bigint AS count FROM application_stats "
+                "GROUP BY job, status"
+            )
+            daily = await conn.fetch(
+                """
+                SELECT day, SUM(count)::bigint AS count FROM application_stats
+                WHERE day >= $1
+                GROUP BY day
+                HAVING SUM(count) > 0
+                ORDER BY day
+                """,
+                first_day,
+            )
+        by_status: Dict[str, int] = {}
+        by_job: Dict[str, Dict[str, int]] = {}
+        for row in totals:
+            if not row["count"]:
+                continue
+            by_status[row["status"]] = by_status.get(row["status"], 0) + row["count"]
+            by_job.setdefault(row["job"], {})[row["status"]] = row["count"]
+        return {
+            "by_status": by_status,
+            "by_job": by_job,
+            "daily": [(row["day"], row["count"]) for row in daily],
+        }
+
+    async def archive_decided(self, older_than: str, batch_size: int = 500) -> int:
+        moved = 0
+        while True:
+            rows = await self._fetch(
+                f"""
+                WITH batch AS (
+                    SELECT id FROM applications AS a
+                    WHERE status <> 'pending' AND archived_at IS NULL
+                      AND status = ANY($1::text[]) AND decided_at < $2 AND synced_to_yonote = 1
+                      AND NOT EXISTS (SELECT 1 FROM yonote_outbox o WHERE o.application_id = a.id)
+                    ORDER BY id
+                    LIMIT $3
+                    FOR UPDATE SKIP LOCKED
+                )
+                UPDATE applications SET archived_at = {_NOW}
+                FROM batch WHERE applications.id = batch.id
+                RETURNING applications.id
+                """,
+                list(DECIDED_STATUSES),
+                older_than,
+                batch_size,
+            )
+            moved += len(rows)
+            if len(rows) < batch_size:
+                return moved
+
+    async def vacuum(self, pages: int = 0) -> int:
+        # место в PostgreSQL возвращает autovacuum
+        return 0
+
+    # --- выгрузка в Yonote ---
+
+    async def mark_synced(self, app_id: int) -> None:
+        await self.mark_synced_many([app_id])
+
+    async def mark_synced_many(self, app_ids: List[int]) -> None:
+        if not app_ids:
+            return
+        pool = await self._get_pool()
+        async with pool.acquire() as conn:
+            async with conn.transaction():
+                await conn.execute(
+                    f"""
+                    UPDATE applications SET synced_to_yonote = 1, updated_at = {_NOW}
+                    WHERE id = ANY($1::bigint[])
+                    """,
+                    app_ids,
+                )
+                await conn.execute(
+                    "DELETE FROM yonote_outbox WHERE application_id = ANY($1::bigint[])", app_ids
+                )
+
+    async def list_unsynced(
+        self,
+        *,
+        after_id: int = 0,
+        since: Optional[str] = None,
+        include_queued: bool = False,
+        limit: int = 500,
+    ) -> List[Row]:
+        params = _Params()
+        conditions = [
+            "synced_to_yonote = 0",
+            "archived_at IS NULL",
+            f"id > {params(after_id)}",
+        ]
+        if since is not None:
+            conditions.append(f"created_at >= {params(since)}")
+        if not include_queued:
+            conditions.append(
+                "NOT EXISTS (SELECT 1 FROM yonote_outbox o "
+                "WHERE o.application_id = applications.id AND o.status = 'pending')"
+            )
+        return await self._fetch(
+            f"SELECT {COLUMNS} FROM applications WHERE {' AND '.join(conditions)} "
+            f"ORDER BY id ASC LIMIT {params(limit)}",
+            *params.values,
+        )
+
+    async def claim_outbox(self, limit: int, lease: float = 300.0) -> List[Row]:
+        now = time.time()
+        a_columns = ", ".join(f"a.{column}" for column in ROW_FIELDS)
+        return await self._fetch(
+            f"""
+            WITH due AS (
+                SELECT id, next_attempt_at FROM yonote_outbox
+                WHERE status = 'pending' AND next_attempt_at <= $1
+                ORDER BY next_attempt_at ASC, id ASC
+                LIMIT $2
+                FOR UPDATE SKIP LOCKED
+            ), claimed AS (
+                UPDATE yonote_outbox AS o SET next_attempt_at = $3
+                FROM due WHERE o.id = due.id
+                RETURNING o.id, o.attempts, o.application_id, due.next_attempt_at AS due_at
+            )
+            SELECT claimed.id AS outbox_id, claimed.attempts, {a_columns}
+            FROM claimed JOIN applications a ON a.id = claimed.application_id
+            ORDER BY claimed.due_at ASC, claimed.id ASC
+            """,
+            now,
+            limit,
+            now + lease,
+        )
+
+    async def retry_outbox(self, outbox_id: int, delay: float, error: str) -> None:
+        await self._execute(
+            """
+            UPDATE yonote_outbox
+            SET attempts = attempts + 1, next_attempt_at = $1, last_error = $2
+            WHERE id = $3
+            """,
+            time.time() + delay,
+            error,
+            outbox_id,
+        )
+
+    async def defer_outbox(self, outbox_id: int, delay: float) -> None:
+        await self._execute(
+            "UPDATE yonote_outbox SET next_attempt_at = $1 WHERE id = $2",
+            time.time() + delay,
+            outbox_id,
+        )
+
+    async def dead_letter_outbox(self, outbox_id: int, error: str) -> None:
+        await self._execute(
+            """
+            UPDATE yonote_outbox
+            SET status = 'dead', attempts = attempts + 1, last_error = $1
+            WHERE id = $2
+            """,
+            error,
+            outbox_id,
+        )
+
+    async def list_outbox(self, status: Optional[str] = None) -> List[Row]:
+        if status is None:
+            return await self._fetch("SELECT * FROM yonote_outbox ORDER BY id ASC")
+        return await self._fetch(
+            "SELECT * FROM yonote_outbox WHERE status = $1 ORDER BY id ASC", status
+        )
+
+    # --- рассылка ---
+
+    async def mark_undeliverable(self, chat_id: int, reason: str) -> None:
+        await self._execute(
+            """
+            INSERT INTO undeliverable_chats (chat_id, reason) VALUES ($1, $2)
+            ON CONFLICT (chat_id) DO UPDATE SET reason = excluded.reason
+            """,
+            chat_id,
+            reason,
+        )
+
+    async def list_undeliverable(self) -> List[int]:
+        return [row["chat_id"] for row in await self._fetch("SELECT chat_id FROM undeliverable_chats")]
+
+    # --- состояние диалогов PTB ---
+
+    async def load_user_data(self) -> Dict[int, Dict[str, Any]]:
+        rows = await self._fetch("SELECT user_id, data FROM bot_user_data")
+        return {row["user_id"]: json.loads(row["data"]) for row in rows}
+
+    async def load_conversations(self, name: str) -> Dict[Tuple[Any, ...], Any]:
+        rows = await self._fetch("SELECT key, state FROM bot_conversations WHERE name = $1", name)
+        return {tuple(json.loads(row["key"])): json.loads(row["state"]) for row in rows}
+
+    async def save_persistence(
+        self,
+        user_data: Dict[int, Optional[Dict[str, Any]]],
+        conversations: Dict[Tuple[str, Tuple[Any, ...]], Any],
+    ) -> None:
+        now = time.time()
+        upsert_users = [
+            (user_id, json.dumps(data, ensure_ascii=False), now)
+            for user_id, data in user_data.items()
+            if data is not None
+        ]
+        drop_users = [(user_id,) for user_id, data in user_data.items() if data is None]
+        upsert_states = [
+            (name, json.dumps(list(key)), json.dumps(state), now)
+            for (name, key), state in conversations.items()
+            if state is not None
+        ]
+        drop_states = [
+            (name, json.dumps(list(key)))
+            for (name, key), state in conversations.items()
+            if state is None
+        ]
+        pool = await self._get_pool()
+        async with pool.acquire() as conn:
+            async with conn.transaction():
+                await conn.executemany(
+                    """
+                    INSERT INTO bot_user_data (user_id, data, updated_at) VALUES ($1, $2, $3)
+                    ON CONFLICT (user_id)
+                    DO UPDATE SET data = excluded.data, updated_at = excluded.updated_at
+                    """,
+                    upsert_users,
+                )
+                await conn.executemany("DELETE FROM bot_user_data WHERE user_id = $1", drop_users)
+                await conn.executemany(
+                    """
+                    INSERT INTO bot_conversations (name, key, state, updated_at)
+                    VALUES ($1, $2, $3, $4)
+                    ON CONFLICT (name, key)
+                    DO UPDATE SET state = excluded.state, updated_at = excluded.updated_at
+                    """,
+                    upsert_states,
+                )
+                await conn.executemany(
+                    "DELETE FROM bot_conversations WHERE name = $1 AND key = $2", drop_states
+                )
+
+    async def evict_persistence(self, older_than: float) -> int:
+        pool = await self._get_pool()
+        async with pool.acquire() as conn:
+            async with conn.transaction():
+                users = await conn.execute(
+                    "DELETE FROM bot_user_data WHERE updated_at < $1", older_than
+                )
+                states = await conn.execute(
+                    "DELETE FROM bot_conversations WHERE updated_at < $1", older_than
+                )
+        return _affected(users) + _affected(states)
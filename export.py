@@ -0,0 +1,211 @@
+"""Потоковая выгрузка заявок в CSV, JSONL или Parquet.
+
+Заявки читаются из базы кусками вместе с архивными, ответы анкеты из
+``answers_json`` раскладываются по отдельным колонкам ``answer_*``;
+память не растёт с размером базы. Parquet требует пакета ``pyarrow`` (необязательная
+зависимость).
+
+Пример::
+
+    python export.py applications.csv --status approved --since 2024-05-01
+"""
+
+import argparse
+import asyncio
+import csv
+import datetime as dtm
+import json
+import sys
+from itertools import islice
+from pathlib import Path
+from typing import IO, Any, Dict, Iterable, Iterator, List, Optional
+
+from storage import Repository, open_repository
+
+FORMATS = ("csv", "jsonl", "parquet")
+BASE_COLUMNS = (
+    "id",
+    "user_id",
+    "chat_id",
+    "username",
+    "full_name",
+    "status",
+    "admin_comment",
+    "created_at",
+    "updated_at",
+    "synced_to_yonote",
+)
+# поля анкеты из bot.SURVEY; неизвестные ключи в выгрузку не попадают
+ANSWER_FIELDS = ("full_name", "age", "job", "experience", "portfolio", "goals")
+COLUMNS = BASE_COLUMNS + tuple(f"answer_{field}" for field in ANSWER_FIELDS)
+CHUNK_SIZE = 1000
+
+
+class ExportError(Exception):
+    """Выгрузку невозможно выполнить (например, нет pyarrow для Parquet)."""
+
+
+def flatten(row: Any) -> Dict[str, Any]:
+    record = {column: row[column] for column in BASE_COLUMNS}
+    try:
+        answers = json.loads(row["answers_json"] or "{}")
+    except ValueError:
+        answers = {}
+    for field in ANSWER_FIELDS:
+        record[f"answer_{field}"] = answers.get(field)
+    return record
+
+
+def normalize_filters(
+    status: Optional[str] = None,
+    job: Optional[str] = None,
+    since: Optional[str] = None,
+    until: Optional[str] = None,
+) -> Dict[str, Any]:
+    """Переводит даты ``ГГГГ-ММ-ДД`` в границы по ``created_at`` (``until`` — включительно)."""
+    filters_: Dict[str, Any] = {"status": status, "job": job}
+    if since:
+        filters_["since"] = dtm.date.fromisoformat(since).isoformat()
+    if until:
+        filters_["until"] = (dtm.date.fromisoformat(until) + dtm.timedelta(days=1)).isoformat()
+    return filters_
+
+
+def _chunks(records: Iterable[Dict[str, Any]], size: int) -> Iterator[List[Dict[str, Any]]]:
+    iterator = iter(records)
+    while True:
+        chunk = list(islice(iterator, size))
+        if not chunk:
+            return
+        yield chunk
+
+
+def write_csv(records: Iterable[Dict[str, Any]], fp: IO[str]) -> int:
+    writer = csv.DictWriter(fp, fieldnames=COLUMNS)
+    writer.writeheader()
+    count = 0
+    for record in records:
+        writer.writerow(record)
+        count += 1
+    return count
+
+
+def write_jsonl(records: Iterable[Dict[str, Any]], fp: IO[str]) -> int:
+    count = 0
+    for record in records:
+        fp.write(json.dumps(record, ensure_ascii=False))
+        fp.write("\n")
+        count += 1
+    return count
+
+
+def write_parquet(records: Iterable[Dict[str, Any]], path: Path) -> int:
+    try:
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+    except ImportError:
+        raise ExportError("Для выгрузки в Parquet установите пакет pyarrow")
+
+    fields = [pa.field(column, pa.string()) for column in COLUMNS]
+    for column in ("id", "user_id", "chat_id", "synced_to_yonote"):
+        fields[COLUMNS.index(column)] = pa.field(column, pa.int64())
+    schema = pa.schema(fields)
+    count = 0
+    with pq.ParquetWriter(str(path), schema) as writer:
+        # каждый кусок — отдельная группа строк, в памяти не больше CHUNK_SIZE записей
+        for chunk in _chunks(records, CHUNK_SIZE):
+            columns = {column: [record[column] for record in chunk] for column in COLUMNS}
+            writer.write_table(pa.Table.from_pydict(columns, schema=schema))
+            count += len(chunk)
+    return count
+
+
+def write_records(rows: Iterable[Any], path: Path, fmt: str) -> int:
+    """Пишет строки заявок в ``path`` в формате ``fmt``; возвращает число строк."""
+    if fmt not in FORMATS:
+        raise ExportError(f"Неизвестный формат: {fmt}")
+    records = (flatten(row) for row in rows)
+    if fmt == "parquet":
+        return write_parquet(records, path)
+    with open(path, "w", encoding="utf-8", newline="") as fp:
+        if fmt == "csv":
+            return write_csv(records, fp)
+        return write_jsonl(records, fp)
+
+
+async def export_applications_async(
+    repo: Repository,
+    path: Path,
+    fmt: str = "csv",
+    include_archive: bool = True,
+    **filters: Any,
+) -> int:
+    """Выгружает заявки из любого хранилища, не блокируя event loop.
+
+    Файл пишется в отдельном потоке, а куски заявок он запрашивает у
+    хранилища обратно в event loop — по одному, так что память не растёт
+    с размером базы.
+    """
+    if fmt not in FORMATS:
+        raise ExportError(f"Неизвестный формат: {fmt}")
+    loop = asyncio.get_running_loop()
+
+    def rows() -> Iterator[Any]:
+        after_id = 0
+        while True:
+            chunk = asyncio.run_coroutine_threadsafe(
+                repo.list_applications(
+                    after_id=after_id, limit=CHUNK_SIZE, include_archive=include_archive, **filters
+                ),
+                loop,
+            ).result()
+            yield from chunk
+            if len(chunk) < CHUNK_SIZE:
+                return
+            after_id = chunk[-1]["id"]
+
+    return await asyncio.to_thread(write_records, rows(), path, fmt)
+
+
+def parse_args(argv: Optional[List[str]] = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Выгрузка заявок в CSV/JSONL/Parquet")
+    parser.add_argument("output", type=Path, help="файл выгрузки")
+    parser.add_argument(
+        "--format", choices=FORMATS, help="формат; по умолчанию — по расширению файла"
+    )
+    parser.add_argument("--status", help="только заявки с этим статусом")
+    parser.add_argument("--job", help="только заявки на эту должность")
+    parser.add_argument("--since", help="поданные с этой даты (ГГГГ-ММ-ДД)")
+    parser.add_argument("--until", help="поданные по эту дату включительно (ГГГГ-ММ-ДД)")
+    return parser.parse_args(argv)
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    from config import settings
+
+    args = parse_args(argv)
+    fmt = args.format or args.output.suffix.lstrip(".").lower()
+    try:
+        filters_ = normalize_filters(args.status, args.job, args.since, args.until)
+    except ValueError:
+        print("Даты задаются в формате ГГГГ-ММ-ДД", file=sys.stderr)
+        return 2
+
+    async def run() -> int:
+        repo = open_repository(settings)
+        try:
+            return await export_applications_async(repo, args.output, fmt, **filters_)
+        finally:
+            await repo.close()
+
+    try:
+        count = asyncio.run(run())
+    except ExportError as exc:
+        print(exc, file=sys.stderr)
+        return 2
+    print(f"Выгружено заявок: {count} → {args.output}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
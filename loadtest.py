@@ -0,0 +1,407 @@
+"""Нагрузочный прогон бота без сети.
+
+Поднимает приложение из ``bot.build_application`` с подменённым транспортом
+Bot API и локальной заглушкой Yonote, прогоняет через очередь обновлений
+тысячи одновременных «пользователей» (опрос, выбор должности, /status) и
+администраторов (/admin, одобрение/отклонение) и печатает пропускную
+способность и перцентили задержки обработки.
+
+Пример::
+
+    python loadtest.py --users 2000 --admins 5
+    python loadtest.py --users 2000 --storage memory
+    python loadtest.py --users 500 --api-latency 0.05 --concurrency 1,8,32
+
+Несколько значений ``--concurrency`` дают по прогону на каждое и таблицу
+масштабирования пропускной способности.
+"""
+
+import argparse
+import asyncio
+import itertools
+import json
+import logging
+import math
+import os
+import random
+import sys
+import tempfile
+import time
+from collections import defaultdict
+from typing import Any, Dict, List, Optional
+
+from telegram import Update
+from telegram.ext import Application, TypeHandler
+from telegram.request import BaseRequest, RequestData
+
+import config
+from storage import STORAGE_BACKENDS
+
+ADMIN_BASE_ID = 10 ** 9
+JOBS = ["Вокалист", "Переводчик", "Звукарь", "Видер", "Художник", "Программист", "Менеджер"]
+
+
+class OfflineRequest(BaseRequest):
+    """Транспорт Bot API, отвечающий успехом на любой вызов без обращения к сети."""
+
+    def __init__(self, latency: float = 0.0) -> None:
+        self.latency = latency
+        self.calls: Dict[str, int] = defaultdict(int)
+        self._message_ids = itertools.count(1)
+
+    async def initialize(self) -> None:
+        pass
+
+    async def shutdown(self) -> None:
+        pass
+
+    @property
+    def read_timeout(self) -> float:
+        return 1.0
+
+    async def do_request(
+        self, url: str, method: str, request_data: Optional[RequestData] = None, **kwargs: Any
+    ) -> tuple:
+        api_method = url.rsplit("/", 1)[-1]
+        self.calls[api_method] += 1
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        params = request_data.parameters if request_data else {}
+        if api_method == "getMe":
+            result: Any = {"id": 1, "is_bot": True, "first_name": "bot", "username": "bot"}
+        elif api_method in ("sendMessage", "editMessageText"):
+            result = {
+                "message_id": next(self._message_ids),
+                "date": int(time.time()),
+                "chat": {"id": params.get("chat_id", 1), "type": "private"},
+                "text": params.get("text", ""),
+            }
+        else:
+            result = True
+        return 200, json.dumps({"ok": True, "result": result}).encode()
+
+
+async def start_yonote_stub() -> tuple:
+    """Локальная заглушка Yonote API; возвращает (runner, базовый URL, счётчик документов)."""
+    # aiohttp подгружается здесь: OfflineRequest импортирует и coldstart.py
+    from aiohttp import web
+
+    created = itertools.count(1)
+    documents: List[int] = []
+
+    async def create_document(request: web.Request) -> web.Response:
+        doc_id = next(created)
+        documents.append(doc_id)
+        return web.json_response(
+            {"ok": True, "data": {"id": f"doc-{doc_id}", "url": f"http://yonote.local/doc-{doc_id}"}}
+        )
+
+    app = web.Application()
+    app.router.add_post("/api/documents.create", create_document)
+    runner = web.AppRunner(app, access_log=None)
+    await runner.setup()
+    site = web.TCPSite(runner, "127.0.0.1", 0)
+    await site.start()
+    port = site._server.sockets[0].getsockname()[1]  # type: ignore[union-attr]
+    return runner, f"http://127.0.0.1:{port}/api", documents
+
+
+def percentile(values: List[float], q: float) -> float:
+    """Перцентиль методом ближайшего ранга; для пустого списка — 0."""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    rank = math.ceil(q / 100 * len(ordered))
+    return ordered[max(0, min(len(ordered), rank) - 1)]
+
+
+class LoadTest:
+    """Подаёт синтетические обновления в приложение и замеряет задержку их обработки.
+
+    Задержка — время от постановки обновления в ``update_queue`` до окончания
+    работы всех обработчиков; её фиксирует ``TypeHandler`` в последней группе.
+    """
+
+    def __init__(
+        self,
+        application: Application,
+        *,
+        users: int,
+        admins: int,
+        admin_actions: int,
+        timeout: float = 60.0,
+    ) -> None:
+        self.application = application
+        self.users = users
+        self.admins = admins
+        self.admin_actions = admin_actions
+        self.timeout = timeout
+        self.latencies: Dict[str, List[float]] = defaultdict(list)
+        self.errors = 0
+        self.timeouts = 0
+        self._update_ids = itertools.count(1)
+        self._pending: Dict[int, tuple] = {}
+        self._submitted = 0
+        application.add_handler(TypeHandler(Update, self._record), group=sys.maxsize)
+        application.add_error_handler(self._on_error)
+
+    async def _record(self, update: Update, context: Any) -> None:
+        pending = self._pending.pop(update.update_id, None)
+        if pending is not None:
+            kind, started, future = pending
+            self.latencies[kind].append(time.perf_counter() - started)
+            if not future.done():
+                future.set_result(None)
+
+    async def _on_error(self, update: object, context: Any) -> None:
+        self.errors += 1
+        logging.getLogger(__name__).debug("Ошибка обработчика: %s", context.error)
+
+    def _message(self, user_id: int, text: str) -> Dict[str, Any]:
+        message: Dict[str, Any] = {
+            "message_id": next(self._update_ids),
+            "date": int(time.time()),
+            "chat": {"id": user_id, "type": "private"},
+            "from": {"id": user_id, "is_bot": False, "first_name": f"User{user_id}"},
+            "text": text,
+        }
+        if text.startswith("/"):
+            message["entities"] = [
+                {"type": "bot_command", "offset": 0, "length": len(text.split()[0])}
+            ]
+        return message
+
+    async def send(self, kind: str, user_id: int, *, text: str = "", data: str = "") -> None:
+        update_id = next(self._update_ids)
+        if data:
+            message = self._message(user_id, "…")
+            message["from"] = {"id": 1, "is_bot": True, "first_name": "bot"}
+            payload = {
+                "update_id": update_id,
+                "callback_query": {
+                    "id": str(update_id),
+                    "from": {"id": user_id, "is_bot": False, "first_name": f"User{user_id}"},
+                    "chat_instance": str(user_id),
+                    "data": data,
+                    "message": message,
+                },
+            }
+        else:
+            payload = {"update_id": update_id, "message": self._message(user_id, text)}
+        update = Update.de_json(payload, self.application.bot)
+        future = asyncio.get_running_loop().create_future()
+        self._pending[update_id] = (kind, time.perf_counter(), future)
+        await self.application.update_queue.put(update)
+        try:
+            await asyncio.wait_for(future, self.timeout)
+        except asyncio.TimeoutError:
+            self._pending.pop(update_id, None)
+            self.timeouts += 1
+
+    async def applicant(self, user_id: int) -> None:
+        await self.send("start", user_id, text="/start")
+        await self.send("answer", user_id, text=f"User{user_id}")
+        await self.send("answer", user_id, text=str(random.randint(16, 40)))
+        await self.send("job", user_id, data=f"job:{random.choice(JOBS)}")
+        for answer in ("2 года", "http://example.com", "Хочу в команду"):
+            await self.send("answer", user_id, text=answer)
+        self._submitted += 1
+        await self.send("status", user_id, text="/status")
+
+    async def admin(self, admin_id: int) -> None:
+        for _ in range(self.admin_actions):
+            await self.send("admin", admin_id, text="/admin")
+            if self._submitted:
+                action = random.choice(("approve", "decline"))
+                app_id = random.randint(1, self._submitted)
+                await self.send("decision", admin_id, data=f"{action}:{app_id}")
+            await asyncio.sleep(0.01)
+
+    async def run(self) -> Dict[str, Any]:
+        started = time.perf_counter()
+        await asyncio.gather(
+            *(self.applicant(user_id) for user_id in range(1, self.users + 1)),
+            *(self.admin(ADMIN_BASE_ID + index) for index in range(self.admins)),
+        )
+        elapsed = time.perf_counter() - started
+        return self.report(elapsed)
+
+    def report(self, elapsed: float) -> Dict[str, Any]:
+        def summary(values: List[float]) -> Dict[str, Any]:
+            return {
+                "count": len(values),
+                "p50_ms": round(percentile(values, 50) * 1000, 2),
+                "p95_ms": round(percentile(values, 95) * 1000, 2),
+                "p99_ms": round(percentile(values, 99) * 1000, 2),
+            }
+
+        everything = [value for values in self.latencies.values() for value in values]
+        return {
+            "users": self.users,
+            "admins": self.admins,
+            "updates": len(everything),
+            "errors": self.errors,
+            "timeouts": self.timeouts,
+            "elapsed_s": round(elapsed, 3),
+            "throughput_per_s": round(len(everything) / elapsed, 1) if elapsed else 0.0,
+            "latency": summary(everything),
+            "by_kind": {kind: summary(values) for kind, values in sorted(self.latencies.items())},
+        }
+
+
+def print_report(report: Dict[str, Any]) -> None:
+    print(
+        f"Пользователей: {report['users']}, администраторов: {report['admins']}, "
+        f"параллельно обновлений: {report['concurrency']}"
+    )
+    print(
+        f"Обновлений: {report['updates']} за {report['elapsed_s']} с "
+        f"({report['throughput_per_s']} в секунду)"
+    )
+    print(f"Ошибок: {report['errors']}, таймаутов: {report['timeouts']}")
+    print(f"Документов в Yonote: {report.get('documents', 0)}")
+    print(f"{'тип':<10}{'кол-во':>8}{'p50, мс':>10}{'p95, мс':>10}{'p99, мс':>10}")
+    rows = list(report["by_kind"].items()) + [("всего", report["latency"])]
+    for kind, stats in rows:
+        print(
+            f"{kind:<10}{stats['count']:>8}{stats['p50_ms']:>10}"
+            f"{stats['p95_ms']:>10}{stats['p99_ms']:>10}"
+        )
+
+
+def print_scaling(reports: List[Dict[str, Any]]) -> None:
+    """Пропускная способность и задержки по прогонам с разным пределом параллельности."""
+    base = reports[0]["throughput_per_s"] or 1.0
+    print(f"{'предел':<8}{'в секунду':>12}{'ускорение':>11}{'p50, мс':>10}{'p99, мс':>10}{'ошибок':>8}")
+    for report in reports:
+        latency = report["latency"]
+        print(
+            f"{report['concurrency']:<8}{report['throughput_per_s']:>12}"
+            f"{report['throughput_per_s'] / base:>10.1f}x{latency['p50_ms']:>10}"
+            f"{latency['p99_ms']:>10}{report['errors'] + report['timeouts']:>8}"
+        )
+
+
+async def run_loadtest(args: argparse.Namespace, concurrency: Optional[int] = None) -> Dict[str, Any]:
+    stub_runner, stub_url, documents = await start_yonote_stub()
+    tmpdir = tempfile.TemporaryDirectory()
+    # настройки читаются при первом обращении к config.settings — готовим окружение заранее
+    # и сбрасываем настройки предыдущего прогона (его база и заглушка Yonote уже закрыты)
+    saved_environ = dict(os.environ)
+    config.reset_settings()
+    os.environ.update(
+        {
+            "TELEGRAM_BOT_TOKEN": "123456:loadtest",
+            "DATABASE_PATH": os.path.join(tmpdir.name, "applications.db"),
+            "STORAGE_BACKEND": args.storage,
+            "ADMIN_IDS": ",".join(str(ADMIN_BASE_ID + index) for index in range(args.admins)),
+            "YONOTE_BASE_URL": stub_url,
+            "YONOTE_API_KEY": "loadtest",
+            "YONOTE_COLLECTION_ID": "loadtest",
+            "BOT_MODE": "polling",
+            # сторонний Bot API не ограничивает — ограничения проверяются отдельно
+            "NOTIFY_GLOBAL_RATE": "100000",
+            "NOTIFY_CHAT_RATE": "100000",
+            # защита от флуда отсекла бы синтетических пользователей, шлющих ответы подряд
+            "ANTIFLOOD_USER_RATE": "0",
+            "ANTIFLOOD_GLOBAL_RATE": "0",
+            "METRICS_PORT": "0",
+        }
+    )
+    try:
+        import bot
+
+        application = bot.build_application(
+            request=OfflineRequest(args.api_latency),
+            get_updates_request=OfflineRequest(),
+            concurrent_updates=concurrency,
+        )
+        loadtest = LoadTest(
+            application,
+            users=args.users,
+            admins=args.admins,
+            admin_actions=args.admin_actions,
+            timeout=args.timeout,
+        )
+        await application.initialize()
+        try:
+            if application.post_init:
+                await application.post_init(application)
+            await application.start()
+            report = await loadtest.run()
+            await bot.outbox_worker.drain()
+            report["documents"] = len(documents)
+            report["concurrency"] = application.concurrent_updates
+        finally:
+            if application.running:
+                await application.stop()
+            await application.shutdown()
+            if application.post_shutdown:
+                await application.post_shutdown(application)
+    finally:
+        await stub_runner.cleanup()
+        tmpdir.cleanup()
+        # окружение и настройки прогона не должны достаться вызывающему коду
+        os.environ.clear()
+        os.environ.update(saved_environ)
+        config.reset_settings()
+    return report
+
+
+def _concurrency_list(value: str) -> List[Optional[int]]:
+    try:
+        limits = [int(item) for item in value.split(",") if item.strip()]
+    except ValueError:
+        raise argparse.ArgumentTypeError("ожидаются целые числа через запятую") from None
+    if not limits or min(limits) < 1:
+        raise argparse.ArgumentTypeError("пределы должны быть не меньше 1")
+    return limits
+
+
+def parse_args(argv: Optional[List[str]] = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Нагрузочный прогон бота без сети")
+    parser.add_argument("--users", type=int, default=1000, help="число одновременных заявителей")
+    parser.add_argument("--admins", type=int, default=3, help="число одновременных администраторов")
+    parser.add_argument(
+        "--admin-actions", type=int, default=20, help="сколько раз каждый администратор открывает /admin"
+    )
+    parser.add_argument(
+        "--api-latency", type=float, default=0.0, help="имитируемая задержка Bot API, секунд"
+    )
+    parser.add_argument(
+        "--storage",
+        choices=STORAGE_BACKENDS,
+        default="sqlite",
+        help="движок хранилища; для postgres нужен DATABASE_URL в окружении",
+    )
+    parser.add_argument(
+        "--concurrency",
+        type=_concurrency_list,
+        default=[None],
+        help="предел одновременно обрабатываемых обновлений (по умолчанию CONCURRENT_UPDATES); "
+        "несколько значений через запятую — прогон на каждое",
+    )
+    parser.add_argument("--timeout", type=float, default=60.0, help="таймаут на одно обновление")
+    parser.add_argument("--seed", type=int, default=None, help="зерно генератора случайных чисел")
+    parser.add_argument("--json", action="store_true", help="вывести отчёт в JSON")
+    return parser.parse_args(argv)
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    args = parse_args(argv)
+    random.seed(args.seed)
+    logging.basicConfig(level=logging.WARNING)
+    reports = [asyncio.run(run_loadtest(args, limit)) for limit in args.concurrency]
+    if args.json:
+        payload = reports[0] if len(reports) == 1 else reports
+        print(json.dumps(payload, ensure_ascii=False, indent=2))
+        return
+    for report in reports:
+        print_report(report)
+        print()
+    if len(reports) > 1:
+        print_scaling(reports)
+
+
+if __name__ == "__main__":
+    main()
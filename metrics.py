@@ -0,0 +1,159 @@
+import functools
+import logging
+import time
+from typing import TYPE_CHECKING, Any, Awaitable, Callable, Iterable, Optional, TypeVar
+
+from prometheus_client import CONTENT_TYPE_LATEST, Counter, Gauge, Histogram, generate_latest
+
+if TYPE_CHECKING:  # pragma: no cover
+    from aiohttp import web
+    from telegram.ext import Application, BaseHandler
+
+# db.py и yonote_client.py импортируют этот модуль ради счётчиков, поэтому
+# aiohttp и PTB подгружаются только там, где они действительно нужны
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+METRICS_PATH = "/metrics"
+
+# обработчики и запросы к SQLite обычно укладываются в миллисекунды
+FAST_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+
+HANDLER_LATENCY = Histogram(
+    "bot_handler_duration_seconds",
+    "Время работы обработчика обновления",
+    ["handler"],
+    buckets=FAST_BUCKETS,
+)
+HANDLER_ERRORS = Counter(
+    "bot_handler_errors_total", "Исключения в обработчиках обновлений", ["handler"]
+)
+DB_LATENCY = Histogram(
+    "bot_db_query_duration_seconds",
+    "Время выполнения метода ApplicationRepository",
+    ["method"],
+    buckets=FAST_BUCKETS,
+)
+YONOTE_REQUESTS = Counter(
+    "bot_yonote_requests_total", "Вызовы Yonote API по результату", ["method", "outcome"]
+)
+YONOTE_LATENCY = Histogram(
+    "bot_yonote_request_duration_seconds",
+    "Время вызова Yonote API вместе с повторами",
+    ["method", "outcome"],
+)
+SURVEY_EVENTS = Counter(
+    "bot_survey_events_total",
+    "Воронка опроса: начатые, пройденные шаги, завершённые и отменённые",
+    ["event", "step"],
+)
+QUEUE_DEPTH = Gauge("bot_queue_depth", "Число элементов в очереди", ["queue"])
+UPDATES_DROPPED = Counter(
+    "bot_updates_dropped_total", "Обновления, отброшенные защитой от флуда", ["reason"]
+)
+STATUS_CACHE_REQUESTS = Counter(
+    "bot_status_cache_requests_total", "Обращения к кэшу последней заявки (/status)", ["result"]
+)
+
+
+def observe_db(method: str, seconds: float) -> None:
+    DB_LATENCY.labels(method).observe(seconds)
+
+
+def observe_yonote(method: str, outcome: str, seconds: float) -> None:
+    YONOTE_REQUESTS.labels(method, outcome).inc()
+    YONOTE_LATENCY.labels(method, outcome).observe(seconds)
+
+
+def survey_event(event: str, step: str = "") -> None:
+    """Отмечает событие воронки: ``started``, ``step`` (с именем поля), ``completed``,
+    ``cancelled``, ``timeout``.
+    """
+    SURVEY_EVENTS.labels(event, step).inc()
+
+
+def update_dropped(reason: str) -> None:
+    UPDATES_DROPPED.labels(reason).inc()
+
+
+def status_cache_lookup(hit: bool) -> None:
+    STATUS_CACHE_REQUESTS.labels("hit" if hit else "miss").inc()
+
+
+def track_queue(name: str, size: Callable[[], int]) -> None:
+    """Публикует глубину очереди; значение читается в момент сбора метрик."""
+    QUEUE_DEPTH.labels(name).set_function(size)
+
+
+def timed_handler(name: str, callback: Callable[..., Awaitable[T]]) -> Callable[..., Awaitable[T]]:
+    from telegram.ext import ApplicationHandlerStop
+
+    @functools.wraps(callback)
+    async def wrapper(*args: Any, **kwargs: Any) -> T:
+        started = time.perf_counter()
+        try:
+            return await callback(*args, **kwargs)
+        except ApplicationHandlerStop:
+            # штатная остановка обработки обновления, а не ошибка
+            raise
+        except Exception:
+            HANDLER_ERRORS.labels(name).inc()
+            raise
+        finally:
+            HANDLER_LATENCY.labels(name).observe(time.perf_counter() - started)
+
+    wrapper.metrics_name = name  # type: ignore[attr-defined]
+    return wrapper
+
+
+def _walk(handlers: Iterable["BaseHandler"]) -> Iterable["BaseHandler"]:
+    from telegram.ext import ConversationHandler
+
+    for handler in handlers:
+        if isinstance(handler, ConversationHandler):
+            yield from _walk(handler.entry_points)
+            for state_handlers in handler.states.values():
+                yield from _walk(state_handlers)
+            yield from _walk(handler.fallbacks)
+        else:
+            yield handler
+
+
+def instrument_handlers(application: "Application") -> int:
+    """Оборачивает колбэки всех зарегистрированных обработчиков замером времени.
+
+    Метка ``handler`` — имя функции-колбэка. Обработчики внутри
+    ConversationHandler тоже оборачиваются. Возвращает число обёрнутых колбэков.
+    """
+    wrapped = 0
+    for handler in _walk(
+        handler for group in application.handlers.values() for handler in group
+    ):
+        if hasattr(handler.callback, "metrics_name"):
+            continue
+        handler.callback = timed_handler(handler.callback.__name__, handler.callback)
+        wrapped += 1
+    return wrapped
+
+
+async def metrics_endpoint(request: "web.Request") -> "web.Response":
+    from aiohttp import web
+
+    return web.Response(body=generate_latest(), headers={"Content-Type": CONTENT_TYPE_LATEST})
+
+
+async def start_metrics_server(host: str, port: int) -> Optional["web.AppRunner"]:
+    """Поднимает HTTP-сервер с ``/metrics``; при ``port == 0`` ничего не делает."""
+    if not port:
+        return None
+    from aiohttp import web
+
+    app = web.Application()
+    app.router.add_get(METRICS_PATH, metrics_endpoint)
+    runner = web.AppRunner(app, access_log=None)
+    await runner.setup()
+    await web.TCPSite(runner, host, port).start()
+    logger.info("Метрики доступны на http://%s:%s%s", host, port, METRICS_PATH)
+    return runner
@@ -0,0 +1,263 @@
+import asyncio
+import datetime as dtm
+import logging
+import random
+import time
+from typing import Any, Callable, Dict, Iterable, NamedTuple, Optional, Set, Tuple, Union
+
+from telegram.error import BadRequest, ChatMigrated, Forbidden, NetworkError, RetryAfter
+
+from storage import Repository
+
+logger = logging.getLogger(__name__)
+
+# Ограничения Telegram: около 30 сообщений в секунду на бота и 1 в секунду в один чат
+GLOBAL_RATE = 30.0
+CHAT_RATE = 1.0
+# BadRequest с таким текстом означает, что чата больше нет
+UNDELIVERABLE_MESSAGES = ("chat not found", "user is deactivated", "peer_id_invalid")
+
+
+class TokenBucket:
+    """Ведро токенов: ``rate`` токенов в секунду, не больше ``capacity`` про запас.
+
+    :meth:`reserve` сразу забирает токен (уходя в минус, если их нет) и
+    возвращает, сколько секунд нужно подождать перед отправкой, — так
+    очередь желающих выстраивается без блокировок.
+    """
+
+    def __init__(
+        self, rate: float, capacity: float = 1.0, clock: Callable[[], float] = time.monotonic
+    ) -> None:
+        self.rate = rate
+        self.capacity = max(1.0, capacity)
+        self._clock = clock
+        self._tokens = self.capacity
+        self._updated = clock()
+
+    def _refill(self) -> None:
+        now = self._clock()
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def reserve(self) -> float:
+        self._refill()
+        self._tokens -= 1
+        return 0.0 if self._tokens >= 0 else -self._tokens / self.rate
+
+    def try_acquire(self) -> bool:
+        """Забирает токен, только если он есть, — для отбрасывания лишней нагрузки."""
+        self._refill()
+        if self._tokens < 1:
+            return False
+        self._tokens -= 1
+        return True
+
+    def pause(self, seconds: float) -> None:
+        """Запрещает выдачу токенов на ``seconds`` секунд (ответ RetryAfter)."""
+        self._refill()
+        self._tokens = min(self._tokens, 0.0) - seconds * self.rate
+
+    @property
+    def idle(self) -> bool:
+        self._refill()
+        return self._tokens >= self.capacity
+
+
+class Notification(NamedTuple):
+    chat_id: int
+    text: str
+    attempts: int = 0
+
+
+def _seconds(value: Union[int, float, dtm.timedelta]) -> float:
+    if isinstance(value, dtm.timedelta):
+        return value.total_seconds()
+    return float(value)
+
+
+class NotificationDispatcher:
+    """Очередь уведомлений пользователям с учётом лимитов Telegram.
+
+    Сообщения отправляются ``concurrency`` воркерами; каждый перед отправкой
+    берёт токен из ведра своего чата и из общего ведра бота. ``RetryAfter``
+    приостанавливает общее ведро на указанное Telegram время, сетевые ошибки
+    повторяются с экспоненциальной задержкой. Чаты, где бот заблокирован,
+    записываются в ``undeliverable_chats`` и дальше пропускаются.
+    """
+
+    def __init__(
+        self,
+        repo: Repository,
+        *,
+        global_rate: float = GLOBAL_RATE,
+        chat_rate: float = CHAT_RATE,
+        queue_size: int = 1000,
+        concurrency: int = 8,
+        max_attempts: int = 5,
+        base_delay: float = 1.0,
+        max_delay: float = 60.0,
+        max_chat_buckets: int = 10000,
+    ) -> None:
+        self.repo = repo
+        self.chat_rate = chat_rate
+        self.queue_size = queue_size
+        self.concurrency = max(1, concurrency)
+        self.max_attempts = max(1, max_attempts)
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.max_chat_buckets = max_chat_buckets
+        self.global_bucket = TokenBucket(global_rate, capacity=global_rate)
+        self._chat_buckets: Dict[int, TokenBucket] = {}
+        self.undeliverable: Set[int] = set()
+        self.sent = 0
+        self.failed = 0
+        self._bot: Any = None
+        self._queue: Optional[asyncio.Queue] = None
+        self._workers: Set[asyncio.Task] = set()
+        self._retries: Set[asyncio.Task] = set()
+
+    async def start(self, bot: Any) -> None:
+        if self._workers:
+            return
+        self._bot = bot
+        self._queue = asyncio.Queue(maxsize=self.queue_size)
+        self.undeliverable = set(await self.repo.list_undeliverable())
+        for index in range(self.concurrency):
+            self._workers.add(asyncio.create_task(self._run(), name=f"notify-{index}"))
+        logger.info("Рассылка уведомлений запущена (воркеров: %s)", self.concurrency)
+
+    async def stop(self, timeout: float = 10.0) -> None:
+        """Дожидается отправки очереди (не дольше ``timeout``) и останавливает воркеры."""
+        if not self._workers:
+            return
+        assert self._queue is not None
+        try:
+            await asyncio.wait_for(self.join(), timeout)
+        except asyncio.TimeoutError:
+            logger.warning("Не отправлено уведомлений при остановке: %s", self._queue.qsize())
+        for task in (*self._workers, *self._retries):
+            task.cancel()
+        await asyncio.gather(*self._workers, *self._retries, return_exceptions=True)
+        self._workers.clear()
+        self._retries.clear()
+        logger.info("Рассылка уведомлений остановлена")
+
+    async def join(self) -> None:
+        """Ждёт, пока очередь и отложенные повторы опустеют."""
+        assert self._queue is not None
+        while True:
+            await self._queue.join()
+            if not self._retries:
+                return
+            await asyncio.wait(set(self._retries))
+
+    async def send(self, chat_id: int, text: str) -> bool:
+        """Ставит сообщение в очередь; при полной очереди ждёт места.
+
+        Возвращает False, если чат помечен как недоступный.
+        """
+        if self._queue is None:
+            raise RuntimeError("Рассылка уведомлений не запущена")
+        if chat_id in self.undeliverable:
+            logger.info("Чат %s недоступен, уведомление пропущено", chat_id)
+            return False
+        await self._queue.put(Notification(chat_id, text))
+        return True
+
+    async def send_many(self, messages: Iterable[Tuple[int, str]]) -> int:
+        """Ставит в очередь пачку сообщений; возвращает число принятых.
+
+        Темп отправки всё равно задают вёдра токенов, так что пачка
+        в сотни сообщений расходится за секунды без флуд-ошибок.
+        """
+        accepted = 0
+        for chat_id, text in messages:
+            accepted += await self.send(chat_id, text)
+        return accepted
+
+    def qsize(self) -> int:
+        return self._queue.qsize() if self._queue is not None else 0
+
+    def mark_deliverable(self, chat_id: int) -> None:
+        """Снимает отметку недоступности (пользователь снова написал боту)."""
+        self.undeliverable.discard(chat_id)
+
+    def backoff(self, attempts: int) -> float:
+        delay = min(self.max_delay, self.base_delay * (2 ** attempts))
+        return delay * random.uniform(0.5, 1.0)
+
+    def _chat_bucket(self, chat_id: int) -> TokenBucket:
+        bucket = self._chat_buckets.get(chat_id)
+        if bucket is None:
+            if len(self._chat_buckets) >= self.max_chat_buckets:
+                # полные вёдра ничем не отличаются от новых — их можно выбросить
+                self._chat_buckets = {
+                    key: value for key, value in self._chat_buckets.items() if not value.idle
+                }
+            bucket = self._chat_buckets[chat_id] = TokenBucket(self.chat_rate)
+        return bucket
+
+    async def _run(self) -> None:
+        assert self._queue is not None
+        while True:
+            item = await self._queue.get()
+            try:
+                await self._deliver(item)
+            except asyncio.CancelledError:
+                raise
+            except Exception:  # pragma: no cover - не даём воркеру умереть
+                logger.exception("Ошибка при отправке уведомления в чат %s", item.chat_id)
+            finally:
+                self._queue.task_done()
+
+    async def _deliver(self, item: Notification) -> None:
+        if item.chat_id in self.undeliverable:
+            return
+        await asyncio.sleep(self._chat_bucket(item.chat_id).reserve())
+        await asyncio.sleep(self.global_bucket.reserve())
+        try:
+            await self._bot.send_message(chat_id=item.chat_id, text=item.text)
+        except RetryAfter as exc:
+            delay = _seconds(exc.retry_after)
+            self.global_bucket.pause(delay)
+            logger.warning("Telegram просит подождать %.0f с перед отправкой", delay)
+            self._retry(item, 0.0, str(exc))
+        except (Forbidden, ChatMigrated) as exc:
+            await self._mark_undeliverable(item.chat_id, str(exc))
+        except BadRequest as exc:
+            if any(message in exc.message.lower() for message in UNDELIVERABLE_MESSAGES):
+                await self._mark_undeliverable(item.chat_id, str(exc))
+            else:
+                self.failed += 1
+                logger.error("Telegram отклонил уведомление в чат %s: %s", item.chat_id, exc)
+        except NetworkError as exc:
+            self._retry(item, self.backoff(item.attempts + 1), str(exc))
+        else:
+            self.sent += 1
+
+    def _retry(self, item: Notification, delay: float, error: str) -> None:
+        attempts = item.attempts + 1
+        if attempts >= self.max_attempts:
+            self.failed += 1
+            logger.error(
+                "Не удалось отправить уведомление в чат %s после %s попыток: %s",
+                item.chat_id,
+                attempts,
+                error,
+            )
+            return
+        task = asyncio.create_task(self._requeue(item._replace(attempts=attempts), delay))
+        self._retries.add(task)
+        task.add_done_callback(self._retries.discard)
+
+    async def _requeue(self, item: Notification, delay: float) -> None:
+        assert self._queue is not None
+        await asyncio.sleep(delay)
+        await self._queue.put(item)
+
+    async def _mark_undeliverable(self, chat_id: int, reason: str) -> None:
+        self.undeliverable.add(chat_id)
+        self.failed += 1
+        await self.repo.mark_undeliverable(chat_id, reason)
+        logger.info("Чат %s помечен как недоступный: %s", chat_id, reason)
@@ -0,0 +1,232 @@
+import asyncio
+import logging
+import random
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Sequence, Set
+
+from storage import Repository
+from yonote_client import CircuitOpenError
+
+logger = logging.getLogger(__name__)
+
+Publisher = Callable[[Any], Awaitable[Optional[dict]]]
+DigestPublisher = Callable[[str, Sequence[Any]], Awaitable[Optional[dict]]]
+
+
+class OutboxWorker:
+    """Фоновая выгрузка заявок из таблицы ``yonote_outbox`` в Yonote.
+
+    Записи обрабатываются с ограниченной параллельностью. Неудачные попытки
+    повторяются с экспоненциальной задержкой, а после ``max_attempts`` запись
+    переводится в статус ``dead`` и больше не трогается.
+    """
+
+    def __init__(
+        self,
+        repo: Repository,
+        publish: Publisher,
+        *,
+        concurrency: int = 4,
+        max_attempts: int = 8,
+        poll_interval: float = 5.0,
+        base_delay: float = 5.0,
+        max_delay: float = 900.0,
+    ) -> None:
+        self.repo = repo
+        self.publish = publish
+        self.concurrency = max(1, concurrency)
+        self.max_attempts = max(1, max_attempts)
+        self.poll_interval = poll_interval
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self._wakeup: Optional[asyncio.Event] = None
+        self._task: Optional[asyncio.Task] = None
+        self._inflight: Set[asyncio.Task] = set()
+
+    async def start(self) -> None:
+        if self._task is not None:
+            return
+        self._wakeup = asyncio.Event()
+        self._task = asyncio.create_task(self._run(), name="yonote-outbox")
+        logger.info("Outbox-воркер запущен (параллельность %s)", self.concurrency)
+
+    async def stop(self) -> None:
+        if self._task is None:
+            return
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        self._task = None
+        if self._inflight:
+            await asyncio.gather(*self._inflight, return_exceptions=True)
+        logger.info("Outbox-воркер остановлен")
+
+    def wake(self) -> None:
+        """Просит воркер не ждать следующего интервала опроса."""
+        if self._wakeup is not None:
+            self._wakeup.set()
+
+    def backoff(self, attempts: int) -> float:
+        delay = min(self.max_delay, self.base_delay * (2 ** attempts))
+        return delay * random.uniform(0.5, 1.0)
+
+    async def drain(self) -> int:
+        """Обрабатывает все готовые записи и ждёт завершения; возвращает их число."""
+        total = 0
+        while True:
+            free = self._free_slots()
+            rows = await self.repo.claim_outbox(limit=free) if free else []
+            if not rows:
+                if self._inflight:
+                    await asyncio.wait(self._inflight, return_when=asyncio.FIRST_COMPLETED)
+                    continue
+                return total
+            total += len(rows)
+            for row in rows:
+                self._spawn(row)
+            await asyncio.sleep(0)
+
+    async def _run(self) -> None:
+        assert self._wakeup is not None
+        while True:
+            try:
+                await self.drain()
+            except asyncio.CancelledError:
+                raise
+            except Exception:  # pragma: no cover - не даём воркеру умереть
+                logger.exception("Ошибка в цикле outbox-воркера")
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=self.poll_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+
+    def _free_slots(self) -> int:
+        return max(0, self.concurrency - len(self._inflight))
+
+    def _spawn(self, row: Any) -> None:
+        task = asyncio.create_task(self._process(row))
+        self._inflight.add(task)
+        task.add_done_callback(self._inflight.discard)
+
+    async def _process(self, row: Any) -> None:
+        try:
+            doc = await self.publish(row)
+            error = None if doc is not None else "Yonote не вернул документ"
+        except CircuitOpenError as exc:
+            # Yonote лежит — ждём, пока размыкатель пропустит пробный запрос,
+            # и не тратим на это попытки
+            await self.repo.defer_outbox(row["outbox_id"], exc.retry_after)
+            return
+        except Exception as exc:
+            doc, error = None, f"{type(exc).__name__}: {exc}"
+        if doc is not None:
+            await self.repo.mark_synced(row["id"])
+            logger.info("Заявка %s выгружена в Yonote", row["id"])
+            return
+        await self._fail(row, error)
+
+    async def _fail(self, row: Any, error: str) -> None:
+        """Планирует повтор записи с backoff или переводит её в dead-letter."""
+        attempts = row["attempts"] + 1
+        if attempts >= self.max_attempts:
+            await self.repo.dead_letter_outbox(row["outbox_id"], error)
+            logger.error(
+                "Заявка %s не выгружена после %s попыток: %s", row["id"], attempts, error
+            )
+            return
+        delay = self.backoff(attempts)
+        await self.repo.retry_outbox(row["outbox_id"], delay, error)
+        logger.warning(
+            "Не удалось выгрузить заявку %s (попытка %s), повтор через %.0f с: %s",
+            row["id"],
+            attempts,
+            delay,
+            error,
+        )
+
+
+def digest_title(rows: Sequence[Any], group: Optional[str] = None) -> str:
+    """Заголовок сводки: период по времени подачи и, при группировке, должность."""
+    first = str(rows[0]["created_at"])[:16]
+    last = str(rows[-1]["created_at"])[:16]
+    period = first if first == last else f"{first} — {last}"
+    title = f"Сводка заявок {period}"
+    return f"{title} · {group}" if group else title
+
+
+class OutboxDigest(OutboxWorker):
+    """Выгрузка outbox сводками: один документ Yonote на пачку заявок.
+
+    Собственного цикла не запускает — :meth:`drain` вызывается по расписанию
+    (``JobQueue``). Записи забираются из outbox так же, как у
+    :class:`OutboxWorker`, группируются (все вместе или по должности) и
+    уходят одним документом на группу; после успеха все заявки группы
+    помечаются выгруженными одной транзакцией. Неудача откладывает каждую
+    запись группы по тем же правилам backoff и dead-letter.
+    """
+
+    def __init__(
+        self,
+        repo: Repository,
+        publish: DigestPublisher,
+        *,
+        group_by: str = "all",
+        batch_size: int = 200,
+        max_attempts: int = 8,
+        base_delay: float = 5.0,
+        max_delay: float = 900.0,
+    ) -> None:
+        super().__init__(
+            repo,
+            publish,  # type: ignore[arg-type]
+            concurrency=1,
+            max_attempts=max_attempts,
+            base_delay=base_delay,
+            max_delay=max_delay,
+        )
+        self.publish_digest = publish
+        self.group_by = group_by
+        self.batch_size = max(1, batch_size)
+
+    async def start(self) -> None:
+        # сводки публикует JobQueue по расписанию, фоновый цикл не нужен
+        pass
+
+    async def drain(self) -> int:
+        """Публикует сводки по всем готовым записям; возвращает число заявок."""
+        total = 0
+        while True:
+            rows = await self.repo.claim_outbox(limit=self.batch_size)
+            if not rows:
+                return total
+            total += len(rows)
+            for group, items in self._group(rows).items():
+                await self._publish_group(group, items)
+
+    def _group(self, rows: Sequence[Any]) -> Dict[Optional[str], List[Any]]:
+        if self.group_by != "job":
+            return {None: list(rows)}
+        groups: Dict[Optional[str], List[Any]] = {}
+        for row in rows:
+            groups.setdefault(row["job"] or "Без должности", []).append(row)
+        return groups
+
+    async def _publish_group(self, group: Optional[str], rows: List[Any]) -> None:
+        rows.sort(key=lambda row: (str(row["created_at"]), row["id"]))
+        try:
+            doc = await self.publish_digest(digest_title(rows, group), rows)
+            error = None if doc is not None else "Yonote не вернул документ"
+        except CircuitOpenError as exc:
+            for row in rows:
+                await self.repo.defer_outbox(row["outbox_id"], exc.retry_after)
+            return
+        except Exception as exc:
+            doc, error = None, f"{type(exc).__name__}: {exc}"
+        if doc is not None:
+            await self.repo.mark_synced_many([row["id"] for row in rows])
+            logger.info("Сводка из %s заявок выгружена в Yonote", len(rows))
+            return
+        for row in rows:
+            await self._fail(row, error)
@@ -0,0 +1,141 @@
+import asyncio
+import logging
+import time
+from typing import Any, Dict, Optional, Tuple
+
+from telegram.ext import BasePersistence, PersistenceInput
+
+from storage import Repository
+
+logger = logging.getLogger(__name__)
+
+ConversationKey = Tuple[Any, ...]
+
+
+class RepositoryPersistence(BasePersistence):
+    """Хранит ``user_data`` и состояния ConversationHandler в хранилище заявок.
+
+    Подходит любой движок :class:`~storage.Repository` (SQLite, PostgreSQL,
+    память). PTB передаёт изменения раз в ``update_interval`` секунд; здесь
+    они накапливаются в памяти и записываются одним вызовом
+    ``save_persistence`` (в базах — одной транзакцией), так что каждое
+    обновление от пользователя не вызывает отдельный fsync.
+    Состояние, не менявшееся дольше ``ttl`` секунд (брошенные опросы),
+    удаляется при загрузке и при каждой записи; в памяти бота тот же срок
+    отсчитывает ``conversation_timeout`` опроса (см. ``bot.survey_timeout``).
+    """
+
+    def __init__(
+        self,
+        repo: Repository,
+        *,
+        update_interval: float = 10,
+        ttl: float = 7 * 24 * 3600,
+    ) -> None:
+        super().__init__(
+            store_data=PersistenceInput(bot_data=False, chat_data=False, callback_data=False),
+            update_interval=update_interval,
+        )
+        self.repo = repo
+        self.ttl = ttl
+        self._dirty_users: Dict[int, Optional[Dict[str, Any]]] = {}
+        self._dirty_states: Dict[Tuple[str, ConversationKey], Any] = {}
+        self._flush_task: Optional[asyncio.Task] = None
+        self._flush_lock: Optional[asyncio.Lock] = None
+        self._evicted = False
+
+    async def _evict_once(self) -> None:
+        if self._evicted:
+            return
+        self._evicted = True
+        removed = await self.repo.evict_persistence(time.time() - self.ttl)
+        if removed:
+            logger.info("Удалено устаревших состояний диалогов: %s", removed)
+
+    def _schedule_flush(self) -> None:
+        # PTB вызывает update_* пачкой через gather: откладываем запись на один
+        # проход цикла событий, чтобы вся пачка ушла одной транзакцией
+        if self._flush_task is None or self._flush_task.done():
+            self._flush_task = asyncio.create_task(self._flush_soon())
+
+    async def _flush_soon(self) -> None:
+        await asyncio.sleep(0)
+        await self._write_dirty()
+
+    async def _write_dirty(self) -> None:
+        if self._flush_lock is None:
+            self._flush_lock = asyncio.Lock()
+        async with self._flush_lock:
+            if not self._dirty_users and not self._dirty_states:
+                return
+            users, states = self._dirty_users, self._dirty_states
+            self._dirty_users, self._dirty_states = {}, {}
+            try:
+                await self.repo.save_persistence(users, states)
+                await self.repo.evict_persistence(time.time() - self.ttl)
+            except Exception:
+                # вернём изменения в буфер, если новых значений для этих ключей ещё нет
+                for user_id, data in users.items():
+                    self._dirty_users.setdefault(user_id, data)
+                for key, state in states.items():
+                    self._dirty_states.setdefault(key, state)
+                logger.exception("Не удалось сохранить состояние диалогов")
+
+    async def get_user_data(self) -> Dict[int, Dict[str, Any]]:
+        await self._evict_once()
+        return await self.repo.load_user_data()
+
+    async def get_conversations(self, name: str) -> Dict[ConversationKey, Any]:
+        await self._evict_once()
+        return await self.repo.load_conversations(name)
+
+    async def update_user_data(self, user_id: int, data: Dict[str, Any]) -> None:
+        self._dirty_users[user_id] = data
+        self._schedule_flush()
+
+    async def drop_user_data(self, user_id: int) -> None:
+        self._dirty_users[user_id] = None
+        self._schedule_flush()
+
+    async def update_conversation(
+        self, name: str, key: ConversationKey, new_state: Optional[object]
+    ) -> None:
+        self._dirty_states[(name, key)] = new_state
+        self._schedule_flush()
+
+    async def refresh_user_data(self, user_id: int, user_data: Dict[str, Any]) -> None:
+        pass
+
+    async def flush(self) -> None:
+        if self._flush_task is not None and not self._flush_task.done():
+            await self._flush_task
+        await self._write_dirty()
+
+    # chat_data, bot_data и callback_data бот не использует
+
+    async def get_chat_data(self) -> Dict[int, Dict[Any, Any]]:
+        return {}
+
+    async def get_bot_data(self) -> Dict[Any, Any]:
+        return {}
+
+    async def get_callback_data(self) -> None:
+        return None
+
+    async def update_chat_data(self, chat_id: int, data: Dict[Any, Any]) -> None:
+        pass
+
+    async def update_bot_data(self, data: Dict[Any, Any]) -> None:
+        pass
+
+    async def update_callback_data(self, data: Any) -> None:
+        pass
+
+    async def drop_chat_data(self, chat_id: int) -> None:
+        pass
+
+    async def refresh_chat_data(self, chat_id: int, chat_data: Dict[Any, Any]) -> None:
+        pass
+
+    async def refresh_bot_data(self, bot_data: Dict[Any, Any]) -> None:
+        pass
@@ -0,0 +1,226 @@
+"""Повторная выгрузка в Yonote заявок, оставшихся с ``synced_to_yonote = 0``.
+
+Заявки читаются из базы потоково кусками по id, документы создаются с
+ограниченной параллельностью и темпом, успешные заявки помечаются
+выгруженными пачками. Прогресс (последний обработанный id) пишется в
+файл состояния, так что прерванный прогон продолжается с того же места;
+после полного прохода файл удаляется.
+
+Примеры::
+
+    python resync.py --dry-run
+    python resync.py --since 2024-05-01 --concurrency 4 --rate 5
+"""
+
+import argparse
+import asyncio
+import datetime as dtm
+import json
+import logging
+import os
+import sys
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Any, Awaitable, Callable, List, Optional
+
+from config import get_settings
+from notifications import TokenBucket
+from storage import Repository, open_repository
+from yonote_client import CircuitOpenError, YonoteClient
+
+logger = logging.getLogger(__name__)
+
+Publisher = Callable[[Any], Awaitable[Optional[dict]]]
+
+
+@dataclass
+class ResyncStats:
+    seen: int = 0
+    synced: int = 0
+    failed: int = 0
+    last_id: int = 0
+    # первая заявка, которую не удалось выгрузить: сохранённый прогресс
+    # не уходит дальше неё, чтобы продолженный прогон повторил её
+    first_failed_id: Optional[int] = None
+    interrupted: bool = False
+
+
+def load_state(path: Optional[Path]) -> int:
+    if path is None or not path.exists():
+        return 0
+    try:
+        return int(json.loads(path.read_text(encoding="utf-8")).get("last_id", 0))
+    except (ValueError, AttributeError):
+        logger.warning("Файл состояния %s повреждён, начинаем сначала", path)
+        return 0
+
+
+def save_state(path: Optional[Path], last_id: int) -> None:
+    if path is None:
+        return
+    tmp = path.with_suffix(path.suffix + ".tmp")
+    tmp.write_text(json.dumps({"last_id": last_id}), encoding="utf-8")
+    os.replace(tmp, path)
+
+
+async def resync(
+    repo: Repository,
+    publish: Publisher,
+    *,
+    concurrency: int = 4,
+    rate: float = 5.0,
+    batch_size: int = 50,
+    since: Optional[str] = None,
+    include_queued: bool = False,
+    dry_run: bool = False,
+    state_path: Optional[Path] = None,
+) -> ResyncStats:
+    """Выгружает невыгруженные заявки; возвращает статистику прогона.
+
+    Заявки обрабатываются пачками по ``batch_size``: внутри пачки — не больше
+    ``concurrency`` запросов одновременно и не больше ``rate`` в секунду,
+    после пачки успешные помечаются одной транзакцией и сохраняется прогресс —
+    не дальше первой заявки с ошибкой, так что продолженный прогон её повторит.
+    Если Yonote недоступен (разомкнут размыкатель), прогон останавливается
+    с сохранённым прогрессом.
+    """
+    stats = ResyncStats(last_id=load_state(state_path))
+    if stats.last_id:
+        logger.info("Продолжаем с заявки после #%s", stats.last_id)
+    semaphore = asyncio.Semaphore(max(1, concurrency))
+    bucket = TokenBucket(rate)
+
+    async def publish_one(row: Any) -> bool:
+        async with semaphore:
+            await asyncio.sleep(bucket.reserve())
+            try:
+                return await publish(row) is not None
+            except CircuitOpenError:
+                raise
+            except Exception as exc:
+                logger.error("Заявка %s не выгружена: %s", row["id"], exc)
+                return False
+
+    async def flush(batch: List[Any]) -> None:
+        results = await asyncio.gather(
+            *(publish_one(row) for row in batch), return_exceptions=True
+        )
+        synced = [row["id"] for row, ok in zip(batch, results) if ok is True]
+        await repo.mark_synced_many(synced)
+        stats.synced += len(synced)
+        failed = [row["id"] for row, ok in zip(batch, results) if ok is False]
+        stats.failed += len(failed)
+        if failed and stats.first_failed_id is None:
+            stats.first_failed_id = failed[0]
+        circuit_open = [exc for exc in results if isinstance(exc, CircuitOpenError)]
+        if circuit_open:
+            raise circuit_open[0]
+        if stats.first_failed_id is None:
+            stats.last_id = batch[-1]["id"]
+        else:
+            stats.last_id = stats.first_failed_id - 1
+        save_state(state_path, stats.last_id)
+        logger.info(
+            "Обработано %s заявок: выгружено %s, ошибок %s", stats.seen, stats.synced, stats.failed
+        )
+
+    batch: List[Any] = []
+    try:
+        async for row in repo.iter_unsynced(
+            after_id=stats.last_id, since=since, include_queued=include_queued
+        ):
+            stats.seen += 1
+            if dry_run:
+                print(f"#{row['id']}\t{row['created_at']}\t{row['full_name'] or ''}\t{row['job'] or ''}")
+                continue
+            batch.append(row)
+            if len(batch) >= batch_size:
+                await flush(batch)
+                batch = []
+        if batch:
+            await flush(batch)
+    except CircuitOpenError as exc:
+        stats.interrupted = True
+        logger.error("Прогон остановлен: %s. Запустите снова, чтобы продолжить", exc)
+        return stats
+    if not dry_run and state_path is not None and state_path.exists():
+        state_path.unlink()
+    return stats
+
+
+def parse_since(value: str) -> str:
+    try:
+        return dtm.date.fromisoformat(value).isoformat()
+    except ValueError:
+        raise argparse.ArgumentTypeError("ожидается дата в формате ГГГГ-ММ-ДД")
+
+
+def parse_args(argv: Optional[List[str]] = None) -> argparse.Namespace:
+    settings = get_settings()
+    parser = argparse.ArgumentParser(description="Повторная выгрузка заявок в Yonote")
+    parser.add_argument(
+        "--dry-run", action="store_true", help="только показать, что будет выгружено"
+    )
+    parser.add_argument(
+        "--since", type=parse_since, help="только заявки, поданные с этой даты (ГГГГ-ММ-ДД)"
+    )
+    parser.add_argument(
+        "--concurrency", type=int, default=settings.outbox_concurrency, help="одновременных запросов"
+    )
+    parser.add_argument("--rate", type=float, default=5.0, help="не больше документов в секунду")
+    parser.add_argument("--batch-size", type=int, default=50, help="заявок в пачке")
+    parser.add_argument(
+        "--include-queued",
+        action="store_true",
+        help="выгружать и заявки, которые ещё ждут outbox-воркер бота",
+    )
+    parser.add_argument(
+        "--state-file",
+        type=Path,
+        default=settings.database_path.with_name("resync_state.json"),
+        help="файл с прогрессом для продолжения прерванного прогона",
+    )
+    parser.add_argument("--restart", action="store_true", help="игнорировать сохранённый прогресс")
+    return parser.parse_args(argv)
+
+
+async def run(args: argparse.Namespace) -> ResyncStats:
+    if args.restart and args.state_file.exists():
+        args.state_file.unlink()
+    settings = get_settings()
+    repo = open_repository(settings)
+    client = YonoteClient.from_settings(settings)
+    try:
+        return await resync(
+            repo,
+            client.create_application_document,
+            concurrency=args.concurrency,
+            rate=args.rate,
+            batch_size=args.batch_size,
+            since=args.since,
+            include_queued=args.include_queued,
+            dry_run=args.dry_run,
+            state_path=None if args.dry_run else args.state_file,
+        )
+    finally:
+        await client.aclose()
+        await repo.close()
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    logging.basicConfig(
+        format="%(asctime)s %(name)s %(levelname)s %(message)s",
+        level=logging.INFO,
+    )
+    args = parse_args(argv)
+    if not args.dry_run and not get_settings().yonote_api_key:
+        logger.error("YONOTE_API_KEY не задан")
+        return 2
+    stats = asyncio.run(run(args))
+    verb = "Найдено" if args.dry_run else "Выгружено"
+    print(f"{verb}: {stats.seen if args.dry_run else stats.synced}, ошибок: {stats.failed}")
+    return 1 if stats.failed or stats.interrupted else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
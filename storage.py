@@ -0,0 +1,400 @@
+"""Интерфейс хранилища заявок и выбор движка по настройкам.
+
+Бот, outbox-воркер, рассылка и утилиты работают с :class:`Repository`,
+не зная, где лежат данные. Движки:
+
+* ``sqlite`` — :class:`db.AsyncApplicationRepository`, один файл базы;
+* ``memory`` — :class:`db_memory.MemoryApplicationRepository`, словари
+  с индексами в памяти процесса, для тестов и нагрузочных прогонов;
+* ``postgres`` — :class:`db_postgres.PostgresApplicationRepository`,
+  пул соединений asyncpg; позволяет запускать несколько реплик бота.
+
+Общий контракт (его проверяет tests/test_storage.py): строки заявок
+поддерживают доступ по имени колонки из :data:`ROW_FIELDS`, время —
+строки UTC вида ``ГГГГ-ММ-ДД ЧЧ:ММ:СС``, при равном времени порядок
+определяет id.
+"""
+
+import json
+import re
+import unicodedata
+from abc import ABC, abstractmethod
+from typing import TYPE_CHECKING, Any, AsyncIterator, Dict, List, Optional, Tuple
+
+if TYPE_CHECKING:  # pragma: no cover
+    from config import Settings
+
+STORAGE_BACKENDS = ("sqlite", "memory", "postgres")
+
+# Хранимые колонки заявки в порядке объявления в SQLite; все движки отдают
+# строки с ними. decided_at — время решения администратора: его ставит только
+# смена статуса, а не выгрузка в Yonote, поэтому архивация идёт по нему.
+APPLICATION_FIELDS = (
+    "id",
+    "user_id",
+    "chat_id",
+    "username",
+    "full_name",
+    "answers_json",
+    "status",
+    "created_at",
+    "updated_at",
+    "admin_comment",
+    "synced_to_yonote",
+    "decided_at",
+)
+# Ответы анкеты в отдельных колонках строки: SQLite и PostgreSQL вычисляют
+# их из answers_json (генерируемые колонки с индексами), память — при
+# сохранении. Ключи — поля SURVEY из bot.py; full_name уже хранится сам.
+ANSWER_FIELDS = ("age", "job", "experience", "portfolio", "goals")
+# Возраст целым числом для фильтра /admin age=18-25: ведущее целое из
+# ответа, как ``CAST(... AS INTEGER)`` в SQLite; без ответа — NULL.
+ROW_FIELDS = APPLICATION_FIELDS + ANSWER_FIELDS + ("age_years",)
+DECIDED_STATUSES = ("approved", "declined")
+
+# Курсор keyset-пагинации: (created_at, id) граничной заявки.
+Cursor = Tuple[str, int]
+Row = Any
+
+
+_WORD_RE = re.compile(r"\w+")
+_LEADING_INT_RE = re.compile(r"\s*([+-]?\d+)")
+SNIPPET_WORDS = 10
+# границы INTEGER в SQLite: CAST большего числа упирается в них
+_INT64 = (-(2 ** 63), 2 ** 63 - 1)
+
+
+def age_years(value: Any) -> Optional[int]:
+    """Возраст из ответа анкеты по правилам ``CAST(... AS INTEGER)`` в SQLite."""
+    if value is None:
+        return None
+    match = _LEADING_INT_RE.match(str(value))
+    if match is None:
+        return 0
+    return min(max(int(match.group(1)), _INT64[0]), _INT64[1])
+
+
+def answer_columns(answers: Dict[str, Any]) -> Dict[str, Any]:
+    """Значения колонок :data:`ANSWER_FIELDS` и ``age_years`` для словаря ответов."""
+    columns = {
+        field: None if answers.get(field) is None else str(answers[field])
+        for field in ANSWER_FIELDS
+    }
+    columns["age_years"] = age_years(answers.get("age"))
+    return columns
+
+
+def search_terms(text: str) -> List[str]:
+    """Слова поискового запроса: всё, в чём есть хотя бы одна буква или цифра."""
+    return [term for term in text.split() if any(char.isalnum() for char in term)]
+
+
+def search_tokens(text: str) -> List[str]:
+    """Слова в нижнем регистре без диакритики — как токенизатор unicode61 у FTS5.
+
+    Движки без FTS5 индексируют и ищут по этим токенам, чтобы ``star_123``
+    или ``t.me/nick`` разбивались одинаково во всех хранилищах.
+    """
+    decomposed = unicodedata.normalize("NFKD", text.lower())
+    folded = "".join(char for char in decomposed if not unicodedata.combining(char))
+    return _WORD_RE.findall(folded)
+
+
+def search_texts(row: Row) -> List[str]:
+    """Тексты, по которым ищет /search: имя, ник и значения ответов анкеты."""
+    answers = json.loads(row["answers_json"])
+    return [
+        row["full_name"] or "",
+        row["username"] or "",
+        " ".join(str(value) for value in answers.values()),
+    ]
+
+
+def search_snippet(row: Row, text: str) -> str:
+    """Фрагмент с первым совпадением, найденные слова в квадратных скобках.
+
+    Повторяет вид ``snippet()`` из FTS5 для движков, где его нет.
+    """
+    prefixes = {token for term in search_terms(text) for token in search_tokens(term)}
+    for field in search_texts(row):
+        words = field.split()
+        hits = {
+            index
+            for index, word in enumerate(words)
+            if any(token.startswith(prefix) for token in search_tokens(word) for prefix in prefixes)
+        }
+        if not hits:
+            continue
+        start = max(0, min(min(hits), len(words) - SNIPPET_WORDS))
+        window = [
+            f"[{word}]" if index in hits else word
+            for index, word in enumerate(words[start : start + SNIPPET_WORDS], start)
+        ]
+        head = "…" if start > 0 else ""
+        tail = "…" if start + SNIPPET_WORDS < len(words) else ""
+        return head + " ".join(window) + tail
+    return ""
+
+
+class Repository(ABC):
+    """Асинхронное хранилище заявок, outbox, состояния диалогов и счётчиков."""
+
+    @abstractmethod
+    async def close(self) -> None:
+        ...
+
+    # --- заявки ---
+
+    @abstractmethod
+    async def save_application(
+        self,
+        user_id: int,
+        chat_id: int,
+        username: Optional[str],
+        full_name: Optional[str],
+        answers: Dict[str, Any],
+    ) -> int:
+        """Сохраняет заявку со статусом ``pending`` и ставит её в outbox; возвращает id."""
+
+    @abstractmethod
+    async def list_all(self) -> List[Row]:
+        ...
+
+    @abstractmethod
+    async def list_applications(
+        self,
+        *,
+        after_id: int = 0,
+        limit: int = 1000,
+        status: Optional[str] = None,
+        job: Optional[str] = None,
+        since: Optional[str] = None,
+        until: Optional[str] = None,
+        include_archive: bool = False,
+    ) -> List[Row]:
+        """Кусок заявок с ``id > after_id`` по возрастанию id (``until`` — не включительно).
+
+        С ``include_archive`` в выборку входят и архивные заявки.
+        """
+
+    async def iter_applications(
+        self, *, chunk_size: int = 1000, **filters: Any
+    ) -> AsyncIterator[Row]:
+        after_id = 0
+        while True:
+            rows = await self.list_applications(after_id=after_id, limit=chunk_size, **filters)
+            for row in rows:
+                yield row
+            if len(rows) < chunk_size:
+                return
+            after_id = rows[-1]["id"]
+
+    @abstractmethod
+    async def get_by_id(self, app_id: int) -> Optional[Row]:
+        ...
+
+    @abstractmethod
+    async def get_last_for_user(self, user_id: int) -> Optional[Row]:
+        """Последняя заявка пользователя, в том числе архивная."""
+
+    @abstractmethod
+    async def list_by_user(
+        self, user_id: int, limit: Optional[int] = None, include_archive: bool = False
+    ) -> List[Row]:
+        """Заявки пользователя от новых к старым."""
+
+    @abstractmethod
+    async def list_pending(
+        self,
+        limit: int = 10,
+        *,
+        after: Optional[Cursor] = None,
+        before: Optional[Cursor] = None,
+        job: Optional[str] = None,
+        min_age: Optional[int] = None,
+        max_age: Optional[int] = None,
+    ) -> List[Row]:
+        """Страница очереди на рассмотрение от старых к новым, keyset по ``(created_at, id)``."""
+
+    @abstractmethod
+    async def list_pending_with_history(
+        self, limit: int = 10, history_limit: int = 5, **filters: Any
+    ) -> List[Tuple[Row, List[Row]]]:
+        """Страница очереди вместе с последними заявками авторов.
+
+        ``include_archive=True`` среди фильтров добавляет в историю архивные заявки.
+        """
+
+    @abstractmethod
+    async def get_with_history(
+        self, app_id: int, history_limit: int = 5, include_archive: bool = False
+    ) -> Optional[Tuple[Row, List[Row]]]:
+        ...
+
+    @abstractmethod
+    async def update_status(
+        self, app_id: int, status: str, admin_comment: Optional[str] = None
+    ) -> Optional[int]:
+        """Меняет статус; возвращает ``user_id`` автора или None, если заявки нет."""
+
+    @abstractmethod
+    async def transition_status(
+        self,
+        app_id: int,
+        status: str,
+        admin_comment: Optional[str] = None,
+        expected: str = "pending",
+    ) -> Optional[Row]:
+        """Атомарно переводит заявку из ``expected`` в ``status``; None, если не удалось."""
+
+    @abstractmethod
+    async def bulk_update_status(
+        self,
+        status: str,
+        *,
+        ids: Optional[List[int]] = None,
+        job: Optional[str] = None,
+        min_age: Optional[int] = None,
+        max_age: Optional[int] = None,
+    ) -> List[Row]:
+        """Решение по всем подходящим заявкам на рассмотрении; возвращает их в прежнем виде."""
+
+    @abstractmethod
+    async def search(self, text: str, limit: int = 10, offset: int = 0) -> List[Row]:
+        """Поиск по имени, нику и ответам, включая архив; у строк есть колонка ``snippet``.
+
+        Слова запроса (см. :func:`search_terms`) ищутся по префиксу и
+        объединяются через AND; порядок — по релевантности.
+        """
+
+    @abstractmethod
+    async def get_stats(self, days: int = 7) -> Dict[str, Any]:
+        """Сводка ``by_status``, ``by_job`` и ``daily`` для /stats, включая архив."""
+
+    def cache_stats(self) -> Optional[Dict[str, Any]]:
+        """Счётчики кэша статусов (``size``, ``hits``, ``misses``, ``hit_ratio``); None — кэша нет."""
+        return None
+
+    @abstractmethod
+    async def archive_decided(self, older_than: str, batch_size: int = 500) -> int:
+        """Убирает из горячих выборок рассмотренные и выгруженные заявки старше ``older_than``."""
+
+    @abstractmethod
+    async def vacuum(self, pages: int = 0) -> int:
+        """Возвращает свободное место хранилищу; число освобождённых страниц или 0."""
+
+    # --- выгрузка в Yonote ---
+
+    @abstractmethod
+    async def mark_synced(self, app_id: int) -> None:
+        ...
+
+    @abstractmethod
+    async def mark_synced_many(self, app_ids: List[int]) -> None:
+        ...
+
+    @abstractmethod
+    async def list_unsynced(
+        self,
+        *,
+        after_id: int = 0,
+        since: Optional[str] = None,
+        include_queued: bool = False,
+        limit: int = 500,
+    ) -> List[Row]:
+        """Кусок невыгруженных заявок с ``id > after_id``; ждущие outbox пропускаются."""
+
+    async def iter_unsynced(self, *, chunk_size: int = 500, **filters: Any) -> AsyncIterator[Row]:
+        after_id = filters.pop("after_id", 0)
+        while True:
+            rows = await self.list_unsynced(after_id=after_id, limit=chunk_size, **filters)
+            for row in rows:
+                yield row
+            if len(rows) < chunk_size:
+                return
+            after_id = rows[-1]["id"]
+
+    @abstractmethod
+    async def claim_outbox(self, limit: int, lease: float = 300.0) -> List[Row]:
+        """Забирает готовые записи outbox (с колонками ``outbox_id``, ``attempts`` и заявки)."""
+
+    @abstractmethod
+    async def retry_outbox(self, outbox_id: int, delay: float, error: str) -> None:
+        ...
+
+    @abstractmethod
+    async def defer_outbox(self, outbox_id: int, delay: float) -> None:
+        ...
+
+    @abstractmethod
+    async def dead_letter_outbox(self, outbox_id: int, error: str) -> None:
+        ...
+
+    @abstractmethod
+    async def list_outbox(self, status: Optional[str] = None) -> List[Row]:
+        ...
+
+    # --- рассылка ---
+
+    @abstractmethod
+    async def mark_undeliverable(self, chat_id: int, reason: str) -> None:
+        ...
+
+    @abstractmethod
+    async def list_undeliverable(self) -> List[int]:
+        ...
+
+    # --- состояние диалогов PTB ---
+
+    @abstractmethod
+    async def load_user_data(self) -> Dict[int, Dict[str, Any]]:
+        ...
+
+    @abstractmethod
+    async def load_conversations(self, name: str) -> Dict[Tuple[Any, ...], Any]:
+        ...
+
+    @abstractmethod
+    async def save_persistence(
+        self,
+        user_data: Dict[int, Optional[Dict[str, Any]]],
+        conversations: Dict[Tuple[str, Tuple[Any, ...]], Any],
+    ) -> None:
+        """Записывает изменения одной транзакцией; ``None`` означает удаление записи."""
+
+    @abstractmethod
+    async def evict_persistence(self, older_than: float) -> int:
+        ...
+
+
+def open_repository(settings: "Settings") -> Repository:
+    """Создаёт хранилище движка ``settings.storage_backend``.
+
+    Соединения PostgreSQL открываются при первом запросе, так что вызывать
+    можно и вне event loop.
+    """
+    backend = settings.storage_backend
+    if backend == "sqlite":
+        from db import AsyncApplicationRepository
+
+        return AsyncApplicationRepository.open(
+            settings.database_path,
+            read_pool_size=settings.database_read_pool_size,
+            busy_timeout_ms=settings.database_busy_timeout_ms,
+            synchronous=settings.database_synchronous,
+            status_cache_size=settings.status_cache_size,
+            status_cache_ttl=settings.status_cache_ttl,
+        )
+    if backend == "memory":
+        from db_memory import MemoryApplicationRepository
+
+        return MemoryApplicationRepository()
+    if backend == "postgres":
+        from db_postgres import PostgresApplicationRepository
+
+        return PostgresApplicationRepository(
+            settings.database_url or "",
+            min_size=1,
+            max_size=settings.database_pool_size,
+        )
+    raise ValueError(f"Неизвестный движок хранилища: {backend}")
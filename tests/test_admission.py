@@ -0,0 +1,155 @@
+import os
+import sys
+import unittest
+
+from telegram import Update
+from telegram.ext import Application, ApplicationHandlerStop, TypeHandler
+
+# Добавляем путь к основному коду
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from admission import AdmissionControl, fingerprint, is_start
+from loadtest import OfflineRequest
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def make_update(update_id, user_id, text=None, data=None):
+    message = {
+        'message_id': update_id,
+        'date': 0,
+        'chat': {'id': user_id, 'type': 'private'},
+        'from': {'id': user_id, 'is_bot': False, 'first_name': 'User'},
+        'text': text or '…',
+    }
+    if data is not None:
+        return Update.de_json(
+            {
+                'update_id': update_id,
+                'callback_query': {
+                    'id': str(update_id),
+                    'from': message['from'],
+                    'chat_instance': '1',
+                    'data': data,
+                    'message': message,
+                },
+            },
+            None,
+        )
+    return Update.de_json({'update_id': update_id, 'message': message}, None)
+
+
+class TestAdmissionControl(unittest.TestCase):
+    """Тесты защиты от флуда"""
+
+    def setUp(self):
+        self.clock = FakeClock()
+
+    def _control(self, **kwargs):
+        options = dict(
+            user_rate=1, user_burst=3, global_rate=0, duplicate_window=0, submit_cooldown=0, clock=self.clock
+        )
+        options.update(kwargs)
+        return AdmissionControl(**options)
+
+    def test_user_bucket(self):
+        """Пользователь получает запас на всплеск, дальше — rate обновлений в секунду"""
+        control = self._control()
+        self.assertEqual([control.admit(1, f'm{i}') for i in range(4)], [None, None, None, 'user'])
+        self.assertIsNone(control.admit(2, 'm'))
+        self.clock.now = 1.0
+        self.assertIsNone(control.admit(1, 'm5'))
+        self.assertEqual(control.admit(1, 'm6'), 'user')
+        self.assertEqual(control.stats()['dropped']['user'], 2)
+        self.assertEqual(control.stats()['admitted'], 5)
+
+    def test_global_bucket(self):
+        """Общее ведро ограничивает сумму по всем пользователям"""
+        control = self._control(user_rate=0, global_rate=10, global_burst=2)
+        self.assertEqual([control.admit(user_id) for user_id in range(3)], [None, None, 'global'])
+        self.assertEqual(control.admit(None), 'global')
+
+    def test_duplicates(self):
+        """Одинаковые сообщения подряд отсекаются, пока поток повторов не прервётся"""
+        control = self._control(user_rate=0, duplicate_window=5)
+        self.assertIsNone(control.admit(1, 'text:привет'))
+        self.clock.now = 4.0
+        self.assertEqual(control.admit(1, 'text:привет'), 'duplicate')
+        self.clock.now = 8.0
+        self.assertEqual(control.admit(1, 'text:привет'), 'duplicate')
+        self.clock.now = 14.0
+        self.assertIsNone(control.admit(1, 'text:привет'))
+        self.assertIsNone(control.admit(1, 'text:другое'))
+        self.assertIsNone(control.admit(1, 'text:привет'))
+        self.assertIsNone(control.admit(1, None))
+        self.assertIsNone(control.admit(1, None))
+
+    def test_submit_cooldown(self):
+        """После подачи заявки /start какое-то время отсекается, остальное проходит"""
+        control = self._control(user_rate=0, submit_cooldown=60)
+        self.assertIsNone(control.admit(1, 'text:/start', start=True))
+        control.mark_submitted(1)
+        self.assertEqual(control.admit(1, 'text:/start', start=True), 'cooldown')
+        self.assertIsNone(control.admit(1, 'text:/status'))
+        self.clock.now = 61.0
+        self.assertIsNone(control.admit(1, 'text:/start', start=True))
+
+    def test_exempt(self):
+        """Администраторы не ограничиваются"""
+        control = self._control(user_burst=1, global_rate=1, global_burst=1, duplicate_window=5, exempt=[7])
+        self.assertEqual([control.admit(7, 'text:/admin') for _ in range(5)], [None] * 5)
+
+    def test_state_is_bounded(self):
+        """Состояние хранится только для последних активных пользователей"""
+        control = self._control(max_users=2)
+        for user_id in range(10):
+            control.admit(user_id, 'm')
+        self.assertEqual(control.stats()['users'], 2)
+
+    def test_update_helpers(self):
+        """Отпечаток — текст или данные кнопки; /start узнаётся и с именем бота"""
+        self.assertEqual(fingerprint(make_update(1, 1, text='привет')), 'text:привет')
+        self.assertEqual(fingerprint(make_update(2, 1, data='job:Вокалист')), 'callback:job:Вокалист')
+        self.assertTrue(is_start(make_update(3, 1, text='/start@bot')))
+        self.assertFalse(is_start(make_update(4, 1, text='/status')))
+        self.assertFalse(is_start(make_update(5, 1, data='job:Вокалист')))
+
+
+class TestAdmissionHandler(unittest.IsolatedAsyncioTestCase):
+    """Защита в группе -1 не пускает отброшенные обновления к обработчикам"""
+
+    async def test_dropped_updates_stop_processing(self):
+        control = AdmissionControl(user_rate=1, user_burst=2, global_rate=0, duplicate_window=0)
+        application = (
+            Application.builder()
+            .token('123456:test')
+            .request(OfflineRequest())
+            .get_updates_request(OfflineRequest())
+            .build()
+        )
+        handled = []
+
+        async def record(update, context):
+            handled.append(update.update_id)
+
+        application.add_handler(TypeHandler(Update, control.check_update), group=-1)
+        application.add_handler(TypeHandler(Update, record))
+        await application.initialize()
+        try:
+            for update_id in range(1, 5):
+                await application.process_update(make_update(update_id, 1, text=f'm{update_id}'))
+        finally:
+            await application.shutdown()
+        self.assertEqual(handled, [1, 2])
+        with self.assertRaises(ApplicationHandlerStop):
+            await control.check_update(make_update(5, 1, text='m5'), None)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,85 @@
+import os
+import sys
+import unittest
+from unittest.mock import AsyncMock, MagicMock, patch
+
+# Добавляем путь к основному коду
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import bot
+import config
+from db_memory import MemoryApplicationRepository
+
+ADMIN_ID = 1000
+
+
+class TestAdminPagination(unittest.IsolatedAsyncioTestCase):
+    """Листание очереди /admin"""
+
+    async def asyncSetUp(self):
+        self.environ = patch.dict(os.environ, {'ADMIN_IDS': str(ADMIN_ID), 'ADMIN_PAGE_SIZE': '1'})
+        self.environ.start()
+        config.reset_settings()
+        self.repo = MemoryApplicationRepository()
+        self.repo_patch = patch.object(bot, 'repo', self.repo)
+        self.repo_patch.start()
+        self.ids = {}
+        for user_id, job in enumerate(['Видер', 'Художник', 'Видер', 'Художник'], start=1):
+            app_id = await self.repo.save_application(user_id, user_id, None, None, {'job': job})
+            self.ids.setdefault(job, []).append(app_id)
+        self.context = MagicMock(user_data={})
+        self.next_message_id = 10
+
+    async def asyncTearDown(self):
+        self.repo_patch.stop()
+        self.environ.stop()
+        config.reset_settings()
+        await self.repo.close()
+
+    async def open_admin(self, *args):
+        """Отправляет /admin и возвращает message_id ответа и кнопку «Вперёд»"""
+        message_id = self.next_message_id
+        self.next_message_id += 1
+        update = MagicMock()
+        update.effective_user.id = ADMIN_ID
+        update.message.reply_text = AsyncMock(return_value=MagicMock(message_id=message_id))
+        self.context.args = list(args)
+        await bot.admin_panel(update, self.context)
+        keyboard = update.message.reply_text.call_args.kwargs['reply_markup']
+        return message_id, keyboard.inline_keyboard[-1][-1].callback_data
+
+    async def press(self, message_id, data):
+        update = MagicMock()
+        query = update.callback_query
+        query.answer = AsyncMock()
+        query.edit_message_text = AsyncMock()
+        query.from_user.id = ADMIN_ID
+        query.message.message_id = message_id
+        query.data = data
+        await bot.handle_admin_page(update, self.context)
+        return query.edit_message_text.call_args.args[0]
+
+    async def test_two_admin_messages_page_independently(self):
+        """Два сообщения /admin с разными фильтрами не перебивают друг другу фильтр"""
+        video, video_next = await self.open_admin('job=Видер')
+        art, art_next = await self.open_admin('job=Художник')
+
+        text = await self.press(video, video_next)
+        self.assertIn(f"Заявка #{self.ids['Видер'][1]}", text)
+        self.assertIn('должность: Видер', text)
+
+        text = await self.press(art, art_next)
+        self.assertIn(f"Заявка #{self.ids['Художник'][1]}", text)
+        self.assertIn('должность: Художник', text)
+
+    def test_old_views_are_forgotten(self):
+        """Хранятся фильтры только последних ADMIN_VIEWS_KEPT сообщений"""
+        for message_id in range(bot.ADMIN_VIEWS_KEPT + 5):
+            bot.remember_admin_view(self.context, message_id, {'filters': {}})
+        views = self.context.user_data['admin_views']
+        self.assertEqual(len(views), bot.ADMIN_VIEWS_KEPT)
+        self.assertNotIn('0', views)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,119 @@
+import os
+import sys
+import tempfile
+import unittest
+from pathlib import Path
+
+# Добавляем путь к основному коду
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from cache import MISSING, TTLCache
+from db import AsyncApplicationRepository
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+class TestTTLCache(unittest.TestCase):
+    """Тесты LRU-кэша с временем жизни"""
+
+    def test_lru_eviction(self):
+        """При переполнении вытесняется давно не использованная запись"""
+        cache = TTLCache(maxsize=2, ttl=60)
+        cache.set(1, "a")
+        cache.set(2, "b")
+        cache.get(1)
+        cache.set(3, "c")
+        self.assertEqual(cache.get(1), "a")
+        self.assertIs(cache.get(2), MISSING)
+        self.assertEqual(len(cache), 2)
+
+    def test_ttl_expiry(self):
+        """Запись перестаёт возвращаться по истечении ttl"""
+        clock = FakeClock()
+        cache = TTLCache(ttl=10, clock=clock)
+        cache.set(1, None)
+        self.assertIsNone(cache.get(1))
+        clock.now = 10
+        self.assertIs(cache.get(1), MISSING)
+        self.assertEqual(len(cache), 0)
+
+    def test_counters(self):
+        """Попадания и промахи считаются"""
+        cache = TTLCache()
+        cache.get(1)
+        cache.set(1, "a")
+        cache.get(1)
+        cache.get(1)
+        self.assertEqual(cache.stats(), {"size": 1, "hits": 2, "misses": 1, "hit_ratio": 2 / 3})
+
+    def test_stale_value_after_invalidation_is_not_stored(self):
+        """Значение, прочитанное до инвалидации, не попадает в кэш"""
+        cache = TTLCache()
+        epoch = cache.epoch
+        cache.invalidate(1)
+        cache.set_if_epoch(1, "old", epoch)
+        self.assertIs(cache.get(1), MISSING)
+
+
+class TestStatusCache(unittest.IsolatedAsyncioTestCase):
+    """Тесты кэша последней заявки пользователя в репозитории"""
+
+    async def asyncSetUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.repo = AsyncApplicationRepository.open(
+            Path(self.tmpdir.name) / 'applications.db', read_pool_size=1
+        )
+        self.statements = []
+        for conn in self._connections():
+            conn.set_trace_callback(self.statements.append)
+
+    async def asyncTearDown(self):
+        await self.repo.close()
+        self.tmpdir.cleanup()
+
+    def _connections(self):
+        sync = self.repo.sync
+        pool = list(sync._readers.queue)
+        return [sync._conn, *pool]
+
+    def _reads(self):
+        return [sql for sql in self.statements if "FROM applications" in sql]
+
+    async def test_repeat_lookups_do_not_touch_sqlite(self):
+        """Повторные проверки статуса не обращаются к базе"""
+        await self.repo.save_application(5, 5, "user", "User", {"job": "Видер"})
+        for _ in range(10):
+            row = await self.repo.get_last_for_user(5)
+        self.assertEqual(row["status"], "pending")
+        self.assertEqual(len(self._reads()), 1)
+        self.assertEqual(self.repo.status_cache.hits, 9)
+        stats = self.repo.cache_stats()
+        self.assertEqual((stats['hits'], stats['misses'], stats['size']), (9, 1, 1))
+        self.assertAlmostEqual(stats['hit_ratio'], 0.9)
+
+    async def test_missing_application_is_cached(self):
+        """Отсутствие заявки тоже кэшируется"""
+        self.assertIsNone(await self.repo.get_last_for_user(5))
+        reads = len(self._reads())
+        self.assertIsNone(await self.repo.get_last_for_user(5))
+        self.assertEqual(len(self._reads()), reads)
+
+    async def test_invalidated_on_save_and_status_change(self):
+        """Новая заявка и смена статуса сбрасывают кэш пользователя"""
+        self.assertIsNone(await self.repo.get_last_for_user(5))
+        app_id = await self.repo.save_application(5, 5, "user", "User", {"job": "Видер"})
+        self.assertEqual((await self.repo.get_last_for_user(5))["status"], "pending")
+
+        self.assertEqual(await self.repo.update_status(app_id, "approved"), 5)
+        self.assertEqual((await self.repo.get_last_for_user(5))["status"], "approved")
+        self.assertIsNone(await self.repo.update_status(app_id + 100, "approved"))
+
+
+if __name__ == '__main__':
+    unittest.main()
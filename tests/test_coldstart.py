@@ -0,0 +1,71 @@
+import json
+import os
+import subprocess
+import sys
+import unittest
+
+# Добавляем путь к основному коду
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+sys.path.insert(0, ROOT)
+
+from coldstart import check_thresholds, parse_importtime
+
+IMPORTTIME = """\
+import time: self [us] | cumulative | imported package
+import time:       120 |        120 |   json.decoder
+import time:       300 |        420 | json
+import time:       500 |        500 |     storage
+import time:      1000 |       1500 |   config
+import time:      2000 |       3500 | bot
+"""
+
+
+class TestParseImporttime(unittest.TestCase):
+    """Тесты разбора вывода -X importtime"""
+
+    def test_entries_keep_nesting(self):
+        """Заголовок пропускается, отступ вложенности сохраняется"""
+        self.assertEqual(
+            parse_importtime(IMPORTTIME),
+            [
+                ('  json.decoder', 120, 120),
+                ('json', 300, 420),
+                ('    storage', 500, 500),
+                ('  config', 1000, 1500),
+                ('bot', 2000, 3500),
+            ],
+        )
+
+    def test_thresholds(self):
+        """Превышение порогов и созданные при импорте файлы считаются регрессией"""
+        report = {'import_ms': 300.0, 'first_update': {'total_ms': 500.0}, 'files_created_on_import': []}
+        self.assertEqual(check_thresholds(report, 400, 600), [])
+        self.assertEqual(len(check_thresholds(report, 200, 400)), 2)
+        report['files_created_on_import'] = ['applications.db']
+        self.assertEqual(len(check_thresholds(report, None, None)), 1)
+
+
+class TestColdStartSmoke(unittest.TestCase):
+    """Замер холодного старта в отдельных процессах"""
+
+    def test_single_run(self):
+        """Импорт bot не создаёт файлов и не тянет aiohttp, первый /start обработан"""
+        result = subprocess.run(
+            [sys.executable, os.path.join(ROOT, 'coldstart.py'), '--runs', '1', '--json'],
+            cwd=ROOT,
+            capture_output=True,
+            text=True,
+            timeout=120,
+        )
+        self.assertEqual(result.returncode, 0, result.stderr)
+        report = json.loads(result.stdout)
+
+        self.assertEqual(report['files_created_on_import'], [])
+        self.assertFalse(report['aiohttp_on_import'])
+        self.assertGreater(report['import_ms'], 0)
+        self.assertGreater(report['first_update']['first_update_ms'], 0)
+        self.assertGreaterEqual(report['first_update']['total_ms'], report['first_update']['import_ms'])
+
+
+if __name__ == '__main__':
+    unittest.main()
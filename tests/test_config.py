@@ -6,6 +6,7 @@ import os
 # Добавляем путь к основному коду
 sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
 
+import config
 from config import Settings, settings
 
 class TestConfig(unittest.TestCase):
@@ -48,5 +49,73 @@ class TestConfig(unittest.TestCase):
         with self.assertRaises(ValueError):
             s.validate()
 
+    def test_settings_validate_webhook_requires_url_and_secret(self):
+        """Режим webhook требует URL и секрет допустимого формата"""
+        s = Settings()
+        s.bot_token = 'token'
+        s.admin_ids = [123]
+        s.bot_mode = 'webhook'
+        s.webhook_url = 'https://example.com'
+        s.webhook_secret = None
+        with self.assertRaises(ValueError):
+            s.validate()
+        s.webhook_secret = 'bad secret!'
+        with self.assertRaises(ValueError):
+            s.validate()
+        s.webhook_secret = 'good_secret-1'
+        s.validate()  # Should not raise
+
+    def test_settings_validate_unknown_mode(self):
+        """Неизвестный режим запуска отклоняется"""
+        s = Settings()
+        s.bot_token = 'token'
+        s.admin_ids = [123]
+        s.bot_mode = 'carrier-pigeon'
+        with self.assertRaises(ValueError):
+            s.validate()
+
+    def test_settings_validate_concurrent_updates(self):
+        """Предел параллельной обработки обновлений не меньше 1"""
+        s = Settings()
+        s.bot_token = 'token'
+        s.admin_ids = [123]
+        s.concurrent_updates = 0
+        with self.assertRaises(ValueError):
+            s.validate()
+
+    def test_settings_validate_digest_group(self):
+        """Сводки Yonote группируются только по известным правилам"""
+        s = Settings()
+        s.bot_token = 'token'
+        s.admin_ids = [123]
+        s.yonote_digest_group = 'job'
+        s.validate()
+        s.yonote_digest_group = 'city'
+        with self.assertRaises(ValueError):
+            s.validate()
+
+    def test_reset_settings(self):
+        """После сброса настройки перечитываются из окружения"""
+        try:
+            with patch.dict('os.environ', {'TELEGRAM_BOT_TOKEN': 'first'}):
+                config.reset_settings()
+                self.assertEqual(config.settings.bot_token, 'first')
+            with patch.dict('os.environ', {'TELEGRAM_BOT_TOKEN': 'second'}):
+                self.assertEqual(config.get_settings().bot_token, 'first')
+                config.reset_settings()
+                self.assertEqual(config.settings.bot_token, 'second')
+        finally:
+            config.reset_settings()
+
+    def test_env_example_has_one_setting_per_line(self):
+        """В .env.txt каждая переменная на своей строке, файл кончается переводом строки"""
+        path = os.path.join(os.path.dirname(__file__), '..', '.env.txt')
+        with open(path, encoding='utf-8') as fp:
+            text = fp.read()
+        self.assertTrue(text.endswith('\n'))
+        for line in filter(None, text.splitlines()):
+            with self.subTest(line=line):
+                self.assertRegex(line, r'^#?[A-Z_]+=[^=]*$')
+
 if __name__ == '__main__':
     unittest.main()
\ No newline at end of file
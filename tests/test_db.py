@@ -1,14 +1,16 @@
+import asyncio
 import unittest
 import sqlite3
 import os
 import sys
+import tempfile
 from pathlib import Path
 from unittest.mock import patch, MagicMock
 
 # Добавляем путь к основному коду
 sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
 
-from db import ApplicationRepository
+from db import ApplicationRepository, AsyncApplicationRepository, fts_query
 
 class TestDatabase(unittest.TestCase):
     """Тесты для работы с базой данных"""
@@ -88,5 +90,347 @@ class TestDatabase(unittest.TestCase):
         self.assertIsNotNone(app)
         self.assertEqual(app['user_id'], 123456789)
 
+    def test_list_pending_with_history(self):
+        """Заявки на рассмотрение возвращаются вместе с ограниченной историей автора"""
+        for _ in range(7):
+            old_id = self.repo.save_application(1, 1, "one", "One", {})
+            self.repo.update_status(old_id, 'declined')
+        pending_one = self.repo.save_application(1, 1, "one", "One", {})
+        pending_two = self.repo.save_application(2, 2, "two", "Two", {})
+
+        result = self.repo.list_pending_with_history(limit=10, history_limit=3)
+
+        self.assertEqual([row['id'] for row, _ in result], [pending_one, pending_two])
+        first_history = result[0][1]
+        self.assertEqual(len(first_history), 3)
+        self.assertEqual(first_history[0]['id'], pending_one)
+        self.assertTrue(all(item['user_id'] == 1 for item in first_history))
+        self.assertEqual([item['id'] for item in result[1][1]], [pending_two])
+
+    def test_list_pending_keyset_pagination(self):
+        """Страницы очереди переключаются по курсору (created_at, id) в обе стороны"""
+        ids = [self.repo.save_application(i, i, None, None, {}) for i in range(1, 8)]
+
+        first = self.repo.list_pending(limit=3)
+        cursor = (first[-1]['created_at'], first[-1]['id'])
+        second = self.repo.list_pending(limit=3, after=cursor)
+        back = self.repo.list_pending(limit=3, before=(second[0]['created_at'], second[0]['id']))
+
+        self.assertEqual([row['id'] for row in first], ids[:3])
+        self.assertEqual([row['id'] for row in second], ids[3:6])
+        self.assertEqual([row['id'] for row in back], ids[:3])
+
+    def test_list_pending_filters(self):
+        """Очередь фильтруется по должности и диапазону возраста"""
+        self.repo.save_application(1, 1, None, None, {"job": "Видер", "age": "17"})
+        match = self.repo.save_application(2, 2, None, None, {"job": "Видер", "age": "21 год"})
+        self.repo.save_application(3, 3, None, None, {"job": "Звукарь", "age": "21"})
+
+        rows = self.repo.list_pending(job="Видер", min_age=18, max_age=25)
+
+        self.assertEqual([row['id'] for row in rows], [match])
+
+    def test_get_with_history(self):
+        """Заявка и история автора читаются одним вызовом"""
+        first = self.repo.save_application(1, 1, "one", "One", {})
+        second = self.repo.save_application(1, 1, "one", "One", {})
+
+        row, history = self.repo.get_with_history(first, history_limit=1)
+
+        self.assertEqual(row['id'], first)
+        self.assertEqual([item['id'] for item in history], [second])
+        self.assertIsNone(self.repo.get_with_history(999))
+
+    def test_transition_status(self):
+        """Переход статуса срабатывает только для заявки на рассмотрении"""
+        app_id = self.repo.save_application(1, 1, "one", "One", {})
+
+        row = self.repo.transition_status(app_id, "approved")
+        self.assertEqual(row['id'], app_id)
+        self.assertEqual(row['status'], "approved")
+        self.assertIsNone(self.repo.transition_status(app_id, "declined"))
+        self.assertIsNone(self.repo.transition_status(999, "approved"))
+        self.assertEqual(self.repo.get_by_id(app_id)['status'], "approved")
+
+    def test_bulk_update_status(self):
+        """Массовое решение меняет только подходящие заявки на рассмотрении"""
+        first = self.repo.save_application(1, 1, None, None, {"job": "Видер"})
+        second = self.repo.save_application(2, 2, None, None, {"job": "Видер"})
+        other = self.repo.save_application(3, 3, None, None, {"job": "Звукарь"})
+        self.repo.update_status(second, "declined")
+
+        changed = self.repo.bulk_update_status("approved", job="Видер")
+        self.assertEqual([row['id'] for row in changed], [first])
+        self.assertEqual(self.repo.get_by_id(first)['status'], "approved")
+        self.assertEqual(self.repo.get_by_id(second)['status'], "declined")
+
+        changed = self.repo.bulk_update_status("declined", ids=[first, other])
+        self.assertEqual([row['id'] for row in changed], [other])
+        self.assertEqual(self.repo.bulk_update_status("approved", ids=[]), [])
+
+    def test_bulk_update_backlog_in_one_transaction(self):
+        """Очередь из 500 заявок одобряется одной транзакцией"""
+        for user_id in range(500):
+            self.repo.save_application(user_id, user_id, None, None, {"job": "Переводчик"})
+        statements = []
+        self.repo._conn.set_trace_callback(statements.append)
+
+        changed = self.repo.bulk_update_status("approved", job="Переводчик")
+
+        self.assertEqual(len(changed), 500)
+        self.assertEqual(self.repo.list_pending(limit=1000), [])
+        self.assertEqual(sum(sql.startswith("BEGIN") for sql in statements), 1)
+
+    def _age(self, app_id, updated_at):
+        self.repo._conn.execute(
+            "UPDATE applications SET updated_at = ?, created_at = ?, decided_at = ? WHERE id = ?",
+            (updated_at, updated_at, updated_at, app_id),
+        )
+        self.repo._conn.commit()
+
+    def test_archive_decided(self):
+        """В архив уходят только старые рассмотренные и уже выгруженные заявки"""
+        old = self.repo.save_application(1, 1, "one", "One", {})
+        self.repo.update_status(old, "approved")
+        self.repo.mark_synced(old)
+        self._age(old, "2020-01-01 00:00:00")
+        unsynced = self.repo.save_application(1, 1, "one", "One", {})
+        self.repo.update_status(unsynced, "declined")
+        self._age(unsynced, "2020-02-01 00:00:00")
+        fresh = self.repo.save_application(1, 1, "one", "One", {})
+        self.repo.update_status(fresh, "approved")
+        self.repo.mark_synced(fresh)
+        pending = self.repo.save_application(1, 1, "one", "One", {})
+        self.repo.mark_synced(pending)
+        self._age(pending, "2020-03-01 00:00:00")
+        # заявка до появления outbox: рассмотрена, но в Yonote не попала
+        legacy = self.repo.save_application(2, 2, "two", "Two", {})
+        self.repo.update_status(legacy, "approved")
+        self.repo._conn.execute("DELETE FROM yonote_outbox WHERE application_id = ?", (legacy,))
+        self._age(legacy, "2020-04-01 00:00:00")
+
+        self.assertEqual(self.repo.archive_decided("2021-01-01 00:00:00"), 1)
+
+        self.assertEqual([row['id'] for row in self.repo.list_unsynced()], [legacy])
+
+        self.assertIsNone(self.repo.get_by_id(old))
+        self.assertEqual(
+            [row['id'] for row in self.repo.list_by_user(1)], [fresh, pending, unsynced]
+        )
+        self.assertEqual(
+            [row['id'] for row in self.repo.list_by_user(1, include_archive=True)],
+            [fresh, pending, unsynced, old],
+        )
+        self.assertEqual(len(self.repo.list_by_user(1, limit=2, include_archive=True)), 2)
+
+    def test_last_application_falls_back_to_archive(self):
+        """Если все заявки пользователя в архиве, последняя берётся оттуда"""
+        app_id = self.repo.save_application(1, 1, "one", "One", {})
+        self.repo.update_status(app_id, "approved")
+        self.repo.mark_synced(app_id)
+        self._age(app_id, "2020-01-01 00:00:00")
+        self.repo.archive_decided("2021-01-01 00:00:00")
+
+        row = self.repo.get_last_for_user(1)
+        self.assertEqual(row['id'], app_id)
+        self.assertEqual(row['status'], "approved")
+
+    def test_archive_runs_in_batches(self):
+        """Перенос идёт короткими транзакциями по batch_size заявок"""
+        for user_id in range(5):
+            app_id = self.repo.save_application(user_id, user_id, None, None, {})
+            self.repo.update_status(app_id, "declined")
+            self.repo.mark_synced(app_id)
+            self._age(app_id, "2020-01-01 00:00:00")
+        statements = []
+        self.repo._conn.set_trace_callback(statements.append)
+
+        self.assertEqual(self.repo.archive_decided("2021-01-01 00:00:00", batch_size=2), 5)
+        self.assertEqual(sum(sql.startswith("BEGIN") for sql in statements), 3)
+
+    def test_search(self):
+        """Поиск по нику, ссылке и словам из ответов упорядочен по релевантности"""
+        star = self.repo.save_application(
+            1, 1, "star_123", "Star", {"portfolio": "https://t.me/star_123", "goals": "вокал"}
+        )
+        moon = self.repo.save_application(
+            2, 2, "moon", "Moon", {"portfolio": "http://github.com/moon", "goals": "Star Wars фан-арт"}
+        )
+
+        self.assertEqual([row['id'] for row in self.repo.search("star")], [star, moon])
+        hits = self.repo.search("t.me/star_123")
+        self.assertEqual([row['id'] for row in hits], [star])
+        self.assertIn("[", hits[0]['snippet'])
+        self.assertEqual([row['id'] for row in self.repo.search("ВОКАЛ")], [star])
+        self.assertEqual([row['id'] for row in self.repo.search("star", 1, 1)], [moon])
+
+    def test_search_index_follows_changes(self):
+        """Индекс обновляется триггерами и сохраняет заявки, ушедшие в архив"""
+        app_id = self.repo.save_application(1, 1, None, "Star", {"goals": "вокал"})
+        self.repo._conn.execute(
+            "UPDATE applications SET answers_json = ? WHERE id = ?",
+            ('{"goals": "дизайн"}', app_id),
+        )
+        self.repo._conn.commit()
+        self.assertEqual(self.repo.search("вокал"), [])
+        self.assertEqual(len(self.repo.search("дизайн")), 1)
+
+        self.repo.update_status(app_id, "approved")
+        self.repo.mark_synced(app_id)
+        self._age(app_id, "2020-01-01 00:00:00")
+        self.repo.archive_decided("2021-01-01 00:00:00")
+        hits = self.repo.search("дизайн")
+        self.assertEqual([(row['id'], row['status']) for row in hits], [(app_id, "approved")])
+
+        self.repo._conn.execute("DELETE FROM applications_archive")
+        self.repo._conn.commit()
+        self.assertEqual(self.repo.search("дизайн"), [])
+
+    def test_stats_counters(self):
+        """Счётчики следуют за подачей, сменой статуса и архивацией"""
+        first = self.repo.save_application(1, 1, None, None, {"job": "Видер"})
+        second = self.repo.save_application(2, 2, None, None, {"job": "Видер"})
+        self.repo.save_application(3, 3, None, None, {"job": "Звукарь"})
+        self.repo.save_application(4, 4, None, None, {})
+        self.repo.update_status(first, "approved")
+        self.repo.bulk_update_status("declined", ids=[second])
+        self.repo.mark_synced(first)
+        self._age(first, "2020-01-01 00:00:00")
+        self.repo.archive_decided("2021-01-01 00:00:00")
+
+        stats = self.repo.get_stats()
+        self.assertEqual(stats["by_status"], {"approved": 1, "declined": 1, "pending": 2})
+        self.assertEqual(stats["by_job"]["Видер"], {"approved": 1, "declined": 1})
+        self.assertEqual(stats["by_job"][""], {"pending": 1})
+        # заявка, перенесённая в архив, подана давно и в последнюю неделю не входит
+        self.assertEqual(sum(count for _, count in stats["daily"]), 3)
+
+        recount = self.repo._conn.execute(
+            """
+            SELECT status, COUNT(*) FROM (
+                SELECT status FROM applications UNION ALL SELECT status FROM applications_archive
+            ) GROUP BY status
+            """
+        ).fetchall()
+        self.assertEqual(stats["by_status"], {status: count for status, count in recount})
+
+    def test_stats_ignore_unchanged_status(self):
+        """Повторная запись того же статуса не сдвигает счётчики"""
+        app_id = self.repo.save_application(1, 1, None, None, {"job": "Видер"})
+        self.repo.update_status(app_id, "pending", "комментарий")
+        self.assertEqual(self.repo.get_stats()["by_status"], {"pending": 1})
+
+    def test_fts_query(self):
+        """Ввод администратора не ломает синтаксис FTS5"""
+        self.assertEqual(fts_query('ник "x" OR'), '"ник"* """x"""* "OR"*')
+        self.assertIsNone(fts_query(" - : "))
+
+
+class TestAsyncRepository(unittest.IsolatedAsyncioTestCase):
+    """Тесты асинхронного репозитория поверх файловой базы"""
+
+    async def asyncSetUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.repo = AsyncApplicationRepository.open(
+            Path(self.tmpdir.name) / 'applications.db', read_pool_size=2
+        )
+
+    async def asyncTearDown(self):
+        await self.repo.close()
+        self.tmpdir.cleanup()
+
+    async def test_pragmas(self):
+        """База работает в WAL с настроенными synchronous и busy_timeout"""
+        conn = self.repo.sync._conn
+        self.assertEqual(conn.execute("PRAGMA journal_mode").fetchone()[0], 'wal')
+        self.assertEqual(conn.execute("PRAGMA synchronous").fetchone()[0], 1)  # NORMAL
+        self.assertEqual(conn.execute("PRAGMA busy_timeout").fetchone()[0], 5000)
+
+    async def test_round_trip(self):
+        """Запись и чтение через асинхронный API"""
+        app_id = await self.repo.save_application(1, 2, "user", "User", {"job": "Видер"})
+        await self.repo.update_status(app_id, 'approved')
+        row = await self.repo.get_last_for_user(1)
+        self.assertEqual(row['id'], app_id)
+        self.assertEqual(row['status'], 'approved')
+        self.assertEqual(len(await self.repo.list_by_user(1)), 1)
+        self.assertEqual(await self.repo.list_pending(), [])
+
+    async def test_reads_do_not_wait_for_writer(self):
+        """Чтение не блокируется открытой транзакцией писателя"""
+        app_id = await self.repo.save_application(1, 2, "user", "User", {})
+        writer = self.repo.sync._conn
+        with self.repo.sync._lock:
+            writer.execute("BEGIN IMMEDIATE")
+            writer.execute("UPDATE applications SET status = 'approved' WHERE id = ?", (app_id,))
+            row = await asyncio.wait_for(self.repo.get_by_id(app_id), timeout=1)
+            self.assertEqual(row['status'], 'pending')
+            writer.rollback()
+
+    async def test_concurrent_transitions_have_one_winner(self):
+        """Из одновременных решений по одной заявке проходит только одно"""
+        app_id = await self.repo.save_application(1, 1, "one", "One", {})
+
+        results = await asyncio.gather(
+            self.repo.transition_status(app_id, "approved"),
+            self.repo.transition_status(app_id, "declined"),
+            self.repo.transition_status(app_id, "approved"),
+        )
+
+        winners = [row for row in results if row is not None]
+        self.assertEqual(len(winners), 1)
+        self.assertEqual((await self.repo.get_by_id(app_id))['status'], winners[0]['status'])
+
+    async def test_vacuum_after_archive(self):
+        """После архивации свободные страницы возвращаются файлу"""
+        conn = self.repo.sync._conn
+        self.assertEqual(conn.execute("PRAGMA auto_vacuum").fetchone()[0], 2)
+        for user_id in range(200):
+            app_id = await self.repo.save_application(
+                user_id, user_id, None, None, {"goals": "x" * 2000}
+            )
+            await self.repo.update_status(app_id, "approved")
+            await self.repo.mark_synced(app_id)
+        conn.execute("UPDATE applications SET decided_at = '2020-01-01 00:00:00'")
+        conn.commit()
+
+        self.assertEqual(await self.repo.archive_decided("2021-01-01 00:00:00"), 200)
+        self.assertGreater(conn.execute("PRAGMA freelist_count").fetchone()[0], 0)
+        self.assertGreater(await self.repo.vacuum(), 0)
+        self.assertEqual(conn.execute("PRAGMA freelist_count").fetchone()[0], 0)
+
+    def test_legacy_database_converted_only_explicitly(self):
+        """Старая база без auto_vacuum переводится в INCREMENTAL только через vacuum.py"""
+        import vacuum
+
+        with tempfile.TemporaryDirectory() as tmp:
+            path = Path(tmp) / 'legacy.db'
+            conn = sqlite3.connect(path)
+            conn.execute("CREATE TABLE legacy (id INTEGER PRIMARY KEY)")
+            conn.close()
+
+            repo = ApplicationRepository(path)
+            try:
+                self.assertEqual(repo._conn.execute("PRAGMA auto_vacuum").fetchone()[0], 0)
+                self.assertEqual(repo.vacuum(), 0)
+                self.assertEqual(repo._conn.execute("PRAGMA auto_vacuum").fetchone()[0], 0)
+            finally:
+                repo.close()
+
+            with patch('builtins.print'):
+                self.assertEqual(vacuum.main(['--database', str(path)]), 0)
+            repo = ApplicationRepository(path)
+            try:
+                self.assertEqual(repo._conn.execute("PRAGMA auto_vacuum").fetchone()[0], 2)
+                self.assertFalse(repo.enable_incremental_vacuum())
+            finally:
+                repo.close()
+
+    def test_invalid_synchronous_mode(self):
+        """Неизвестный режим synchronous отклоняется"""
+        with self.assertRaises(ValueError):
+            ApplicationRepository(Path(':memory:'), synchronous='FAST; DROP')
+
+
 if __name__ == '__main__':
     unittest.main()
\ No newline at end of file
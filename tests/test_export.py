@@ -0,0 +1,124 @@
+import csv
+import json
+import os
+import sys
+import tempfile
+import unittest
+from pathlib import Path
+
+# Добавляем путь к основному коду
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import export
+from db import AsyncApplicationRepository
+from export import COLUMNS, ExportError, export_applications_async, normalize_filters
+
+try:
+    import pyarrow.parquet as pq
+except ImportError:  # pragma: no cover - pyarrow необязателен
+    pq = None
+
+
+class TestExport(unittest.IsolatedAsyncioTestCase):
+    """Тесты потоковой выгрузки заявок"""
+
+    async def asyncSetUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.repo = AsyncApplicationRepository.open(Path(':memory:'))
+        self.db = self.repo.sync
+        self.approved = await self.repo.save_application(
+            1, 1, "one", "One", {"full_name": "Один", "age": "20", "job": "Видер", "extra": "x"}
+        )
+        await self.repo.update_status(self.approved, "approved")
+        self.pending = await self.repo.save_application(2, 2, "two", "Two", {"job": "Звукарь"})
+        self.db._conn.execute(
+            "UPDATE applications SET created_at = '2024-05-31 23:59:00' WHERE id = ?", (self.pending,)
+        )
+        self.db._conn.commit()
+
+    async def asyncTearDown(self):
+        await self.repo.close()
+        self.tmpdir.cleanup()
+
+    def _path(self, name):
+        return Path(self.tmpdir.name) / name
+
+    async def test_csv_flattens_answers(self):
+        """В CSV ответы анкеты разложены по колонкам answer_*"""
+        path = self._path('out.csv')
+        self.assertEqual(await export_applications_async(self.repo, path, 'csv'), 2)
+        with open(path, encoding='utf-8') as fp:
+            rows = list(csv.DictReader(fp))
+        self.assertEqual(tuple(rows[0].keys()), COLUMNS)
+        self.assertEqual(rows[0]['answer_full_name'], "Один")
+        self.assertEqual(rows[0]['answer_job'], "Видер")
+        self.assertEqual(rows[1]['answer_age'], "")
+
+    async def test_archived_applications_are_exported(self):
+        """Архивные заявки выгружаются вместе с горячими"""
+        await self.repo.mark_synced(self.approved)
+        self.db._conn.execute(
+            "UPDATE applications SET decided_at = '2020-01-01 00:00:00' WHERE id = ?", (self.approved,)
+        )
+        self.db._conn.commit()
+        self.assertEqual(await self.repo.archive_decided('2021-01-01 00:00:00'), 1)
+        path = self._path('out.jsonl')
+        self.assertEqual(await export_applications_async(self.repo, path, 'jsonl'), 2)
+        records = [json.loads(line) for line in path.read_text(encoding='utf-8').splitlines()]
+        self.assertEqual([record['id'] for record in records], [self.approved, self.pending])
+        self.assertEqual(records[0]['answer_job'], "Видер")
+        count = await export_applications_async(self.repo, path, 'jsonl', include_archive=False)
+        self.assertEqual(count, 1)
+
+    async def test_jsonl_with_filters(self):
+        """Фильтры по статусу, должности и датам применяются"""
+        path = self._path('out.jsonl')
+        filters_ = normalize_filters(status='approved')
+        await export_applications_async(self.repo, path, 'jsonl', **filters_)
+        records = [json.loads(line) for line in path.read_text(encoding='utf-8').splitlines()]
+        self.assertEqual([record['id'] for record in records], [self.approved])
+
+        filters_ = normalize_filters(job='Звукарь', since='2024-05-01', until='2024-05-31')
+        await export_applications_async(self.repo, path, 'jsonl', **filters_)
+        records = [json.loads(line) for line in path.read_text(encoding='utf-8').splitlines()]
+        self.assertEqual([record['id'] for record in records], [self.pending])
+
+    async def test_rows_are_streamed_in_chunks(self):
+        """База читается кусками, а не целиком"""
+        for user_id in range(3, 12):
+            await self.repo.save_application(user_id, user_id, None, None, {})
+        statements = []
+        for conn in (self.db._conn, *self.db._readers.queue):
+            conn.set_trace_callback(statements.append)
+        original = export.CHUNK_SIZE
+        export.CHUNK_SIZE = 4
+        try:
+            count = await export_applications_async(self.repo, self._path('out.csv'), 'csv')
+        finally:
+            export.CHUNK_SIZE = original
+        self.assertEqual(count, 11)
+        self.assertEqual(sum("FROM applications" in sql for sql in statements), 3)
+
+    async def test_unknown_format(self):
+        """Неизвестный формат отклоняется"""
+        with self.assertRaises(ExportError):
+            await export_applications_async(self.repo, self._path('out.xml'), 'xml')
+
+    @unittest.skipIf(pq is None, "pyarrow не установлен")
+    async def test_parquet(self):
+        """Parquet читается обратно с теми же колонками"""
+        path = self._path('out.parquet')
+        self.assertEqual(await export_applications_async(self.repo, path, 'parquet'), 2)
+        table = pq.read_table(path)
+        self.assertEqual(table.column_names, list(COLUMNS))
+        self.assertEqual(table.column('answer_job').to_pylist(), ["Видер", "Звукарь"])
+
+    @unittest.skipIf(pq is not None, "pyarrow установлен")
+    async def test_parquet_without_pyarrow(self):
+        """Без pyarrow выгрузка в Parquet сообщает понятную ошибку"""
+        with self.assertRaises(ExportError):
+            await export_applications_async(self.repo, self._path('out.parquet'), 'parquet')
+
+
+if __name__ == '__main__':
+    unittest.main()
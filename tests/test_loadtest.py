@@ -0,0 +1,104 @@
+import argparse
+import asyncio
+import json
+import os
+import subprocess
+import sys
+import unittest
+
+# Добавляем путь к основному коду
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+sys.path.insert(0, ROOT)
+
+import config
+from loadtest import percentile, run_loadtest
+
+
+class TestPercentile(unittest.TestCase):
+    """Тесты расчёта перцентилей"""
+
+    def test_nearest_rank(self):
+        """Перцентиль берётся методом ближайшего ранга"""
+        values = [float(value) for value in range(1, 101)]
+        self.assertEqual(percentile(values, 50), 50.0)
+        self.assertEqual(percentile(values, 95), 95.0)
+        self.assertEqual(percentile(values, 99), 99.0)
+        self.assertEqual(percentile([], 99), 0.0)
+
+
+class TestLoadTestEnvironment(unittest.TestCase):
+    """Прогон внутри процесса не оставляет после себя окружение и настройки"""
+
+    def test_environment_restored(self):
+        """После прогона os.environ и config.settings возвращаются к прежним"""
+        environ = dict(os.environ)
+        args = argparse.Namespace(
+            users=3, admins=1, admin_actions=1, api_latency=0.0, storage='memory', timeout=30.0
+        )
+        report = asyncio.run(run_loadtest(args))
+
+        self.assertEqual(report['errors'] + report['timeouts'], 0)
+        self.assertEqual(dict(os.environ), environ)
+        self.assertNotIn('settings', vars(config))
+
+
+class TestLoadTestSmoke(unittest.TestCase):
+    """Короткий нагрузочный прогон без сети — проверяет, что весь путь обновления работает"""
+
+    def test_small_run(self):
+        """Все обновления обработаны без ошибок, заявки выгружены в заглушку Yonote"""
+        result = subprocess.run(
+            [
+                sys.executable,
+                os.path.join(ROOT, 'loadtest.py'),
+                '--users', '20',
+                '--admins', '2',
+                '--admin-actions', '3',
+                '--seed', '1',
+                '--json',
+            ],
+            cwd=ROOT,
+            capture_output=True,
+            text=True,
+            timeout=120,
+        )
+        self.assertEqual(result.returncode, 0, result.stderr)
+        report = json.loads(result.stdout)
+
+        self.assertEqual(report['errors'], 0)
+        self.assertEqual(report['timeouts'], 0)
+        self.assertEqual(report['by_kind']['answer']['count'], 20 * 5)
+        self.assertEqual(report['by_kind']['status']['count'], 20)
+        self.assertEqual(report['documents'], 20)
+        self.assertGreater(report['latency']['p99_ms'], 0)
+
+    def test_concurrency_sweep(self):
+        """Несколько пределов параллельности — по прогону на каждый"""
+        result = subprocess.run(
+            [
+                sys.executable,
+                os.path.join(ROOT, 'loadtest.py'),
+                '--users', '10',
+                '--admins', '1',
+                '--admin-actions', '2',
+                '--storage', 'memory',
+                '--concurrency', '1,4',
+                '--json',
+            ],
+            cwd=ROOT,
+            capture_output=True,
+            text=True,
+            timeout=120,
+        )
+        self.assertEqual(result.returncode, 0, result.stderr)
+        reports = json.loads(result.stdout)
+        self.assertEqual([report['concurrency'] for report in reports], [1, 4])
+        for report in reports:
+            self.assertEqual(report['errors'] + report['timeouts'], 0)
+            self.assertEqual(report['by_kind']['status']['count'], 10)
+            # каждый прогон пишет в свою базу и свою заглушку Yonote
+            self.assertEqual(report['documents'], 10)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,112 @@
+import os
+import sys
+import unittest
+from pathlib import Path
+
+from aiohttp import web
+from aiohttp.test_utils import TestClient, TestServer
+from prometheus_client import REGISTRY
+from telegram.ext import Application, CallbackQueryHandler, CommandHandler, ConversationHandler
+
+# Добавляем путь к основному коду
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import metrics
+from db import AsyncApplicationRepository
+
+
+def sample(name, **labels):
+    return REGISTRY.get_sample_value(name, labels) or 0.0
+
+
+async def first(update, context):
+    return 1
+
+
+async def second(update, context):
+    raise RuntimeError("boom")
+
+
+class TestHandlerMetrics(unittest.IsolatedAsyncioTestCase):
+    """Тесты замеров времени обработчиков"""
+
+    async def test_instrument_handlers_wraps_conversation(self):
+        """Оборачиваются и обычные обработчики, и вложенные в ConversationHandler"""
+        application = Application.builder().token("123:abc").build()
+        application.add_handler(
+            ConversationHandler(
+                entry_points=[CommandHandler("first", first)],
+                states={1: [CallbackQueryHandler(second)]},
+                fallbacks=[CommandHandler("first", first)],
+            )
+        )
+        application.add_handler(CommandHandler("second", second))
+
+        self.assertEqual(metrics.instrument_handlers(application), 4)
+        self.assertEqual(metrics.instrument_handlers(application), 0)
+
+        conversation, command = application.handlers[0]
+        before = sample("bot_handler_duration_seconds_count", handler="first")
+        errors = sample("bot_handler_errors_total", handler="second")
+        self.assertEqual(await conversation.entry_points[0].callback(None, None), 1)
+        with self.assertRaises(RuntimeError):
+            await command.callback(None, None)
+
+        self.assertEqual(sample("bot_handler_duration_seconds_count", handler="first"), before + 1)
+        self.assertEqual(sample("bot_handler_errors_total", handler="second"), errors + 1)
+
+
+class TestRepositoryMetrics(unittest.IsolatedAsyncioTestCase):
+    """Тесты замеров методов репозитория"""
+
+    async def test_repository_methods_are_timed(self):
+        """Каждый вызов метода репозитория попадает в гистограмму с его именем"""
+        repo = AsyncApplicationRepository.open(Path(':memory:'))
+        try:
+            before = sample("bot_db_query_duration_seconds_count", method="save_application")
+            await repo.save_application(1, 1, None, None, {})
+            await repo.list_pending()
+        finally:
+            await repo.close()
+        self.assertEqual(
+            sample("bot_db_query_duration_seconds_count", method="save_application"), before + 1
+        )
+        self.assertGreater(sample("bot_db_query_duration_seconds_count", method="list_pending"), 0)
+
+    async def test_status_cache_results_are_counted(self):
+        """Попадания и промахи кэша статусов видны в /metrics"""
+        repo = AsyncApplicationRepository.open(Path(':memory:'))
+        try:
+            hits = sample("bot_status_cache_requests_total", result="hit")
+            misses = sample("bot_status_cache_requests_total", result="miss")
+            for _ in range(3):
+                await repo.get_last_for_user(1)
+        finally:
+            await repo.close()
+        self.assertEqual(sample("bot_status_cache_requests_total", result="hit"), hits + 2)
+        self.assertEqual(sample("bot_status_cache_requests_total", result="miss"), misses + 1)
+
+
+class TestMetricsEndpoint(unittest.IsolatedAsyncioTestCase):
+    """Тесты HTTP-эндпоинта /metrics"""
+
+    async def test_endpoint_exposes_metrics(self):
+        """Эндпоинт отдаёт метрики в текстовом формате Prometheus"""
+        metrics.survey_event("step", "age")
+        metrics.track_queue("test", lambda: 7)
+        app = web.Application()
+        app.router.add_get(metrics.METRICS_PATH, metrics.metrics_endpoint)
+        async with TestClient(TestServer(app)) as client:
+            response = await client.get(metrics.METRICS_PATH)
+            body = await response.text()
+        self.assertEqual(response.status, 200)
+        self.assertIn('bot_survey_events_total{event="step",step="age"}', body)
+        self.assertIn('bot_queue_depth{queue="test"} 7.0', body)
+
+    async def test_disabled_server(self):
+        """Нулевой порт отключает сервер метрик"""
+        self.assertIsNone(await metrics.start_metrics_server("127.0.0.1", 0))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,174 @@
+import unittest
+import sqlite3
+import os
+import sys
+import tempfile
+from pathlib import Path
+
+# Добавляем путь к основному коду
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from db import ApplicationRepository, SCHEMA_VERSION, apply_migrations
+
+LEGACY_SCHEMA = """
+CREATE TABLE applications (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    user_id INTEGER NOT NULL,
+    chat_id INTEGER NOT NULL,
+    username TEXT,
+    full_name TEXT,
+    answers_json TEXT NOT NULL,
+    status TEXT NOT NULL,
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    admin_comment TEXT
+);
+INSERT INTO applications (user_id, chat_id, username, full_name, answers_json, status)
+VALUES (42, 42, 'old', 'Old User', '{"goals": "научиться вокалу"}', 'pending');
+"""
+
+
+# Имена и псевдонимы настоящих таблиц в запросах репозитория; SCAN по ним — полный просмотр.
+BASE_TABLES = {'applications', 'applications_archive', 'yonote_outbox', 'h', 'a', 'o'}
+
+
+def _full_scans(plan):
+    return [step for step in plan if step.startswith('SCAN ') and step.split()[1] in BASE_TABLES]
+
+
+class TestMigrations(unittest.TestCase):
+    """Тесты версионированных миграций схемы"""
+
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.db_path = Path(self.tmpdir.name) / 'applications.db'
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def _user_version(self, conn):
+        return conn.execute("PRAGMA user_version").fetchone()[0]
+
+    def test_fresh_database_is_at_latest_version(self):
+        """Новая база получает последнюю версию схемы и индексы"""
+        repo = ApplicationRepository(self.db_path)
+        self.assertEqual(self._user_version(repo._conn), SCHEMA_VERSION)
+        indexes = {
+            row['name']
+            for row in repo._conn.execute("SELECT name FROM sqlite_master WHERE type = 'index'")
+        }
+        self.assertTrue({
+            'idx_applications_user_created',
+            'idx_applications_status_created',
+            'idx_applications_unsynced',
+            'idx_applications_job',
+            'idx_applications_pending_job',
+        } <= indexes)
+        repo.close()
+
+    def test_legacy_database_is_upgraded(self):
+        """Старая база без synced_to_yonote и user_version обновляется с сохранением данных"""
+        conn = sqlite3.connect(self.db_path)
+        conn.executescript(LEGACY_SCHEMA)
+        conn.close()
+
+        repo = ApplicationRepository(self.db_path)
+        row = repo.get_last_for_user(42)
+        self.assertEqual(row['full_name'], 'Old User')
+        self.assertEqual(row['synced_to_yonote'], 0)
+        self.assertEqual(self._user_version(repo._conn), SCHEMA_VERSION)
+        # существующие заявки попадают в полнотекстовый индекс при миграции
+        self.assertEqual([hit['id'] for hit in repo.search('вокал')], [row['id']])
+        # и в счётчики /stats
+        self.assertEqual(repo.get_stats()['by_status'], {'pending': 1})
+        # колонки ответов вычисляются и для старых строк
+        self.assertEqual((row['goals'], row['job'], row['age_years']), ('научиться вокалу', None, None))
+        self.assertEqual([item['id'] for item in repo.list_pending(job='Видер')], [])
+        repo.close()
+
+    def test_reopen_is_noop(self):
+        """Повторное открытие не применяет миграции заново"""
+        ApplicationRepository(self.db_path).close()
+        conn = sqlite3.connect(self.db_path)
+        self.assertEqual(apply_migrations(conn), SCHEMA_VERSION)
+        self.assertEqual(self._user_version(conn), SCHEMA_VERSION)
+        conn.close()
+
+    def test_newer_schema_is_rejected(self):
+        """База с версией новее приложения не открывается"""
+        conn = sqlite3.connect(self.db_path)
+        conn.execute(f"PRAGMA user_version = {SCHEMA_VERSION + 1}")
+        conn.close()
+        with self.assertRaises(RuntimeError):
+            ApplicationRepository(self.db_path)
+
+    def test_query_plans_use_indexes(self):
+        """Запросы репозитория не сканируют таблицы и не сортируют во временном B-дереве
+
+        Полные выгрузки (list_all, list_outbox) намеренно не проверяются.
+        """
+        repo = ApplicationRepository(Path(':memory:'))
+        app_id = repo.save_application(1, 1, 'user', 'User', {'job': 'Видер'})
+        calls = {
+            'list_pending': lambda: repo.list_pending(),
+            'list_pending_after': lambda: repo.list_pending(after=('2000-01-01 00:00:00', 0)),
+            'list_pending_before': lambda: repo.list_pending(before=('2100-01-01 00:00:00', 0)),
+            'list_pending_job': lambda: repo.list_pending(job='Видер', min_age=18),
+            'list_pending_age': lambda: repo.list_pending(min_age=18, max_age=25),
+            'list_applications_job': lambda: repo.list_applications(job='Видер'),
+            'list_applications_archive': lambda: repo.list_applications(after_id=app_id, include_archive=True),
+            'get_by_id': lambda: repo.get_by_id(app_id),
+            'get_last_for_user': lambda: repo.get_last_for_user(1),
+            'list_by_user': lambda: repo.list_by_user(1),
+            'update_status': lambda: repo.update_status(app_id, 'approved'),
+            'claim_outbox': lambda: repo.claim_outbox(10),
+            'retry_outbox': lambda: repo.retry_outbox(1, 0, 'error'),
+            'mark_synced': lambda: repo.mark_synced(app_id),
+        }
+        for name, call in calls.items():
+            statements = []
+            repo._conn.set_trace_callback(statements.append)
+            try:
+                call()
+            finally:
+                repo._conn.set_trace_callback(None)
+            queries = [
+                sql for sql in statements
+                if sql.lstrip().upper().startswith(('SELECT', 'UPDATE', 'DELETE'))
+            ]
+            self.assertTrue(queries, name)
+            for sql in queries:
+                plan = [row[3] for row in repo._conn.execute("EXPLAIN QUERY PLAN " + sql)]
+                with self.subTest(method=name, plan=plan):
+                    self.assertFalse(_full_scans(plan))
+                    self.assertFalse([step for step in plan if 'TEMP B-TREE' in step])
+
+    def test_batched_history_query_plans(self):
+        """Пакетные запросы истории читают таблицу только по индексам
+
+        Сортировка небольшого промежуточного результата во временном B-дереве допустима.
+        """
+        repo = ApplicationRepository(Path(':memory:'))
+        app_id = repo.save_application(1, 1, 'user', 'User', {})
+        calls = (
+            lambda: repo.list_pending_with_history(),
+            lambda: repo.get_with_history(app_id),
+            lambda: repo.list_pending_with_history(include_archive=True),
+            lambda: repo.get_with_history(app_id, include_archive=True),
+        )
+        for call in calls:
+            statements = []
+            repo._conn.set_trace_callback(statements.append)
+            try:
+                call()
+            finally:
+                repo._conn.set_trace_callback(None)
+            for sql in statements:
+                plan = [row[3] for row in repo._conn.execute("EXPLAIN QUERY PLAN " + sql)]
+                with self.subTest(plan=plan):
+                    self.assertFalse(_full_scans(plan))
+                    self.assertTrue([step for step in plan if 'USING INDEX idx_applications' in step])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,153 @@
+import asyncio
+import os
+import sys
+import time
+import unittest
+from pathlib import Path
+
+from telegram.error import BadRequest, Forbidden, NetworkError, RetryAfter
+
+# Добавляем путь к основному коду
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from db import AsyncApplicationRepository
+from notifications import NotificationDispatcher, TokenBucket
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+class FakeBot:
+    """Записывает отправленные сообщения; ``errors`` — ошибки для очередных вызовов по чатам."""
+
+    def __init__(self, errors=None):
+        self.sent = []
+        self.errors = errors or {}
+
+    async def send_message(self, chat_id, text):
+        pending = self.errors.get(chat_id)
+        if pending:
+            raise pending.pop(0)
+        self.sent.append((chat_id, text, time.monotonic()))
+
+
+class TestTokenBucket(unittest.TestCase):
+    """Тесты ведра токенов"""
+
+    def test_reserve_spaces_out_requests(self):
+        """После исчерпания запаса каждый токен ждёт 1/rate секунд"""
+        clock = FakeClock()
+        bucket = TokenBucket(rate=2, capacity=2, clock=clock)
+        self.assertEqual([bucket.reserve() for _ in range(4)], [0.0, 0.0, 0.5, 1.0])
+        clock.now = 1.0
+        self.assertEqual(bucket.reserve(), 0.5)
+
+    def test_pause(self):
+        """pause откладывает выдачу токенов на заданное время"""
+        clock = FakeClock()
+        bucket = TokenBucket(rate=10, capacity=10, clock=clock)
+        bucket.pause(3)
+        self.assertAlmostEqual(bucket.reserve(), 3.1)
+
+    def test_try_acquire_does_not_go_negative(self):
+        """try_acquire отказывает без долга: токен появляется через 1/rate секунд"""
+        clock = FakeClock()
+        bucket = TokenBucket(rate=2, capacity=2, clock=clock)
+        self.assertEqual([bucket.try_acquire() for _ in range(4)], [True, True, False, False])
+        clock.now = 0.5
+        self.assertTrue(bucket.try_acquire())
+        self.assertFalse(bucket.try_acquire())
+
+
+class TestNotificationDispatcher(unittest.IsolatedAsyncioTestCase):
+    """Тесты очереди уведомлений"""
+
+    async def asyncSetUp(self):
+        self.repo = AsyncApplicationRepository.open(Path(':memory:'))
+
+    async def asyncTearDown(self):
+        await self.repo.close()
+
+    async def _run(self, bot, messages, **kwargs):
+        dispatcher = NotificationDispatcher(self.repo, base_delay=0, **kwargs)
+        await dispatcher.start(bot)
+        for chat_id, text in messages:
+            await dispatcher.send(chat_id, text)
+        await dispatcher.stop()
+        return dispatcher
+
+    async def test_per_chat_rate_is_respected(self):
+        """Сообщения в один чат идут не чаще chat_rate, в разные — параллельно"""
+        bot = FakeBot()
+        messages = [(1, "a"), (1, "b"), (1, "c"), (2, "x"), (3, "y")]
+        await self._run(bot, messages, chat_rate=20, global_rate=1000)
+
+        first_chat = [sent_at for chat_id, _, sent_at in bot.sent if chat_id == 1]
+        self.assertEqual(len(bot.sent), 5)
+        self.assertEqual([text for chat_id, text, _ in bot.sent if chat_id == 1], ["a", "b", "c"])
+        for earlier, later in zip(first_chat, first_chat[1:]):
+            self.assertGreaterEqual(later - earlier, 0.04)
+
+    async def test_retry_after_and_network_errors_are_retried(self):
+        """RetryAfter и сетевые ошибки повторяются"""
+        bot = FakeBot({1: [RetryAfter(0), NetworkError("reset")]})
+        dispatcher = await self._run(bot, [(1, "hello")], chat_rate=100)
+        self.assertEqual([text for _, text, _ in bot.sent], ["hello"])
+        self.assertEqual(dispatcher.sent, 1)
+
+    async def test_gives_up_after_max_attempts(self):
+        """После max_attempts сетевых ошибок сообщение отбрасывается"""
+        bot = FakeBot({1: [NetworkError("reset")] * 5})
+        dispatcher = await self._run(bot, [(1, "hello")], chat_rate=100, max_attempts=3)
+        self.assertEqual(bot.sent, [])
+        self.assertEqual(dispatcher.failed, 1)
+        self.assertEqual(len(bot.errors[1]), 2)
+
+    async def test_blocked_chat_is_marked_undeliverable(self):
+        """Заблокировавший бота пользователь помечается и больше не получает сообщений"""
+        bot = FakeBot({
+            1: [Forbidden("Forbidden: bot was blocked by the user")],
+            2: [BadRequest("Chat not found")],
+        })
+        await self._run(bot, [(1, "a"), (2, "b")], chat_rate=100)
+        self.assertEqual(sorted(await self.repo.list_undeliverable()), [1, 2])
+
+        dispatcher = NotificationDispatcher(self.repo)
+        await dispatcher.start(bot)
+        self.assertFalse(await dispatcher.send(1, "again"))
+        await dispatcher.stop()
+        self.assertEqual(bot.sent, [])
+
+    async def test_new_application_clears_undeliverable(self):
+        """Новая заявка снимает отметку недоступности с чата"""
+        await self.repo.mark_undeliverable(5, "blocked")
+        await self.repo.save_application(5, 5, "user", "User", {"job": "Видер"})
+        self.assertEqual(await self.repo.list_undeliverable(), [])
+
+    async def test_send_many_skips_undeliverable(self):
+        """Пачка уведомлений уходит целиком, кроме недоступных чатов"""
+        await self.repo.mark_undeliverable(3, "blocked")
+        bot = FakeBot()
+        dispatcher = NotificationDispatcher(self.repo, global_rate=1000)
+        await dispatcher.start(bot)
+        accepted = await dispatcher.send_many((chat_id, "ok") for chat_id in range(1, 6))
+        await dispatcher.stop()
+        self.assertEqual(accepted, 4)
+        self.assertEqual(sorted(chat_id for chat_id, _, _ in bot.sent), [1, 2, 4, 5])
+
+    async def test_send_waits_when_queue_is_full(self):
+        """При заполненной очереди send ждёт, пока воркеры её разгрузят"""
+        bot = FakeBot()
+        dispatcher = await self._run(
+            bot, [(chat_id, "x") for chat_id in range(20)], queue_size=2, concurrency=1
+        )
+        self.assertEqual(dispatcher.sent, 20)
+
+
+if __name__ == '__main__':
+    unittest.main()
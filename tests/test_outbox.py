@@ -0,0 +1,185 @@
+import asyncio
+import unittest
+import os
+import sys
+from pathlib import Path
+
+# Добавляем путь к основному коду
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from db import AsyncApplicationRepository
+from outbox import OutboxDigest, OutboxWorker, digest_title
+from yonote_client import CircuitOpenError
+
+
+class TestOutboxWorker(unittest.IsolatedAsyncioTestCase):
+    """Тесты фоновой выгрузки заявок через outbox"""
+
+    async def asyncSetUp(self):
+        self.repo = AsyncApplicationRepository.open(Path(':memory:'))
+        self.app_id = await self.repo.save_application(1, 1, "user", "User", {"job": "Вокалист"})
+
+    async def asyncTearDown(self):
+        await self.repo.close()
+
+    async def test_save_application_enqueues_outbox(self):
+        """Заявка попадает в outbox в той же транзакции"""
+        entries = await self.repo.list_outbox()
+        self.assertEqual(len(entries), 1)
+        self.assertEqual(entries[0]['application_id'], self.app_id)
+        self.assertEqual(entries[0]['status'], 'pending')
+
+    async def test_successful_publish_marks_synced(self):
+        """Успешная выгрузка помечает заявку и очищает outbox"""
+        published = []
+
+        async def publish(row):
+            published.append(row['id'])
+            return {"id": "doc", "url": "http://example.com"}
+
+        worker = OutboxWorker(self.repo, publish, base_delay=0)
+        self.assertEqual(await worker.drain(), 1)
+        self.assertEqual(published, [self.app_id])
+        self.assertEqual((await self.repo.get_by_id(self.app_id))['synced_to_yonote'], 1)
+        self.assertEqual(await self.repo.list_outbox(), [])
+
+    async def test_failed_publish_is_dead_lettered(self):
+        """После max_attempts неудач запись уходит в dead-letter"""
+        calls = []
+
+        async def publish(row):
+            calls.append(row['id'])
+            raise RuntimeError("Yonote недоступен")
+
+        worker = OutboxWorker(self.repo, publish, max_attempts=3, base_delay=0)
+        await worker.drain()
+        self.assertEqual(len(calls), 3)
+        dead = await self.repo.list_outbox('dead')
+        self.assertEqual(len(dead), 1)
+        self.assertEqual(dead[0]['attempts'], 3)
+        self.assertIn("Yonote недоступен", dead[0]['last_error'])
+        self.assertEqual((await self.repo.get_by_id(self.app_id))['synced_to_yonote'], 0)
+
+    async def test_retry_is_delayed(self):
+        """Неудачная попытка откладывает запись на время backoff"""
+        async def publish(row):
+            return None
+
+        worker = OutboxWorker(self.repo, publish, base_delay=60)
+        self.assertEqual(await worker.drain(), 1)
+        entry = (await self.repo.list_outbox('pending'))[0]
+        self.assertEqual(entry['attempts'], 1)
+        self.assertEqual(await self.repo.claim_outbox(limit=10), [])
+
+    async def test_open_circuit_defers_without_attempt(self):
+        """Пока цепь разомкнута, запись откладывается без расхода попыток"""
+        async def publish(row):
+            raise CircuitOpenError(60)
+
+        worker = OutboxWorker(self.repo, publish, max_attempts=1, base_delay=0)
+        self.assertEqual(await worker.drain(), 1)
+        entry = (await self.repo.list_outbox('pending'))[0]
+        self.assertEqual(entry['attempts'], 0)
+        self.assertEqual(await self.repo.claim_outbox(limit=10), [])
+
+    async def test_concurrency_is_bounded(self):
+        """Одновременно выгружается не больше concurrency заявок"""
+        for i in range(2, 12):
+            await self.repo.save_application(i, i, None, None, {})
+        active = 0
+        peak = 0
+
+        async def publish(row):
+            nonlocal active, peak
+            active += 1
+            peak = max(peak, active)
+            await asyncio.sleep(0.01)
+            active -= 1
+            return {"id": row['id']}
+
+        worker = OutboxWorker(self.repo, publish, concurrency=3)
+        self.assertEqual(await worker.drain(), 11)
+        self.assertLessEqual(peak, 3)
+        self.assertEqual(await self.repo.list_outbox(), [])
+
+
+class TestOutboxDigest(unittest.IsolatedAsyncioTestCase):
+    """Тесты выгрузки outbox сводками"""
+
+    async def asyncSetUp(self):
+        self.repo = AsyncApplicationRepository.open(Path(':memory:'))
+        self.ids = []
+        for i, job in enumerate(['Вокалист', 'Видер', 'Вокалист', None], start=1):
+            answers = {'job': job} if job else {}
+            self.ids.append(await self.repo.save_application(i, i, f'user{i}', f'User {i}', answers))
+        self.digests = []
+
+    async def asyncTearDown(self):
+        await self.repo.close()
+
+    async def _publish(self, title, rows):
+        self.digests.append((title, [row['id'] for row in rows]))
+        return {"id": f"doc-{len(self.digests)}"}
+
+    async def test_one_document_per_interval(self):
+        """Все готовые заявки уходят одним документом и помечаются выгруженными"""
+        digest = OutboxDigest(self.repo, self._publish)
+        self.assertEqual(await digest.drain(), 4)
+        self.assertEqual(len(self.digests), 1)
+        self.assertTrue(self.digests[0][0].startswith('Сводка заявок'))
+        self.assertEqual(self.digests[0][1], self.ids)
+        self.assertEqual(await self.repo.list_outbox(), [])
+        for app_id in self.ids:
+            self.assertEqual((await self.repo.get_by_id(app_id))['synced_to_yonote'], 1)
+        # пустой outbox — ни одного запроса
+        self.assertEqual(await digest.drain(), 0)
+        self.assertEqual(len(self.digests), 1)
+
+    async def test_group_by_job(self):
+        """При группировке по должности — документ на должность, маленькими пачками тоже"""
+        digest = OutboxDigest(self.repo, self._publish, group_by='job', batch_size=10)
+        await digest.drain()
+        groups = {title.rsplit(' · ', 1)[1]: ids for title, ids in self.digests}
+        self.assertEqual(groups, {
+            'Вокалист': [self.ids[0], self.ids[2]],
+            'Видер': [self.ids[1]],
+            'Без должности': [self.ids[3]],
+        })
+
+    async def test_batches(self):
+        """Пачка ограничена batch_size, outbox разбирается до конца"""
+        digest = OutboxDigest(self.repo, self._publish, batch_size=3)
+        self.assertEqual(await digest.drain(), 4)
+        self.assertEqual([len(ids) for _, ids in self.digests], [3, 1])
+
+    async def test_failure_retries_every_row(self):
+        """Неудачная сводка откладывает каждую заявку, ничего не помечая выгруженным"""
+        async def publish(title, rows):
+            raise RuntimeError("Yonote недоступен")
+
+        digest = OutboxDigest(self.repo, publish, base_delay=60)
+        self.assertEqual(await digest.drain(), 4)
+        entries = await self.repo.list_outbox('pending')
+        self.assertEqual([entry['attempts'] for entry in entries], [1, 1, 1, 1])
+        self.assertEqual(await self.repo.claim_outbox(limit=10), [])
+        self.assertEqual((await self.repo.get_by_id(self.ids[0]))['synced_to_yonote'], 0)
+
+    async def test_open_circuit_defers(self):
+        """При разомкнутой цепи заявки ждут следующей сводки без расхода попыток"""
+        async def publish(title, rows):
+            raise CircuitOpenError(60)
+
+        digest = OutboxDigest(self.repo, publish, max_attempts=1)
+        await digest.drain()
+        entries = await self.repo.list_outbox('pending')
+        self.assertEqual([entry['attempts'] for entry in entries], [0, 0, 0, 0])
+
+    def test_digest_title(self):
+        """Заголовок — период подачи и группа"""
+        rows = [{'created_at': '2024-05-01 10:00:00'}, {'created_at': '2024-05-01 11:30:59'}]
+        self.assertEqual(digest_title(rows), 'Сводка заявок 2024-05-01 10:00 — 2024-05-01 11:30')
+        self.assertEqual(digest_title(rows[:1], 'Видер'), 'Сводка заявок 2024-05-01 10:00 · Видер')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,173 @@
+import asyncio
+import json
+import os
+import sys
+import tempfile
+import time
+import unittest
+from pathlib import Path
+
+from telegram import Update
+from telegram.ext import Application, CommandHandler, ConversationHandler, TypeHandler
+from telegram.request import BaseRequest
+
+# Добавляем путь к основному коду
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from db import AsyncApplicationRepository
+from persistence import RepositoryPersistence
+
+START_UPDATE = {
+    "update_id": 1,
+    "message": {
+        "message_id": 1,
+        "date": 0,
+        "chat": {"id": 5, "type": "private"},
+        "from": {"id": 5, "is_bot": False, "first_name": "User"},
+        "text": "/start",
+        "entities": [{"type": "bot_command", "offset": 0, "length": 6}],
+    },
+}
+
+
+class OfflineRequest(BaseRequest):
+    """Отвечает на getMe без обращения к Telegram."""
+
+    async def initialize(self):
+        pass
+
+    async def shutdown(self):
+        pass
+
+    @property
+    def read_timeout(self):
+        return 1
+
+    async def do_request(self, url, method, request_data=None, **kwargs):
+        result = {"id": 1, "is_bot": True, "first_name": "bot", "username": "bot"}
+        return 200, json.dumps({"ok": True, "result": result}).encode()
+
+
+class TestRepositoryPersistence(unittest.IsolatedAsyncioTestCase):
+    """Тесты хранения состояния опроса в хранилище заявок (движок SQLite)"""
+
+    async def asyncSetUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.db_path = Path(self.tmpdir.name) / 'applications.db'
+        self.repo = AsyncApplicationRepository.open(self.db_path)
+
+    async def asyncTearDown(self):
+        await self.repo.close()
+        self.tmpdir.cleanup()
+
+    async def test_state_survives_restart(self):
+        """user_data и состояние диалога восстанавливаются после перезапуска"""
+        persistence = RepositoryPersistence(self.repo)
+        await persistence.update_user_data(5, {"survey_step": 2, "answers": {"age": "20"}})
+        await persistence.update_conversation("survey", (5, 5), 2)
+        await persistence.flush()
+        await self.repo.close()
+
+        self.repo = AsyncApplicationRepository.open(self.db_path)
+        restored = RepositoryPersistence(self.repo)
+        self.assertEqual(
+            await restored.get_user_data(), {5: {"survey_step": 2, "answers": {"age": "20"}}}
+        )
+        self.assertEqual(await restored.get_conversations("survey"), {(5, 5): 2})
+
+    async def test_batch_is_written_in_one_transaction(self):
+        """Пачка обновлений от PTB записывается одним вызовом save_persistence"""
+        persistence = RepositoryPersistence(self.repo)
+        calls = []
+        original = self.repo.save_persistence
+
+        async def counting(users, states):
+            calls.append((dict(users), dict(states)))
+            await original(users, states)
+
+        self.repo.save_persistence = counting
+        await asyncio.gather(
+            *(persistence.update_user_data(user_id, {"survey_step": 1}) for user_id in range(50)),
+            persistence.update_conversation("survey", (1, 1), 1),
+            persistence.update_user_data(7, {"survey_step": 3}),
+        )
+        await persistence.flush()
+
+        self.assertEqual(len(calls), 1)
+        self.assertEqual(len(calls[0][0]), 50)
+        self.assertEqual(calls[0][0][7], {"survey_step": 3})
+        self.assertEqual(calls[0][1], {("survey", (1, 1)): 1})
+
+    async def test_ended_conversation_and_dropped_data_are_removed(self):
+        """Завершённый диалог и удалённые user_data стираются из базы"""
+        persistence = RepositoryPersistence(self.repo)
+        await persistence.update_user_data(5, {"survey_step": 1})
+        await persistence.update_conversation("survey", (5, 5), 1)
+        await persistence.flush()
+        await persistence.drop_user_data(5)
+        await persistence.update_conversation("survey", (5, 5), None)
+        await persistence.flush()
+
+        self.assertEqual(await self.repo.load_user_data(), {})
+        self.assertEqual(await self.repo.load_conversations("survey"), {})
+
+    async def test_abandoned_surveys_are_evicted(self):
+        """Состояние старше ttl не загружается и удаляется"""
+        await self.repo.save_persistence({5: {"survey_step": 4}}, {("survey", (5, 5)): 1})
+        self.repo.sync._conn.execute("UPDATE bot_user_data SET updated_at = ?", (time.time() - 7200,))
+        self.repo.sync._conn.execute("UPDATE bot_conversations SET updated_at = ?", (time.time() - 7200,))
+        self.repo.sync._conn.commit()
+
+        persistence = RepositoryPersistence(self.repo, ttl=3600)
+        self.assertEqual(await persistence.get_user_data(), {})
+        self.assertEqual(await persistence.get_conversations("survey"), {})
+
+
+    async def test_conversation_timeout_drops_user_data(self):
+        """Брошенный опрос по таймауту забывается и в памяти бота, и в хранилище"""
+        import bot
+
+        async def start(update, context):
+            context.user_data["survey_step"] = 1
+            return 1
+
+        persistence = RepositoryPersistence(self.repo, update_interval=3600)
+        application = (
+            Application.builder()
+            .token("123:abc")
+            .request(OfflineRequest())
+            .persistence(persistence)
+            .build()
+        )
+        application.add_handler(
+            ConversationHandler(
+                entry_points=[CommandHandler("start", start)],
+                states={1: [], ConversationHandler.TIMEOUT: [TypeHandler(Update, bot.survey_timeout)]},
+                fallbacks=[],
+                conversation_timeout=0.1,
+                name="survey",
+                persistent=True,
+            )
+        )
+        await application.initialize()
+        await application.start()
+        try:
+            await application.process_update(Update.de_json(START_UPDATE, application.bot))
+            await application.update_persistence()
+            await persistence.flush()
+            self.assertEqual(await self.repo.load_conversations("survey"), {(5, 5): 1})
+
+            await asyncio.sleep(0.3)
+            await application.update_persistence()
+            await persistence.flush()
+        finally:
+            await application.stop()
+            await application.shutdown()
+
+        self.assertNotIn(5, application.user_data)
+        self.assertEqual(await self.repo.load_user_data(), {})
+        self.assertEqual(await self.repo.load_conversations("survey"), {})
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,157 @@
+import asyncio
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import unittest
+from pathlib import Path
+
+# Добавляем путь к основному коду
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+sys.path.insert(0, ROOT)
+
+from db import AsyncApplicationRepository
+from resync import resync
+from yonote_client import CircuitOpenError
+
+
+class TestResync(unittest.IsolatedAsyncioTestCase):
+    """Тесты повторной выгрузки невыгруженных заявок"""
+
+    async def asyncSetUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.state = Path(self.tmpdir.name) / 'resync_state.json'
+        self.repo = AsyncApplicationRepository.open(Path(':memory:'))
+        self.ids = []
+        for user_id in range(1, 8):
+            self.ids.append(
+                await self.repo.save_application(user_id, user_id, None, None, {"job": "Видер"})
+            )
+        # заявки «застряли»: outbox-записи ушли в dead-letter
+        for entry in await self.repo.list_outbox():
+            await self.repo.dead_letter_outbox(entry['id'], "Yonote недоступен")
+        self.published = []
+
+    async def asyncTearDown(self):
+        await self.repo.close()
+        self.tmpdir.cleanup()
+
+    async def publish(self, row):
+        self.published.append(row['id'])
+        await asyncio.sleep(0)
+        return {"id": f"doc-{row['id']}", "url": "http://yonote/doc"}
+
+    async def _unsynced(self):
+        return [row['id'] async for row in self.repo.iter_unsynced(include_queued=True, chunk_size=2)]
+
+    async def test_all_unsynced_are_published_and_marked(self):
+        """Все невыгруженные заявки выгружаются и помечаются, файл прогресса удаляется"""
+        stats = await resync(
+            self.repo, self.publish, batch_size=3, rate=1000, state_path=self.state
+        )
+        self.assertEqual(stats.synced, 7)
+        self.assertEqual(sorted(self.published), self.ids)
+        self.assertEqual(await self._unsynced(), [])
+        self.assertEqual(await self.repo.list_outbox(), [])
+        self.assertFalse(self.state.exists())
+
+    async def test_dry_run_changes_nothing(self):
+        """--dry-run ничего не выгружает и не меняет в базе"""
+        stats = await resync(self.repo, self.publish, dry_run=True, state_path=self.state)
+        self.assertEqual(stats.seen, 7)
+        self.assertEqual(self.published, [])
+        self.assertEqual(await self._unsynced(), self.ids)
+
+    async def test_queued_applications_are_skipped(self):
+        """Заявки, которые ещё ждут outbox-воркер, по умолчанию не трогаются"""
+        queued = await self.repo.save_application(99, 99, None, None, {})
+        await resync(self.repo, self.publish, rate=1000)
+        self.assertNotIn(queued, self.published)
+        self.assertEqual(await self._unsynced(), [queued])
+
+    async def test_since_filter(self):
+        """--since отбирает заявки по дате подачи"""
+        self.repo.sync._conn.execute(
+            "UPDATE applications SET created_at = '2023-01-01 00:00:00' WHERE id <= ?", (self.ids[3],)
+        )
+        self.repo.sync._conn.commit()
+        await resync(self.repo, self.publish, since="2024-01-01", rate=1000)
+        self.assertEqual(sorted(self.published), self.ids[4:])
+
+    async def test_interrupted_run_resumes(self):
+        """После отказа Yonote прогресс сохраняется, и следующий запуск продолжает с него"""
+        calls = 0
+
+        async def flaky(row):
+            nonlocal calls
+            calls += 1
+            if calls > 4:
+                raise CircuitOpenError(30)
+            return await self.publish(row)
+
+        stats = await resync(
+            self.repo, flaky, batch_size=2, concurrency=1, rate=1000, state_path=self.state
+        )
+        self.assertTrue(stats.interrupted)
+        self.assertEqual(json.loads(self.state.read_text())['last_id'], self.ids[3])
+
+        self.published.clear()
+        stats = await resync(self.repo, self.publish, rate=1000, state_path=self.state)
+        self.assertEqual(sorted(self.published), self.ids[4:])
+        self.assertEqual(await self._unsynced(), [])
+
+    async def test_failed_applications_are_retried_after_resume(self):
+        """Прогресс не уходит дальше заявки с ошибкой, продолженный прогон её повторяет"""
+        calls = 0
+
+        async def flaky(row):
+            nonlocal calls
+            calls += 1
+            if row['id'] == self.ids[1]:
+                raise RuntimeError("500 Internal Server Error")
+            if calls > 4:
+                raise CircuitOpenError(30)
+            return await self.publish(row)
+
+        stats = await resync(
+            self.repo, flaky, batch_size=2, concurrency=1, rate=1000, state_path=self.state
+        )
+        self.assertTrue(stats.interrupted)
+        self.assertEqual(stats.failed, 1)
+        self.assertEqual(json.loads(self.state.read_text())['last_id'], self.ids[0])
+
+        self.published.clear()
+        stats = await resync(self.repo, self.publish, rate=1000, state_path=self.state)
+        self.assertEqual(sorted(self.published), [self.ids[1], *self.ids[4:]])
+        self.assertEqual(await self._unsynced(), [])
+
+    async def test_rate_limit(self):
+        """Темп выгрузки не превышает rate документов в секунду"""
+        loop = asyncio.get_running_loop()
+        started = loop.time()
+        await resync(self.repo, self.publish, rate=50, concurrency=7)
+        # первый токен выдаётся сразу, остальные шесть — по одному в 1/50 с
+        self.assertGreaterEqual(loop.time() - started, 6 / 50 * 0.9)
+
+
+class TestResyncSettings(unittest.TestCase):
+    """Настройки resync читаются при запуске, а не при импорте"""
+
+    def test_settings_are_lazy(self):
+        code = (
+            "import config, resync\n"
+            "assert 'settings' not in vars(config) and config.get_settings.cache_info().currsize == 0\n"
+            "args = resync.parse_args([])\n"
+            "print(args.concurrency, args.state_file)\n"
+        )
+        env = dict(os.environ, OUTBOX_CONCURRENCY='7', DATABASE_PATH=os.path.join('db', 'bot.db'))
+        result = subprocess.run(
+            [sys.executable, '-c', code], cwd=ROOT, env=env, capture_output=True, text=True, timeout=60
+        )
+        self.assertEqual(result.returncode, 0, result.stderr)
+        self.assertEqual(result.stdout.split(), ['7', os.path.join('db', 'resync_state.json')])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,398 @@
+import os
+import sys
+import time
+import unittest
+from pathlib import Path
+
+# Добавляем путь к основному коду
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from db import AsyncApplicationRepository
+from db_memory import MemoryApplicationRepository
+from db_postgres import PostgresApplicationRepository
+from storage import ROW_FIELDS, age_years, search_snippet, search_terms, search_tokens
+
+TEST_DATABASE_URL = os.environ.get('TEST_DATABASE_URL')
+OLD = '2020-01-01 00:00:00'
+
+
+class StorageContract:
+    """Общий контракт хранилища: одни и те же проверки для всех движков."""
+
+    async def make_repo(self):
+        raise NotImplementedError
+
+    async def retime(self, app_id, created_at, updated_at=None):
+        """Переставляет время заявки (горячей или архивной) вместе с временем решения."""
+        raise NotImplementedError
+
+    async def drop_outbox(self, app_id):
+        """Убирает запись outbox, как у заявок, поданных до появления outbox."""
+        raise NotImplementedError
+
+    async def asyncSetUp(self):
+        self.repo = await self.make_repo()
+
+    async def asyncTearDown(self):
+        await self.repo.close()
+
+    async def save(self, user_id, name='Анна', job='Вокалист', age='20', goals='петь', chat_id=None):
+        answers = {'full_name': name, 'age': age, 'job': job, 'goals': goals}
+        return await self.repo.save_application(
+            user_id, chat_id or user_id, f'user{user_id}', name, answers
+        )
+
+    async def test_save_and_get(self):
+        """Сохранённая заявка читается по id и попадает в outbox"""
+        app_id = await self.save(1)
+        row = await self.repo.get_by_id(app_id)
+        self.assertEqual(row['user_id'], 1)
+        self.assertEqual(row['status'], 'pending')
+        self.assertEqual(row['synced_to_yonote'], 0)
+        self.assertRegex(row['created_at'], r'^\d{4}-\d\d-\d\d \d\d:\d\d:\d\d$')
+        self.assertIsNone(await self.repo.get_by_id(app_id + 100))
+        self.assertEqual([o['application_id'] for o in await self.repo.list_outbox()], [app_id])
+
+    async def test_list_by_user_newest_first(self):
+        """Заявки пользователя от новых к старым, при равном времени — по id"""
+        ids = [await self.save(1) for _ in range(3)]
+        await self.save(2)
+        rows = await self.repo.list_by_user(1)
+        self.assertEqual([row['id'] for row in rows], ids[::-1])
+        rows = await self.repo.list_by_user(1, limit=2)
+        self.assertEqual([row['id'] for row in rows], ids[:0:-1])
+        self.assertEqual((await self.repo.get_last_for_user(1))['id'], ids[-1])
+
+    async def test_list_applications_filters(self):
+        """Выгрузка кусками по id с фильтрами по статусу, должности и дате"""
+        first = await self.save(1, job='Вокалист')
+        second = await self.save(2, job='Художник')
+        third = await self.save(3, job='Вокалист')
+        await self.retime(first, '2024-05-01 10:00:00')
+        await self.repo.update_status(third, 'approved')
+        rows = await self.repo.list_applications(limit=2)
+        self.assertEqual([row['id'] for row in rows], [first, second])
+        rows = await self.repo.list_applications(after_id=second)
+        self.assertEqual([row['id'] for row in rows], [third])
+        rows = await self.repo.list_applications(job='Вокалист', status='pending')
+        self.assertEqual([row['id'] for row in rows], [first])
+        rows = await self.repo.list_applications(since='2024-05-01', until='2024-05-02')
+        self.assertEqual([row['id'] for row in rows], [first])
+        streamed = [row['id'] async for row in self.repo.iter_applications(chunk_size=2)]
+        self.assertEqual(streamed, [first, second, third])
+
+    async def test_pending_pages(self):
+        """Keyset-страницы очереди вперёд и назад с фильтрами"""
+        ids = [await self.save(index, age=str(18 + index)) for index in range(5)]
+        for index, app_id in enumerate(ids):
+            await self.retime(app_id, f'2024-05-0{1 + index // 2} 10:00:00')
+        page = await self.repo.list_pending(2)
+        self.assertEqual([row['id'] for row in page], ids[:2])
+        cursor = (page[-1]['created_at'], page[-1]['id'])
+        page = await self.repo.list_pending(2, after=cursor)
+        self.assertEqual([row['id'] for row in page], ids[2:4])
+        cursor = (page[0]['created_at'], page[0]['id'])
+        page = await self.repo.list_pending(2, before=cursor)
+        self.assertEqual([row['id'] for row in page], ids[:2])
+        page = await self.repo.list_pending(10, min_age=20, max_age=21)
+        self.assertEqual([row['id'] for row in page], ids[2:4])
+
+    async def test_pending_age_and_job_filters(self):
+        """Возраст без ведущего числа считается нулём, фильтр по должности точный"""
+        text_age = await self.save(1, age='семнадцать', job='Художник')
+        adult = await self.save(2, age=' 25 лет')
+        self.assertEqual([row['id'] for row in await self.repo.list_pending(max_age=17)], [text_age])
+        self.assertEqual([row['id'] for row in await self.repo.list_pending(min_age=18)], [adult])
+        self.assertEqual([row['id'] for row in await self.repo.list_pending(job='Художник')], [text_age])
+
+    async def test_answer_columns(self):
+        """Ответы анкеты доступны колонками строки, в том числе в архиве и outbox"""
+        app_id = await self.repo.save_application(
+            1, 1, 'star', 'Star', {'age': ' 19 лет', 'job': 'Видер', 'portfolio': 'http://x'}
+        )
+        row = await self.repo.get_by_id(app_id)
+        values = {field: row[field] for field in ROW_FIELDS}
+        self.assertEqual(
+            [values[field] for field in ('age', 'job', 'experience', 'portfolio', 'goals', 'age_years')],
+            [' 19 лет', 'Видер', None, 'http://x', None, 19],
+        )
+        self.assertEqual((await self.repo.claim_outbox(10))[0]['job'], 'Видер')
+        await self.repo.update_status(app_id, 'approved')
+        await self.repo.mark_synced(app_id)
+        await self.retime(app_id, OLD)
+        await self.repo.archive_decided('2021-01-01 00:00:00')
+        archived = await self.repo.list_by_user(1, include_archive=True)
+        self.assertEqual((archived[0]['job'], archived[0]['age_years']), ('Видер', 19))
+
+    async def test_history(self):
+        """Очередь и карточка заявки приходят с последними заявками автора"""
+        old = await self.save(1)
+        await self.repo.update_status(old, 'declined')
+        middle = await self.save(1)
+        await self.repo.update_status(middle, 'declined')
+        newest = await self.save(1)
+        other = await self.save(2)
+        entries = await self.repo.list_pending_with_history(history_limit=2)
+        self.assertEqual([row['id'] for row, _ in entries], [newest, other])
+        self.assertEqual([row['id'] for row in entries[0][1]], [newest, middle])
+        self.assertEqual([row['id'] for row in entries[1][1]], [other])
+        row, history = await self.repo.get_with_history(middle, history_limit=5)
+        self.assertEqual(row['id'], middle)
+        self.assertEqual([item['id'] for item in history], [newest, middle, old])
+        self.assertIsNone(await self.repo.get_with_history(newest + 100))
+
+    async def test_transition_and_bulk(self):
+        """Переход статуса атомарен, массовое решение трогает только pending"""
+        first = await self.save(1, job='Вокалист')
+        second = await self.save(2, job='Вокалист')
+        third = await self.save(3, job='Художник')
+        self.assertEqual(await self.repo.update_status(first, 'pending', 'ok'), 1)
+        self.assertIsNone(await self.repo.update_status(first + 100, 'approved'))
+        row = await self.repo.transition_status(first, 'approved')
+        self.assertEqual(row['status'], 'approved')
+        self.assertIsNone(await self.repo.transition_status(first, 'declined'))
+        rows = await self.repo.bulk_update_status('declined', job='Вокалист')
+        self.assertEqual([(row['id'], row['status']) for row in rows], [(second, 'pending')])
+        self.assertEqual((await self.repo.get_by_id(second))['status'], 'declined')
+        self.assertEqual(await self.repo.bulk_update_status('approved', ids=[]), [])
+        rows = await self.repo.bulk_update_status('approved', ids=[first, third])
+        self.assertEqual([row['id'] for row in rows], [third])
+
+    async def test_search(self):
+        """Совпадение в имени выше совпадения в ответах, префиксы и AND по словам"""
+        in_answers = await self.save(1, name='Иван', goals='давний фанат star_123 и вокала')
+        in_name = await self.save(2, name='Star_123', goals='петь')
+        rows = await self.repo.search('star')
+        self.assertEqual([row['id'] for row in rows], [in_name, in_answers])
+        self.assertIn('[star_123]', rows[1]['snippet'])
+        rows = await self.repo.search('иван вока')
+        self.assertEqual([row['id'] for row in rows], [in_answers])
+        self.assertEqual([row['id'] for row in await self.repo.search('star', limit=1, offset=1)], [in_answers])
+        self.assertEqual(await self.repo.search('- :'), [])
+        self.assertEqual(await self.repo.search('нетакогослова'), [])
+
+    async def test_stats(self):
+        """Счётчики по статусам, должностям и дням"""
+        first = await self.save(1, job='Вокалист')
+        await self.save(2, job='Вокалист')
+        await self.save(3, job='Художник')
+        await self.repo.update_status(first, 'approved')
+        stats = await self.repo.get_stats()
+        self.assertEqual(stats['by_status'], {'pending': 2, 'approved': 1})
+        self.assertEqual(stats['by_job']['Вокалист'], {'pending': 1, 'approved': 1})
+        self.assertEqual([count for _, count in stats['daily']], [3])
+        await self.retime(first, OLD)
+        stats = await self.repo.get_stats()
+        self.assertEqual([count for _, count in stats['daily']], [2])
+        self.assertEqual(sum(stats['by_status'].values()), 3)
+
+    async def test_archive(self):
+        """Архивируются только старые рассмотренные и выгруженные заявки"""
+        archived = await self.save(1, name='Архивный')
+        await self.repo.update_status(archived, 'approved')
+        await self.repo.mark_synced(archived)
+        queued = await self.save(2)
+        await self.repo.update_status(queued, 'declined')
+        pending = await self.save(3)
+        await self.repo.mark_synced(pending)
+        legacy = await self.save(4)
+        await self.repo.update_status(legacy, 'approved')
+        await self.drop_outbox(legacy)
+        for app_id in (archived, queued, pending, legacy):
+            await self.retime(app_id, OLD)
+        self.assertEqual(await self.repo.archive_decided('2021-01-01 00:00:00', batch_size=1), 1)
+        # не выгруженная заявка без outbox остаётся в горячей таблице для resync
+        self.assertEqual([row['id'] for row in await self.repo.list_unsynced()], [legacy])
+        self.assertIsNone(await self.repo.get_by_id(archived))
+        self.assertEqual(await self.repo.list_by_user(1), [])
+        self.assertEqual([row['id'] for row in await self.repo.list_by_user(1, include_archive=True)], [archived])
+        self.assertEqual((await self.repo.get_last_for_user(1))['id'], archived)
+        self.assertEqual([row['id'] for row in await self.repo.search('архивный')], [archived])
+        self.assertEqual((await self.repo.get_stats())['by_status'], {'approved': 2, 'declined': 1, 'pending': 1})
+        self.assertEqual([row['id'] for row in await self.repo.list_all()], [queued, pending, legacy])
+        newer = await self.save(1)
+        self.assertEqual((await self.repo.get_last_for_user(1))['id'], newer)
+        self.assertGreaterEqual(await self.repo.vacuum(), 0)
+
+    async def test_archive_by_decision_time(self):
+        """Архивация считает возраст от решения, а не от выгрузки в Yonote"""
+        decided_long_ago = await self.save(1)
+        await self.repo.update_status(decided_long_ago, 'approved')
+        await self.retime(decided_long_ago, OLD)
+        # выгрузка сдвигает updated_at, но не время решения
+        await self.repo.mark_synced(decided_long_ago)
+        decided_now = await self.save(2)
+        await self.retime(decided_now, OLD)
+        await self.repo.update_status(decided_now, 'declined')
+        await self.repo.mark_synced(decided_now)
+
+        self.assertEqual(await self.repo.archive_decided('2021-01-01 00:00:00'), 1)
+        self.assertIsNone(await self.repo.get_by_id(decided_long_ago))
+        self.assertIsNotNone(await self.repo.get_by_id(decided_now))
+
+    async def test_archive_in_export_and_history(self):
+        """Выгрузка и история автора с include_archive видят архивные заявки"""
+        archived = await self.save(1, job='Видер')
+        await self.repo.update_status(archived, 'approved')
+        await self.repo.mark_synced(archived)
+        await self.retime(archived, OLD)
+        hot = await self.save(2, job='Видер')
+        await self.repo.archive_decided('2021-01-01 00:00:00')
+        newer = await self.save(1)
+
+        self.assertEqual([row['id'] for row in await self.repo.list_applications()], [hot, newer])
+        rows = await self.repo.list_applications(include_archive=True)
+        self.assertEqual([row['id'] for row in rows], [archived, hot, newer])
+        rows = await self.repo.list_applications(include_archive=True, job='Видер', limit=1)
+        self.assertEqual([row['id'] for row in rows], [archived])
+        rows = await self.repo.list_applications(include_archive=True, after_id=archived, status='approved')
+        self.assertEqual(rows, [])
+        streamed = [row['id'] async for row in self.repo.iter_applications(chunk_size=1, include_archive=True)]
+        self.assertEqual(streamed, [archived, hot, newer])
+
+        entries = await self.repo.list_pending_with_history(10, include_archive=True, job='Вокалист')
+        self.assertEqual([(row['id'], [item['id'] for item in history]) for row, history in entries],
+                         [(newer, [newer, archived])])
+        entries = await self.repo.list_pending_with_history(10, job='Вокалист')
+        self.assertEqual([item['id'] for item in entries[0][1]], [newer])
+        row, history = await self.repo.get_with_history(newer, include_archive=True)
+        self.assertEqual((row['id'], [item['id'] for item in history]), (newer, [newer, archived]))
+        self.assertEqual(history[1]['status'], 'approved')
+        row, history = await self.repo.get_with_history(newer, history_limit=1, include_archive=True)
+        self.assertEqual([item['id'] for item in history], [newer])
+
+    async def test_outbox(self):
+        """Записи outbox разбираются по порядку, с арендой, повтором и dead letter"""
+        ids = [await self.save(index) for index in range(3)]
+        self.assertEqual(await self.repo.list_unsynced(), [])
+        self.assertEqual([row['id'] for row in await self.repo.list_unsynced(include_queued=True)], ids)
+        claimed = await self.repo.claim_outbox(2)
+        self.assertEqual([row['id'] for row in claimed], ids[:2])
+        self.assertEqual([row['attempts'] for row in claimed], [0, 0])
+        self.assertEqual([row['id'] for row in await self.repo.claim_outbox(5)], ids[2:])
+        self.assertEqual(await self.repo.claim_outbox(5), [])
+        await self.repo.retry_outbox(claimed[0]['outbox_id'], 0, 'timeout')
+        await self.repo.defer_outbox(claimed[1]['outbox_id'], 3600)
+        retried = await self.repo.claim_outbox(5)
+        self.assertEqual([(row['id'], row['attempts']) for row in retried], [(ids[0], 1)])
+        await self.repo.dead_letter_outbox(retried[0]['outbox_id'], 'bad request')
+        self.assertEqual([row['application_id'] for row in await self.repo.list_outbox('dead')], [ids[0]])
+        self.assertEqual([row['id'] for row in await self.repo.list_unsynced()], [ids[0]])
+        await self.repo.mark_synced_many(ids[:2])
+        self.assertEqual([row['application_id'] for row in await self.repo.list_outbox()], [ids[2]])
+        self.assertEqual((await self.repo.get_by_id(ids[0]))['synced_to_yonote'], 1)
+        rows = [row['id'] async for row in self.repo.iter_unsynced(include_queued=True, chunk_size=1)]
+        self.assertEqual(rows, [ids[2]])
+
+    async def test_undeliverable(self):
+        """Недоступный чат снимается с учёта, когда пользователь снова подаёт заявку"""
+        await self.repo.mark_undeliverable(10, 'blocked')
+        await self.repo.mark_undeliverable(10, 'blocked again')
+        await self.repo.mark_undeliverable(11, 'deactivated')
+        self.assertEqual(sorted(await self.repo.list_undeliverable()), [10, 11])
+        await self.save(1, chat_id=10)
+        self.assertEqual(await self.repo.list_undeliverable(), [11])
+
+    async def test_persistence(self):
+        """Состояние диалогов сохраняется, удаляется и вытесняется по возрасту"""
+        await self.repo.save_persistence(
+            {1: {'answers': {'age': '20'}}, 2: {'step': 1}},
+            {('survey', (1, 1)): 2, ('survey', (2, 2)): 1},
+        )
+        await self.repo.save_persistence({2: None}, {('survey', (2, 2)): None})
+        self.assertEqual(await self.repo.load_user_data(), {1: {'answers': {'age': '20'}}})
+        self.assertEqual(await self.repo.load_conversations('survey'), {(1, 1): 2})
+        self.assertEqual(await self.repo.load_conversations('other'), {})
+        self.assertEqual(await self.repo.evict_persistence(time.time() - 3600), 0)
+        self.assertEqual(await self.repo.evict_persistence(time.time() + 1), 2)
+        self.assertEqual(await self.repo.load_user_data(), {})
+
+
+class TestSQLiteStorage(StorageContract, unittest.IsolatedAsyncioTestCase):
+    async def make_repo(self):
+        return AsyncApplicationRepository.open(Path(':memory:'))
+
+    async def retime(self, app_id, created_at, updated_at=None):
+        conn = self.repo.sync._conn
+        for table in ('applications', 'applications_archive'):
+            conn.execute(
+                f'UPDATE {table} SET created_at = ?, updated_at = ?, '
+                'decided_at = CASE WHEN decided_at IS NOT NULL THEN ? END WHERE id = ?',
+                (created_at, updated_at or created_at, updated_at or created_at, app_id),
+            )
+        conn.commit()
+        self.repo.status_cache.clear()
+
+    async def drop_outbox(self, app_id):
+        conn = self.repo.sync._conn
+        conn.execute('DELETE FROM yonote_outbox WHERE application_id = ?', (app_id,))
+        conn.commit()
+
+
+class TestMemoryStorage(StorageContract, unittest.IsolatedAsyncioTestCase):
+    async def make_repo(self):
+        return MemoryApplicationRepository()
+
+    async def retime(self, app_id, created_at, updated_at=None):
+        self.repo._retime(app_id, created_at, updated_at)
+
+    async def drop_outbox(self, app_id):
+        del self.repo._outbox[self.repo._outbox_by_app.pop(app_id)]
+
+
+@unittest.skipUnless(TEST_DATABASE_URL, 'TEST_DATABASE_URL не задан')
+class TestPostgresStorage(StorageContract, unittest.IsolatedAsyncioTestCase):
+    async def make_repo(self):
+        import asyncpg
+
+        conn = await asyncpg.connect(TEST_DATABASE_URL)
+        try:
+            await conn.execute(
+                'DROP TABLE IF EXISTS yonote_outbox, applications, undeliverable_chats, '
+                'bot_user_data, bot_conversations, application_stats CASCADE'
+            )
+        finally:
+            await conn.close()
+        return PostgresApplicationRepository(TEST_DATABASE_URL, max_size=2)
+
+    async def retime(self, app_id, created_at, updated_at=None):
+        await self.repo._execute(
+            'UPDATE applications SET created_at = $1, updated_at = $2, '
+            'decided_at = CASE WHEN decided_at IS NOT NULL THEN $2 END WHERE id = $3',
+            created_at,
+            updated_at or created_at,
+            app_id,
+        )
+
+    async def drop_outbox(self, app_id):
+        await self.repo._execute('DELETE FROM yonote_outbox WHERE application_id = $1', app_id)
+
+
+class TestAnswerHelpers(unittest.TestCase):
+    def test_age_years(self):
+        """Возраст как CAST(... AS INTEGER) в SQLite: ведущее целое, иначе 0"""
+        self.assertEqual(
+            [age_years(value) for value in (' 25 лет', '+7', 'семнадцать', None, '9' * 30)],
+            [25, 7, 0, None, 2 ** 63 - 1],
+        )
+
+
+class TestSearchHelpers(unittest.TestCase):
+    def test_tokens(self):
+        """Токены как у unicode61: нижний регистр, без диакритики, '_' внутри слова"""
+        self.assertEqual(search_tokens('Star_123 t.me/Nick Café'), ['star_123', 't', 'me', 'nick', 'cafe'])
+        self.assertEqual(search_terms('ник - : t.me'), ['ник', 't.me'])
+
+    def test_snippet(self):
+        """Фрагмент вокруг первого совпадения, найденные слова в скобках"""
+        row = {
+            'full_name': 'Иван',
+            'username': None,
+            'answers_json': '{"goals": "' + ' '.join(f'w{i}' for i in range(20)) + ' вокал"}',
+        }
+        self.assertEqual(search_snippet(row, 'вок'), '…w11 w12 w13 w14 w15 w16 w17 w18 w19 [вокал]')
+        self.assertEqual(search_snippet(row, 'иван'), '[Иван]')
+
+
+if __name__ == '__main__':
+    unittest.main()
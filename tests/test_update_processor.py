@@ -0,0 +1,149 @@
+import asyncio
+import os
+import sys
+import unittest
+
+from telegram import Update
+from telegram.ext import Application, TypeHandler
+
+# Добавляем путь к основному коду
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from loadtest import OfflineRequest
+from update_processor import PerUserUpdateProcessor, update_key
+
+
+def make_update(update_id, user_id, text='…'):
+    message = {
+        'message_id': update_id,
+        'date': 0,
+        'chat': {'id': user_id, 'type': 'private'},
+        'from': {'id': user_id, 'is_bot': False, 'first_name': 'User'},
+        'text': text,
+    }
+    return Update.de_json({'update_id': update_id, 'message': message}, None)
+
+
+class TestPerUserUpdateProcessor(unittest.IsolatedAsyncioTestCase):
+    """Тесты параллельной обработки с порядком внутри пользователя"""
+
+    async def asyncSetUp(self):
+        self.events = []
+        self.gates = {}
+
+    async def _handle(self, update_id):
+        self.events.append(('start', update_id))
+        gate = self.gates.get(update_id)
+        if gate is not None:
+            await gate.wait()
+        self.events.append(('end', update_id))
+
+    def _submit(self, processor, update_id, user_id):
+        return asyncio.create_task(
+            processor.process_update(make_update(update_id, user_id), self._handle(update_id))
+        )
+
+    async def test_same_user_is_sequential(self):
+        """Обновления одного пользователя не пересекаются, другие пользователи не ждут"""
+        processor = PerUserUpdateProcessor(8)
+        self.gates[1] = asyncio.Event()
+        tasks = [
+            self._submit(processor, 1, 10),
+            self._submit(processor, 2, 10),
+            self._submit(processor, 3, 20),
+        ]
+        await asyncio.sleep(0)
+        await asyncio.sleep(0)
+        self.assertEqual(self.events, [('start', 1), ('start', 3), ('end', 3)])
+        self.assertEqual(processor.waiting(), 1)
+        self.gates[1].set()
+        await asyncio.gather(*tasks)
+        self.assertEqual(self.events[3:], [('end', 1), ('start', 2), ('end', 2)])
+        self.assertEqual(processor.waiting(), 0)
+
+    async def test_user_holds_one_slot(self):
+        """Очередь одного пользователя не занимает слоты остальных"""
+        processor = PerUserUpdateProcessor(2)
+        self.gates[1] = asyncio.Event()
+        tasks = [self._submit(processor, update_id, 10) for update_id in range(1, 6)]
+        tasks.append(self._submit(processor, 6, 20))
+        for _ in range(5):
+            await asyncio.sleep(0)
+        self.assertIn(('end', 6), self.events)
+        self.assertEqual(processor.current_concurrent_updates, 1)
+        self.gates[1].set()
+        await asyncio.gather(*tasks)
+        order = [update_id for event, update_id in self.events if event == 'start' and update_id != 6]
+        self.assertEqual(order, [1, 2, 3, 4, 5])
+
+    async def test_failure_does_not_block_queue(self):
+        """Сбой одного обновления не останавливает очередь пользователя"""
+        processor = PerUserUpdateProcessor(4)
+
+        async def fail():
+            raise RuntimeError('сбой')
+
+        with self.assertLogs('update_processor', 'ERROR'):
+            await asyncio.gather(
+                processor.process_update(make_update(1, 10), fail()),
+                processor.process_update(make_update(2, 10), self._handle(2)),
+            )
+        self.assertEqual(self.events, [('start', 2), ('end', 2)])
+
+    def test_update_key(self):
+        """Ключ — пользователь, для прочих объектов порядок не нужен"""
+        self.assertEqual(update_key(make_update(1, 42)), 42)
+        self.assertIsNone(update_key('не обновление'))
+
+
+class TestApplicationIntegration(unittest.IsolatedAsyncioTestCase):
+    """Приложение PTB с процессором: порядок по пользователям, параллельность между ними"""
+
+    async def test_order_per_user(self):
+        application = (
+            Application.builder()
+            .token('123456:test')
+            .request(OfflineRequest())
+            .get_updates_request(OfflineRequest())
+            .concurrent_updates(PerUserUpdateProcessor(16))
+            .build()
+        )
+        seen = {}
+        active = set()
+        overlap = []
+        done = asyncio.Event()
+
+        async def record(update, context):
+            user_id = update.effective_user.id
+            overlap.append(user_id in active)
+            active.add(user_id)
+            await asyncio.sleep(0.01)
+            active.discard(user_id)
+            seen.setdefault(user_id, []).append(int(update.message.text))
+            if sum(map(len, seen.values())) == 20:
+                done.set()
+
+        application.add_handler(TypeHandler(Update, record))
+        await application.initialize()
+        await application.start()
+        try:
+            loop = asyncio.get_running_loop()
+            started = loop.time()
+            update_id = 0
+            for number in range(5):
+                for user_id in (1, 2, 3, 4):
+                    update_id += 1
+                    await application.update_queue.put(make_update(update_id, user_id, str(number)))
+            await asyncio.wait_for(done.wait(), 5)
+            elapsed = loop.time() - started
+        finally:
+            await application.stop()
+            await application.shutdown()
+        self.assertEqual(seen, {user_id: [0, 1, 2, 3, 4] for user_id in (1, 2, 3, 4)})
+        self.assertFalse(any(overlap))
+        # 20 обновлений по 10 мс: последовательно — 0.2 с, по пользователям параллельно — около 0.05 с
+        self.assertLess(elapsed, 0.15)
+
+
+if __name__ == '__main__':
+    unittest.main()
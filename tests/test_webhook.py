@@ -0,0 +1,155 @@
+import asyncio
+import json
+import os
+import sys
+import unittest
+from unittest.mock import AsyncMock, MagicMock, patch
+
+from aiohttp.test_utils import TestClient, TestServer
+from telegram import Update
+from telegram.ext import Application, CallbackQueryHandler, CommandHandler
+from telegram.request import BaseRequest
+
+# Добавляем путь к основному коду
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from config import Settings
+from webhook import HEALTH_PATH, SECRET_HEADER, build_webhook_app, run_webhook
+
+SECRET = "test-secret"
+
+START_UPDATE = {
+    "update_id": 1,
+    "message": {
+        "message_id": 1,
+        "date": 0,
+        "chat": {"id": 5, "type": "private"},
+        "from": {"id": 5, "is_bot": False, "first_name": "User"},
+        "text": "/start",
+        "entities": [{"type": "bot_command", "offset": 0, "length": 6}],
+    },
+}
+CALLBACK_UPDATE = {
+    "update_id": 2,
+    "callback_query": {
+        "id": "42",
+        "from": {"id": 5, "is_bot": False, "first_name": "User"},
+        "chat_instance": "c",
+        "data": "job:Видер",
+    },
+}
+
+
+class OfflineRequest(BaseRequest):
+    """Отвечает на getMe без обращения к Telegram."""
+
+    async def initialize(self):
+        pass
+
+    async def shutdown(self):
+        pass
+
+    @property
+    def read_timeout(self):
+        return 1
+
+    async def do_request(self, url, method, request_data=None, **kwargs):
+        result = {"id": 1, "is_bot": True, "first_name": "bot", "username": "bot"}
+        return 200, json.dumps({"ok": True, "result": result}).encode()
+
+
+class TestWebhook(unittest.IsolatedAsyncioTestCase):
+    """Тесты приёма обновлений через webhook"""
+
+    async def asyncSetUp(self):
+        self.received = []
+        self.application = (
+            Application.builder()
+            .token("123:abc")
+            .request(OfflineRequest())
+            .get_updates_request(OfflineRequest())
+            .build()
+        )
+
+        async def record(update, context):
+            self.received.append(update.update_id)
+
+        self.application.add_handler(CommandHandler("start", record))
+        self.application.add_handler(CallbackQueryHandler(record))
+        await self.application.initialize()
+        await self.application.start()
+        app = build_webhook_app(self.application, path="/telegram", secret_token=SECRET)
+        self.client = TestClient(TestServer(app))
+        await self.client.start_server()
+
+    async def asyncTearDown(self):
+        await self.client.close()
+        await self.application.stop()
+        await self.application.shutdown()
+
+    async def _wait_for(self, count):
+        for _ in range(100):
+            if len(self.received) >= count:
+                return
+            await asyncio.sleep(0.01)
+
+    async def test_updates_are_dispatched(self):
+        """Записанные обновления доходят до обработчиков"""
+        for update in (START_UPDATE, CALLBACK_UPDATE):
+            response = await self.client.post(
+                "/telegram", json=update, headers={SECRET_HEADER: SECRET}
+            )
+            self.assertEqual(response.status, 200)
+        await self._wait_for(2)
+        self.assertEqual(sorted(self.received), [1, 2])
+
+    async def test_wrong_secret_is_rejected(self):
+        """Запрос без правильного секрета отклоняется"""
+        for headers in ({}, {SECRET_HEADER: "wrong"}):
+            response = await self.client.post("/telegram", json=START_UPDATE, headers=headers)
+            self.assertEqual(response.status, 403)
+        await asyncio.sleep(0.05)
+        self.assertEqual(self.received, [])
+
+    async def test_invalid_body(self):
+        """Некорректное тело запроса возвращает 400"""
+        response = await self.client.post(
+            "/telegram", data=b"not json", headers={SECRET_HEADER: SECRET}
+        )
+        self.assertEqual(response.status, 400)
+
+    async def test_health(self):
+        """Health-эндпоинт отвечает, пока приложение запущено"""
+        response = await self.client.get(HEALTH_PATH)
+        self.assertEqual(response.status, 200)
+        self.assertEqual((await response.json())["status"], "ok")
+
+
+class TestWebhookShutdown(unittest.IsolatedAsyncioTestCase):
+    """Остановка бота в режиме webhook"""
+
+    async def test_failed_start_still_closes_storage(self):
+        """Если post_init упал на полпути, post_shutdown всё равно закрывает хранилище"""
+        import bot
+
+        async def failing_init(application):
+            raise RuntimeError("Yonote недоступен")
+
+        application = (
+            Application.builder()
+            .token("123:abc")
+            .request(OfflineRequest())
+            .get_updates_request(OfflineRequest())
+            .post_init(failing_init)
+            .post_shutdown(bot.post_shutdown)
+            .build()
+        )
+        repo = MagicMock(close=AsyncMock())
+        with patch.object(bot, "repo", repo):
+            with self.assertRaises(RuntimeError):
+                await run_webhook(application, Settings(), [])
+        repo.close.assert_awaited_once()
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,225 @@
+import asyncio
+import json
+import os
+import sys
+import threading
+import unittest
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from prometheus_client import REGISTRY
+
+# Добавляем путь к основному коду
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from yonote_client import CircuitBreaker, CircuitOpenError, YonoteClient, YonoteError
+
+
+class StubYonoteServer:
+    """Локальный HTTP-сервер, отвечающий по заранее заданному сценарию."""
+
+    def __init__(self):
+        self.responses = []
+        self.requests = []
+        self.client_ports = set()
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def do_POST(self):
+                length = int(self.headers.get("Content-Length", 0))
+                stub.requests.append((self.path, json.loads(self.rfile.read(length))))
+                stub.client_ports.add(self.client_address[1])
+                status, headers, body = (
+                    stub.responses.pop(0) if stub.responses else (200, {}, None)
+                )
+                if body is None:
+                    body = {"ok": True, "data": {"id": "doc-1", "url": "http://yonote/doc-1"}}
+                payload = json.dumps(body).encode()
+                self.send_response(status)
+                for key, value in headers.items():
+                    self.send_header(key, value)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(payload)))
+                self.end_headers()
+                self.wfile.write(payload)
+
+            def log_message(self, *args):
+                pass
+
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.url = f"http://127.0.0.1:{self.server.server_address[1]}/api"
+        self.thread = threading.Thread(
+            target=self.server.serve_forever, kwargs={"poll_interval": 0.05}, daemon=True
+        )
+
+    def __enter__(self):
+        self.thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+class TestYonoteClient(unittest.IsolatedAsyncioTestCase):
+    """Тесты асинхронного клиента Yonote против локального stub-сервера"""
+
+    async def asyncSetUp(self):
+        self.stub = StubYonoteServer().__enter__()
+        self.clock = FakeClock()
+        self.client = YonoteClient(
+            self.stub.url,
+            "token",
+            "collection",
+            max_retries=2,
+            backoff_base=0,
+            breaker=CircuitBreaker(failure_threshold=2, reset_timeout=30, clock=self.clock),
+        )
+
+    async def asyncTearDown(self):
+        await self.client.aclose()
+        self.stub.__exit__(None, None, None)
+
+    async def _create(self):
+        return await self.client.create_document(
+            "Имя", "20", "Видер", "2 года", "http://x", "цели", "user", "Заявка"
+        )
+
+    async def test_create_document(self):
+        """Документ создаётся, payload содержит коллекцию и текст заявки"""
+        doc = await self._create()
+        self.assertEqual(doc["id"], "doc-1")
+        path, payload = self.stub.requests[0]
+        self.assertEqual(path, "/api/documents.create")
+        self.assertEqual(payload["collectionId"], "collection")
+        self.assertIn("Видер", payload["text"])
+
+    async def test_create_digest_document(self):
+        """Сводка — один запрос с разделом на каждую заявку"""
+        rows = [
+            {'id': 1, 'full_name': 'Имя', 'username': 'user', 'created_at': '2024-05-01 10:00:00',
+             'age': '20', 'job': 'Видер', 'experience': '2 года', 'portfolio': 'http://x', 'goals': 'цели'},
+            {'id': 2, 'full_name': None, 'username': None, 'created_at': '2024-05-01 10:05:00',
+             'age': None, 'job': 'Вокалист', 'experience': None, 'portfolio': None, 'goals': None},
+        ]
+        doc = await self.client.create_digest_document("Сводка", rows)
+        self.assertEqual(doc["id"], "doc-1")
+        self.assertEqual(len(self.stub.requests), 1)
+        text = self.stub.requests[0][1]["text"]
+        self.assertIn("Заявок в сводке: 2", text)
+        self.assertIn("## #1 Имя (@user)", text)
+        self.assertIn("## #2 — (—)", text)
+
+    async def test_connections_are_reused(self):
+        """Последовательные запросы идут через одно keep-alive соединение"""
+        for _ in range(3):
+            await self._create()
+        self.assertEqual(len(self.stub.requests), 3)
+        self.assertEqual(len(self.stub.client_ports), 1)
+
+    async def test_retries_on_5xx_and_429(self):
+        """503 и 429 с Retry-After повторяются"""
+        self.stub.responses = [
+            (503, {}, {"ok": False}),
+            (429, {"Retry-After": "0"}, {"ok": False}),
+        ]
+        doc = await self._create()
+        self.assertEqual(doc["id"], "doc-1")
+        self.assertEqual(len(self.stub.requests), 3)
+
+    async def test_client_error_is_not_retried(self):
+        """4xx не повторяется и не размыкает цепь"""
+        self.stub.responses = [(400, {}, {"ok": False, "error": "bad"})]
+        with self.assertRaises(YonoteError):
+            await self._create()
+        self.assertEqual(len(self.stub.requests), 1)
+        self.assertEqual(self.client.breaker.state, "closed")
+
+    async def test_circuit_breaker_fails_fast(self):
+        """После серии отказов запросы не отправляются до истечения reset_timeout"""
+        self.stub.responses = [(500, {}, {"ok": False})] * 6
+        for _ in range(2):
+            with self.assertRaises(YonoteError):
+                await self._create()
+        sent = len(self.stub.requests)
+        self.assertEqual(self.client.breaker.state, "open")
+
+        with self.assertRaises(CircuitOpenError):
+            await self._create()
+        self.assertEqual(len(self.stub.requests), sent)
+
+        self.clock.now += 31
+        self.stub.responses = []
+        doc = await self._create()
+        self.assertEqual(doc["id"], "doc-1")
+        self.assertEqual(self.client.breaker.state, "closed")
+
+    async def _open_and_wait(self):
+        self.stub.responses = [(500, {}, {"ok": False})] * 6
+        for _ in range(2):
+            with self.assertRaises(YonoteError):
+                await self._create()
+        self.clock.now += 31
+        self.assertEqual(self.client.breaker.state, "half_open")
+        self.stub.responses = []
+
+    async def test_malformed_probe_response_does_not_stick(self):
+        """Пробный запрос с ответом без id/url не оставляет цепь в пробном состоянии"""
+        await self._open_and_wait()
+        self.stub.responses = [(200, {}, {"ok": True, "data": {"id": "doc-1"}})]
+        with self.assertRaises(YonoteError):
+            await self._create()
+        doc = await self._create()
+        self.assertEqual(doc["id"], "doc-1")
+
+    async def test_cancelled_probe_releases_breaker(self):
+        """Отменённый пробный запрос освобождает место для следующей пробы"""
+        await self._open_and_wait()
+        self.stub.responses = [(503, {"Retry-After": "10"}, {"ok": False})]
+        task = asyncio.create_task(self._create())
+        while len(self.stub.requests) < 7:
+            await asyncio.sleep(0.01)
+        task.cancel()
+        with self.assertRaises(asyncio.CancelledError):
+            await task
+        self.assertEqual(self.client.breaker.state, "half_open")
+        doc = await self._create()
+        self.assertEqual(doc["id"], "doc-1")
+
+    async def test_outcomes_are_counted(self):
+        """Успехи, ошибки и быстрые отказы считаются в метриках"""
+        def count(outcome):
+            labels = {"method": "documents.create", "outcome": outcome}
+            return REGISTRY.get_sample_value("bot_yonote_requests_total", labels) or 0.0
+
+        before = {outcome: count(outcome) for outcome in ("success", "error", "circuit_open")}
+        await self._create()
+        self.stub.responses = [(500, {}, {"ok": False})] * 6
+        for _ in range(2):
+            with self.assertRaises(YonoteError):
+                await self._create()
+        with self.assertRaises(CircuitOpenError):
+            await self._create()
+
+        self.assertEqual(count("success"), before["success"] + 1)
+        self.assertEqual(count("error"), before["error"] + 2)
+        self.assertEqual(count("circuit_open"), before["circuit_open"] + 1)
+
+    async def test_missing_api_key(self):
+        """Без API-ключа запрос не отправляется"""
+        client = YonoteClient(self.stub.url, None, "collection")
+        self.assertIsNone(await client.create_document("a", "b", "c", "d", "e", "f", "g"))
+        self.assertEqual(self.stub.requests, [])
+
+
+if __name__ == '__main__':
+    unittest.main()
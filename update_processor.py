@@ -0,0 +1,98 @@
+"""Параллельная обработка обновлений с порядком внутри пользователя.
+
+По умолчанию PTB обрабатывает обновления по одному, и медленный обработчик
+(вызов Yonote, fsync базы) задерживает всех. :class:`PerUserUpdateProcessor`
+обрабатывает до ``max_concurrent_updates`` обновлений одновременно, но
+обновления одного пользователя (или чата, если пользователя нет) — строго
+по очереди и в порядке поступления, так что состояние ``ConversationHandler``
+и ``user_data`` не меняется из двух обработчиков сразу.
+
+Пользователь занимает не больше одного слота: обновление для занятого
+пользователя встаёт в его очередь и сразу освобождает слот, а очередь
+разбирает уже работающая задача этого пользователя. Поток сообщений от
+одного человека не забирает слоты у остальных. Задача PTB такого
+обновления завершается раньше, чем оно обработано, так что
+``update_queue.join()`` отложенных обновлений не ждёт; ``Application.stop()``
+их всё равно дожидается, потому что ждёт и задачи обработки.
+"""
+
+import asyncio
+import logging
+from collections import deque
+from typing import Any, Awaitable, Deque, Dict, Optional
+
+from telegram import Update
+from telegram.ext import BaseUpdateProcessor
+
+logger = logging.getLogger(__name__)
+
+
+def update_key(update: object) -> Optional[int]:
+    """Ключ очереди: id пользователя, иначе id чата; None — порядок не нужен.
+
+    В личном чате id чата совпадает с id пользователя, поэтому обновления
+    без отправителя попадают в ту же очередь.
+    """
+    if not isinstance(update, Update):
+        return None
+    if update.effective_user is not None:
+        return update.effective_user.id
+    if update.effective_chat is not None:
+        return update.effective_chat.id
+    return None
+
+
+class PerUserUpdateProcessor(BaseUpdateProcessor):
+    """Обработчик обновлений PTB: параллельно по пользователям, по порядку внутри.
+
+    Порядок поступления сохраняется, потому что PTB создаёт задачи
+    обновлений в порядке очереди, а семафор ``max_concurrent_updates``
+    пропускает ждущих по очереди.
+    """
+
+    __slots__ = ("_queues",)
+
+    def __init__(self, max_concurrent_updates: int) -> None:
+        super().__init__(max_concurrent_updates)
+        self._queues: Dict[int, Deque[Awaitable[Any]]] = {}
+
+    async def do_process_update(self, update: object, coroutine: Awaitable[Any]) -> None:
+        key = update_key(update)
+        if key is None:
+            await coroutine
+            return
+        queue = self._queues.get(key)
+        if queue is not None:
+            # пользователь уже обрабатывается — его задача выполнит и это обновление
+            queue.append(coroutine)
+            return
+        queue = self._queues[key] = deque()
+        try:
+            while True:
+                try:
+                    await coroutine
+                except Exception:
+                    # Application.process_update сам ловит ошибки обработчиков;
+                    # сюда доходят только сбои вне них, очередь из-за них не встаёт
+                    logger.exception("Ошибка при обработке обновления пользователя %s", key)
+                if not queue:
+                    break
+                coroutine = queue.popleft()
+        finally:
+            del self._queues[key]
+            if queue:
+                # остаются только при отмене задачи (остановка бота)
+                logger.warning("Не обработано обновлений пользователя %s: %s", key, len(queue))
+                for pending in queue:
+                    if asyncio.iscoroutine(pending):
+                        pending.close()
+
+    def waiting(self) -> int:
+        """Число обновлений, ждущих завершения предыдущих от того же пользователя."""
+        return sum(len(queue) for queue in self._queues.values())
+
+    async def initialize(self) -> None:
+        pass
+
+    async def shutdown(self) -> None:
+        pass
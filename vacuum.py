@@ -0,0 +1,58 @@
+"""Одноразовый перевод базы SQLite в режим ``auto_vacuum=INCREMENTAL``.
+
+Новые базы создаются сразу в этом режиме, и плановая архивация бота
+возвращает место в файле через incremental vacuum. Базе, созданной
+раньше, нужен один полный VACUUM: он переписывает весь файл и держит
+запись до конца, поэтому запускайте скрипт при остановленном боте.
+
+Пример::
+
+    python vacuum.py --database data/applications.db
+"""
+
+import argparse
+import logging
+import sys
+from pathlib import Path
+from typing import List, Optional
+
+from config import get_settings
+from db import ApplicationRepository
+
+logger = logging.getLogger(__name__)
+
+
+def parse_args(argv: Optional[List[str]] = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(
+        description="Перевод базы SQLite в режим auto_vacuum=INCREMENTAL"
+    )
+    parser.add_argument(
+        "--database",
+        type=Path,
+        default=None,
+        help="файл базы (по умолчанию DATABASE_PATH)",
+    )
+    return parser.parse_args(argv)
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    logging.basicConfig(
+        format="%(asctime)s %(name)s %(levelname)s %(message)s",
+        level=logging.INFO,
+    )
+    args = parse_args(argv)
+    path = args.database or get_settings().database_path
+    if not path.exists():
+        logger.error("База %s не найдена", path)
+        return 2
+    repo = ApplicationRepository(path)
+    try:
+        converted = repo.enable_incremental_vacuum()
+    finally:
+        repo.close()
+    print("База переведена в режим INCREMENTAL" if converted else "База уже в режиме INCREMENTAL")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
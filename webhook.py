@@ -0,0 +1,104 @@
+import asyncio
+import hmac
+import logging
+import signal
+from typing import List, Optional
+
+from aiohttp import web
+from telegram import Update
+from telegram.ext import Application
+
+from config import Settings
+
+logger = logging.getLogger(__name__)
+
+SECRET_HEADER = "X-Telegram-Bot-Api-Secret-Token"
+HEALTH_PATH = "/healthz"
+
+APPLICATION_KEY = web.AppKey("application", Application)
+
+
+def build_webhook_app(
+    application: Application, *, path: str, secret_token: Optional[str]
+) -> web.Application:
+    """Собирает aiohttp-приложение, принимающее обновления Telegram.
+
+    Запросы без правильного заголовка ``X-Telegram-Bot-Api-Secret-Token``
+    отклоняются до разбора тела. Принятые обновления кладутся в
+    ``application.update_queue`` — дальше их обрабатывает PTB как при polling.
+    """
+
+    async def handle_update(request: web.Request) -> web.Response:
+        if secret_token and not hmac.compare_digest(
+            request.headers.get(SECRET_HEADER, ""), secret_token
+        ):
+            return web.Response(status=403)
+        try:
+            data = await request.json()
+            update = Update.de_json(data, application.bot)
+        except Exception:
+            logger.warning("Не удалось разобрать обновление из webhook")
+            return web.Response(status=400)
+        await application.update_queue.put(update)
+        return web.Response()
+
+    async def health(request: web.Request) -> web.Response:
+        return web.json_response(
+            {
+                "status": "ok" if application.running else "starting",
+                "update_queue": application.update_queue.qsize(),
+            },
+            status=200 if application.running else 503,
+        )
+
+    app = web.Application()
+    app[APPLICATION_KEY] = application
+    app.router.add_post(path, handle_update)
+    app.router.add_get(HEALTH_PATH, health)
+    return app
+
+
+async def run_webhook(
+    application: Application, config: Settings, allowed_updates: List[str]
+) -> None:
+    """Запускает бота в режиме webhook на встроенном aiohttp-сервере до SIGINT/SIGTERM."""
+    webhook_app = build_webhook_app(
+        application, path=config.webhook_path, secret_token=config.webhook_secret
+    )
+    runner = web.AppRunner(webhook_app)
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        try:
+            loop.add_signal_handler(sig, stop.set)
+        except (NotImplementedError, RuntimeError):  # pragma: no cover - Windows
+            pass
+
+    await application.initialize()
+    try:
+        if application.post_init:
+            await application.post_init(application)
+        await application.start()
+        await runner.setup()
+        await web.TCPSite(runner, config.webhook_listen, config.webhook_port).start()
+        await application.bot.set_webhook(
+            url=config.webhook_url.rstrip("/") + config.webhook_path,
+            secret_token=config.webhook_secret,
+            allowed_updates=allowed_updates,
+        )
+        logger.info(
+            "Webhook слушает %s:%s%s", config.webhook_listen, config.webhook_port, config.webhook_path
+        )
+        await stop.wait()
+    finally:
+        # post_shutdown закрывает хранилище — он выполняется, даже если остановка упала
+        try:
+            await runner.cleanup()
+            if application.running:
+                await application.stop()
+                if application.post_stop:
+                    await application.post_stop(application)
+            await application.shutdown()
+        finally:
+            if application.post_shutdown:
+                await application.post_shutdown(application)
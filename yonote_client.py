@@ -1,29 +1,93 @@
-import requests
-import json
+import asyncio
 import logging
-from typing import Optional
+import random
+import time
+from email.utils import parsedate_to_datetime
+from typing import Any, Callable, Dict, Optional, Sequence
 
-from config import settings
+import httpx
+
+from config import Settings, get_settings
+from metrics import observe_yonote
 
 logger = logging.getLogger(__name__)
 
-YONOTE_BASE_URL = settings.yonote_base_url
+RETRYABLE_STATUSES = {429, 500, 502, 503, 504}
 
-def create_document(full_name: str, age: str, job: str, experience: str, portfolio: str, goals: str, username: str, title: str = "Заявка") -> Optional[dict]:
-    """
-    Создаёт новый документ в коллекции с данными заявки.
-
-    :param full_name: Имя пользователя
-    :param age: Возраст
-    :param job: Должность
-    :param experience: Стаж
-    :param portfolio: Портфолио
-    :param goals: Цели
-    :param username: Telegram username
-    :param title: Заголовок документа
-    :return: Словарь с данными документа или None при ошибке
+
+class YonoteError(Exception):
+    """Документ не удалось создать."""
+
+
+class CircuitOpenError(YonoteError):
+    """Yonote недавно был недоступен, запрос не отправлялся."""
+
+    def __init__(self, retry_after: float) -> None:
+        super().__init__(f"Yonote недоступен, повторите через {retry_after:.0f} с")
+        self.retry_after = retry_after
+
+
+class CircuitBreaker:
+    """Размыкатель цепи: после ``failure_threshold`` неудач подряд запросы
+    отклоняются сразу в течение ``reset_timeout`` секунд, затем пропускается
+    одна пробная попытка.
     """
-    text = f"""# 🎉 Заявка на вступление в проект
+
+    def __init__(
+        self,
+        failure_threshold: int = 5,
+        reset_timeout: float = 30.0,
+        clock: Callable[[], float] = time.monotonic,
+    ) -> None:
+        self.failure_threshold = max(1, failure_threshold)
+        self.reset_timeout = reset_timeout
+        self._clock = clock
+        self._failures = 0
+        self._opened_at: Optional[float] = None
+        self._probing = False
+
+    @property
+    def state(self) -> str:
+        if self._opened_at is None:
+            return "closed"
+        if self._clock() - self._opened_at >= self.reset_timeout:
+            return "half_open"
+        return "open"
+
+    def remaining(self) -> float:
+        if self._opened_at is None:
+            return 0.0
+        return max(0.0, self.reset_timeout - (self._clock() - self._opened_at))
+
+    def allow(self) -> bool:
+        state = self.state
+        if state == "closed":
+            return True
+        if state == "half_open" and not self._probing:
+            self._probing = True
+            return True
+        return False
+
+    def record_success(self) -> None:
+        self._failures = 0
+        self._opened_at = None
+        self._probing = False
+
+    def record_failure(self) -> None:
+        self._failures += 1
+        if self._probing or self._failures >= self.failure_threshold:
+            self._opened_at = self._clock()
+        self._probing = False
+
+    def release(self) -> None:
+        """Освобождает пробный запрос, прерванный до ответа (отмена задачи), не считая неудачей."""
+        self._probing = False
+
+
+def build_document_text(
+    full_name: str, age: str, job: str, experience: str, portfolio: str, goals: str, username: str
+) -> str:
+    return f"""# 🎉 Заявка на вступление в проект
 
 ## 👤 Личная информация
 👨‍💻 **Имя:** {full_name}
@@ -42,28 +106,270 @@ def create_document(full_name: str, age: str, job: str, experience: str, portfol
 
 🎯 **Цели:** {goals}
 """
-    if not settings.yonote_api_key:
-        logger.error("Yonote API key не настроен")
-        print("Yonote API key не настроен")
+
+
+def build_digest_text(rows: Sequence[Any]) -> str:
+    """Текст сводки: по короткому разделу на каждую заявку."""
+    parts = [f"# 📋 Сводка заявок\n\nЗаявок в сводке: {len(rows)}\n"]
+    for row in rows:
+        username = f"@{row['username']}" if row["username"] else "—"
+        parts.append(
+            f"""## #{row['id']} {row['full_name'] or '—'} ({username})
+
+🕒 **Подана:** {row['created_at']}
+
+🎂 **Возраст:** {row['age'] or '—'} · 🎤 **Должность:** {row['job'] or '—'} · ⏱️ **Стаж:** {row['experience'] or '—'}
+
+📁 **Портфолио:** {row['portfolio'] or '—'}
+
+🎯 **Цели:** {row['goals'] or '—'}
+"""
+        )
+    return "\n".join(parts)
+
+
+def _document_data(response: httpx.Response) -> Optional[Dict[str, Any]]:
+    """Данные документа из ответа ``{"ok": true, "data": {"id", "url"}}``; None — ответ не такой."""
+    try:
+        body = response.json()
+    except ValueError:
+        return None
+    if not isinstance(body, dict) or not body.get("ok"):
         return None
+    data = body.get("data")
+    if not isinstance(data, dict) or "id" not in data or "url" not in data:
+        return None
+    return data
+
+
+def _parse_retry_after(value: Optional[str]) -> Optional[float]:
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+
+class YonoteClient:
+    """Долгоживущий асинхронный клиент Yonote API.
+
+    Держит пул keep-alive соединений, ограничивает время подключения и
+    чтения, повторяет запросы при 429/5xx и сетевых ошибках (с учётом
+    ``Retry-After``) и не шлёт запросы, пока разомкнут :class:`CircuitBreaker`.
+    """
+
+    def __init__(
+        self,
+        base_url: Optional[str],
+        api_key: Optional[str],
+        collection_id: Optional[str],
+        *,
+        connect_timeout: float = 5.0,
+        read_timeout: float = 15.0,
+        max_retries: int = 3,
+        backoff_base: float = 0.5,
+        backoff_max: float = 30.0,
+        max_connections: int = 10,
+        breaker: Optional[CircuitBreaker] = None,
+        transport: Optional[httpx.AsyncBaseTransport] = None,
+    ) -> None:
+        self.base_url = (base_url or "").rstrip("/")
+        self.api_key = api_key
+        self.collection_id = collection_id
+        self.max_retries = max(0, max_retries)
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.breaker = breaker or CircuitBreaker()
+        self._timeout = httpx.Timeout(read_timeout, connect=connect_timeout)
+        self._limits = httpx.Limits(
+            max_connections=max_connections, max_keepalive_connections=max_connections
+        )
+        self._transport = transport
+        self._client: Optional[httpx.AsyncClient] = None
+
+    @classmethod
+    def from_settings(cls, config: Settings) -> "YonoteClient":
+        return cls(
+            config.yonote_base_url,
+            config.yonote_api_key,
+            config.yonote_collection_id,
+            connect_timeout=config.yonote_connect_timeout,
+            read_timeout=config.yonote_read_timeout,
+            max_retries=config.yonote_max_retries,
+            breaker=CircuitBreaker(
+                config.yonote_breaker_threshold, config.yonote_breaker_reset_timeout
+            ),
+        )
+
+    def _get_client(self) -> httpx.AsyncClient:
+        if self._client is None:
+            self._client = httpx.AsyncClient(
+                timeout=self._timeout, limits=self._limits, transport=self._transport
+            )
+        return self._client
+
+    async def aclose(self) -> None:
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+
+    def _backoff(self, attempt: int, retry_after: Optional[float]) -> float:
+        if retry_after is not None:
+            return min(self.backoff_max, retry_after)
+        return random.uniform(0, min(self.backoff_max, self.backoff_base * (2 ** attempt)))
+
+    async def create_document(
+        self,
+        full_name: str,
+        age: str,
+        job: str,
+        experience: str,
+        portfolio: str,
+        goals: str,
+        username: str,
+        title: str = "Заявка",
+    ) -> Optional[dict]:
+        """
+        Создаёт новый документ в коллекции с данными заявки.
+
+        :return: Словарь с данными документа или None, если API не настроен
+        :raises CircuitOpenError: Yonote недавно был недоступен
+        :raises YonoteError: документ не создан после всех попыток
+        """
+        if not self.api_key:
+            logger.error("Yonote API key не настроен")
+            return None
+        payload = {
+            "title": title,
+            "text": build_document_text(full_name, age, job, experience, portfolio, goals, username),
+            "collectionId": self.collection_id,
+            "token": self.api_key,
+            "publish": True,
+        }
+        return await self._post("documents.create", payload)
+
+    async def create_application_document(self, row: Any) -> Optional[dict]:
+        """Создаёт документ по строке заявки из базы (outbox, resync)."""
+        job = row["job"] or ""
+        return await self.create_document(
+            row["full_name"] or "",
+            row["age"] or "",
+            job,
+            row["experience"] or "",
+            row["portfolio"] or "",
+            row["goals"] or "",
+            row["username"] or "",
+            f"Заявка от {job}а",
+        )
+
+    async def create_digest_document(self, title: str, rows: Sequence[Any]) -> Optional[dict]:
+        """Создаёт один документ-сводку по пачке заявок (режим сводок outbox)."""
+        if not self.api_key:
+            logger.error("Yonote API key не настроен")
+            return None
+        payload = {
+            "title": title,
+            "text": build_digest_text(rows),
+            "collectionId": self.collection_id,
+            "token": self.api_key,
+            "publish": True,
+        }
+        return await self._post("documents.create", payload)
+
+    async def _post(self, method: str, payload: Dict[str, Any]) -> dict:
+        started = time.perf_counter()
+        outcome = "error"
+        try:
+            result = await self._send(method, payload)
+            outcome = "success"
+            return result
+        except CircuitOpenError:
+            outcome = "circuit_open"
+            raise
+        finally:
+            observe_yonote(method, outcome, time.perf_counter() - started)
+
+    async def _send(self, method: str, payload: Dict[str, Any]) -> dict:
+        if not self.breaker.allow():
+            # пока идёт пробный запрос, remaining() == 0 — не даём повторять вхолостую
+            raise CircuitOpenError(max(1.0, self.breaker.remaining()))
+        url = f"{self.base_url}/{method}"
+        error = "нет ответа"
+        settled = False
+        try:
+            for attempt in range(self.max_retries + 1):
+                retry_after = None
+                try:
+                    response = await self._get_client().post(url, json=payload)
+                except httpx.TransportError as exc:
+                    error = f"{type(exc).__name__}: {exc}"
+                else:
+                    logger.debug("Yonote %s: %s", method, response.status_code)
+                    if response.status_code == 200:
+                        doc_data = _document_data(response)
+                        if doc_data is not None:
+                            settled = True
+                            self.breaker.record_success()
+                            logger.info("Документ создан: %s, URL: %s", doc_data["id"], doc_data["url"])
+                            return doc_data
+                    error = f"HTTP {response.status_code}: {response.text[:200]}"
+                    if response.status_code not in RETRYABLE_STATUSES:
+                        # сервис жив, но отверг запрос — повтор не поможет
+                        settled = True
+                        self.breaker.record_success()
+                        raise YonoteError(error)
+                    retry_after = _parse_retry_after(response.headers.get("Retry-After"))
+                if attempt < self.max_retries:
+                    delay = self._backoff(attempt, retry_after)
+                    logger.warning(
+                        "Yonote %s не ответил (%s), повтор через %.1f с", method, error, delay
+                    )
+                    await asyncio.sleep(delay)
+            settled = True
+            self.breaker.record_failure()
+            raise YonoteError(error)
+        except BaseException as exc:
+            # любой другой выход не должен оставить размыкатель в пробном
+            # состоянии навсегда: сбой считается неудачей, отмена — нет
+            if not settled:
+                if isinstance(exc, Exception):
+                    self.breaker.record_failure()
+                else:
+                    self.breaker.release()
+            raise
+
+
+def create_document(
+    full_name: str,
+    age: str,
+    job: str,
+    experience: str,
+    portfolio: str,
+    goals: str,
+    username: str,
+    title: str = "Заявка",
+) -> Optional[dict]:
+    """
+    Синхронно создаёт документ с данными заявки — для скриптов вне event loop.
+
+    :return: Словарь с данными документа или None при ошибке
+    """
+
+    async def _create() -> Optional[dict]:
+        client = YonoteClient.from_settings(get_settings())
+        try:
+            return await client.create_document(
+                full_name, age, job, experience, portfolio, goals, username, title
+            )
+        except YonoteError as exc:
+            logger.error("Не удалось создать документ: %s", exc)
+            return None
+        finally:
+            await client.aclose()
 
-    url = f"{YONOTE_BASE_URL}/documents.create"
-    payload = {
-        "title": title,
-        "text": text,
-        "collectionId": settings.yonote_collection_id,
-        "token": settings.yonote_api_key,
-        "publish": True
-    }
-
-    logger.info("Создаём новый документ...")
-    response = requests.post(url, json=payload)
-    logger.info(f"Ответ сервера: {response.status_code} - {response.text}")
-
-    if response.status_code == 200 and response.json().get("ok"):
-        doc_data = response.json()["data"]
-        logger.info(f"Документ создан: {doc_data['id']}, URL: {doc_data['url']}")
-        return doc_data
-    else:
-        logger.error("Не удалось создать документ")
-        return None
\ No newline at end of file
+    return asyncio.run(_create())